@@ -0,0 +1,283 @@
+"""
+Module containing a benchmark suite for Propnet graph construction and evaluation.
+
+Benchmarks run on synthetic materials, whose property values are random numbers shaped by each SymbolType's
+dimension, so that results do not depend on external data. Run the suite with
+
+    python -m propnet.benchmarks --output results.json
+
+and compare two runs, e.g. from two commits, with
+
+    python -m propnet.benchmarks --compare before.json results.json
+
+Results are stored as JSON: for each benchmark, the minimum, median, mean and standard deviation of its
+timings in seconds, along with the commit and versions the suite was run with.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from datetime import datetime
+
+import numpy as np
+
+from propnet import ureg
+from propnet.core.graph import Propnet
+from propnet.core.materials import Material
+from propnet.core.symbols import Symbol
+
+# input SymbolTypes of the duplicate Symbols benchmark, feeding the optical and elastic models
+DUPLICATE_SYMBOL_TYPES = ('relative_permeability', 'relative_permittivity', 'bulk_modulus', 'shear_modulus')
+
+
+def synthetic_value(symbol_type, rng):
+    """
+    Generates a random value for a SymbolType, a float or an array of the SymbolType's dimension in its units.
+
+    Args:
+        symbol_type (SymbolType): SymbolType of the value.
+        rng (np.random.RandomState): random number generator.
+    Returns:
+        (id): value, None for SymbolTypes of category 'object', e.g. structures.
+    """
+    if symbol_type.category == 'object':
+        return None
+    if isinstance(symbol_type.dimension, list):
+        return ureg.Quantity(rng.uniform(1, 10, size=symbol_type.dimension), symbol_type.units)
+    return ureg.Quantity(rng.uniform(1, 10), symbol_type.units)
+
+
+def synthetic_material(symbol_types, rng, duplicates=1):
+    """
+    Generates a Material with random values for a set of SymbolTypes.
+
+    Args:
+        symbol_types (list<SymbolType>): SymbolTypes of the material's properties, those of category 'object'
+                                         are left out.
+        rng (np.random.RandomState): random number generator.
+        duplicates (int): number of Symbols of each SymbolType.
+    Returns:
+        (Material)
+    """
+    material = Material()
+    for symbol_type in symbol_types:
+        for _ in range(duplicates):
+            value = synthetic_value(symbol_type, rng)
+            if value is not None:
+                material.add_property(Symbol(symbol_type, value, None))
+    return material
+
+
+def _model_inputs(model, rng):
+    """
+    Returns inputs of a model for plug_in, from its test data if any, otherwise random values of the first
+    set of inputs it accepts.
+    """
+    test_file = os.path.join(os.path.dirname(__file__), 'models', 'test_data',
+                             '{}.json'.format(model.__class__.__name__))
+    if os.path.isfile(test_file):
+        from monty.serialization import loadfn
+        return dict(loadfn(test_file)[0]['inputs'])
+
+    from propnet.symbols import DEFAULT_SYMBOL_TYPES
+    inputs = {}
+    for symbol in model.input_symbols[0]:
+        value = synthetic_value(DEFAULT_SYMBOL_TYPES[model.symbol_mapping[symbol]], rng)
+        inputs[symbol] = value.magnitude if value is not None else None
+    return inputs
+
+
+def measure(func, setup=None, repeat=5, number=1):
+    """
+    Times a function.
+
+    Args:
+        func (function): function to time, called with the result of setup if given.
+        setup (function): optional function called before each timing, not timed.
+        repeat (int): number of timings.
+        number (int): number of calls per timing.
+    Returns:
+        (dict<str,float>): minimum, median, mean and standard deviation in seconds of a call, number of timings.
+    """
+    timings = []
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        for _ in range(number):
+            func(*args)
+        timings.append((time.perf_counter() - start) / number)
+    return {'min': min(timings), 'median': statistics.median(timings), 'mean': statistics.mean(timings),
+            'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0, 'repeat': repeat}
+
+
+def bench_construction(quick=False):
+    """Propnet() with the default models and SymbolTypes."""
+    return {'construction': measure(Propnet, repeat=3 if quick else 10)}
+
+
+def bench_add_material(quick=False):
+    """Propnet.add_material for 1, 100 and 10k synthetic materials."""
+    from propnet.symbols import DEFAULT_SYMBOL_TYPES
+    symbol_types = list(DEFAULT_SYMBOL_TYPES.values())
+    rng = np.random.RandomState(0)
+    results = {}
+    for n in (1, 100) if quick else (1, 100, 10000):
+        materials = [synthetic_material(symbol_types, rng) for _ in range(n)]
+
+        def add(propnet):
+            for material in materials:
+                propnet.add_material(material)
+            for material in materials:
+                propnet.remove_material(material)
+
+        results['add_material[{}]'.format(n)] = measure(add, setup=Propnet, repeat=1 if n > 100 else 3)
+    return results
+
+
+def bench_evaluate_duplicates(quick=False):
+    """Propnet.evaluate on a material with 1, 2 and 4 Symbols of each input SymbolType."""
+    from propnet.symbols import DEFAULT_SYMBOL_TYPES
+    symbol_types = [DEFAULT_SYMBOL_TYPES[name] for name in DUPLICATE_SYMBOL_TYPES]
+    rng = np.random.RandomState(0)
+    results = {}
+    for duplicates in (1, 2) if quick else (1, 2, 4):
+        def setup():
+            propnet = Propnet()
+            material = synthetic_material(symbol_types, rng, duplicates=duplicates)
+            propnet.add_material(material)
+            return propnet
+
+        # the first evaluation compiles the models' equations
+        setup().evaluate()
+        results['evaluate[duplicates={}]'.format(duplicates)] = measure(lambda p: p.evaluate(), setup=setup,
+                                                                       repeat=1 if quick else 3)
+    return results
+
+
+def bench_plug_in(quick=False):
+    """
+    AbstractModel.plug_in for each default model, on its test data or on random inputs. Models failing on these
+    inputs are left out.
+    """
+    from propnet.models import DEFAULT_MODELS
+    rng = np.random.RandomState(0)
+    results = {}
+    for name, model_class in sorted(DEFAULT_MODELS.items()):
+        model = model_class()
+        inputs = _model_inputs(model, rng)
+        try:
+            model.plug_in(dict(inputs))
+        except Exception:
+            # random inputs need not be valid for every model
+            continue
+        results['plug_in[{}]'.format(name)] = measure(lambda: model.plug_in(dict(inputs)),
+                                                     repeat=3 if quick else 5, number=10 if quick else 100)
+    return results
+
+
+def bench_cold_import(quick=False):
+    """import propnet in a new interpreter, with the registry cache warm."""
+    command = [sys.executable, '-c', 'import propnet.models, propnet.symbols']
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return {'cold_import': measure(lambda: subprocess.run(command, check=True, stdout=subprocess.DEVNULL,
+                                                          stderr=subprocess.DEVNULL),
+                                   repeat=3 if quick else 5)}
+
+
+BENCHMARKS = {
+    'construction': bench_construction,
+    'add_material': bench_add_material,
+    'evaluate_duplicates': bench_evaluate_duplicates,
+    'plug_in': bench_plug_in,
+    'cold_import': bench_cold_import,
+}
+
+
+def _commit():
+    """Returns the current git commit, None outside of a git checkout."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=None, quick=False):
+    """
+    Runs benchmarks.
+
+    Args:
+        names (list<str>): names of the benchmarks to run, keys of BENCHMARKS (default: all).
+        quick (bool): run smaller workloads with fewer repeats.
+    Returns:
+        (dict<str,id>): 'meta', information on the run, and 'results', timings of each benchmark.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        results.update(BENCHMARKS[name](quick=quick))
+    meta = {'commit': _commit(), 'date': datetime.utcnow().isoformat(), 'quick': quick,
+            'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform()}
+    return {'meta': meta, 'results': results}
+
+
+def compare(before, after, threshold=0.1):
+    """
+    Compares the results of two runs.
+
+    Args:
+        before (dict<str,id>): results of the earlier run, as returned by run.
+        after (dict<str,id>): results of the later run.
+        threshold (float): relative change in median time above which a benchmark is reported.
+    Returns:
+        (list<tuple>): (name, median before, median after, ratio) for each benchmark whose median time changed
+                       by more than the threshold, slowest regression first.
+    """
+    changes = []
+    for name, result in after['results'].items():
+        if name not in before['results']:
+            continue
+        old, new = before['results'][name]['median'], result['median']
+        ratio = new / old if old else math.inf
+        if abs(ratio - 1) > threshold:
+            changes.append((name, old, new, ratio))
+    return sorted(changes, key=lambda change: -change[3])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs the Propnet benchmark suite.')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--quick', action='store_true', help='run smaller workloads with fewer repeats')
+    parser.add_argument('--bench', action='append', choices=sorted(BENCHMARKS),
+                        help='benchmark to run, may be repeated (default: all)')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two result files instead of running the suite')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change reported by --compare (default: 0.1)')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        for name, old, new, ratio in compare(before, after, args.threshold):
+            print('{:<50} {:>12.6f} s -> {:>12.6f} s  x{:.2f}'.format(name, old, new, ratio))
+        return
+
+    results = run(args.bench, quick=args.quick)
+    for name, result in results['results'].items():
+        print('{:<50} {:>12.6f} s'.format(name, result['median']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
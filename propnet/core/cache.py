@@ -0,0 +1,219 @@
+"""
+Module containing a memoization cache for model evaluations.
+"""
+
+import pickle
+import sqlite3
+import threading
+
+from collections import OrderedDict
+from hashlib import sha256
+
+import numpy as np
+
+from propnet import ureg
+
+
+def _value_key(value):
+    """
+    Returns a canonical byte string for an input value, None for values that cannot be cached.
+    Floats are compared bit for bit, so only identical inputs share a cache entry.
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return b'b' + bytes([bool(value)])
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return b'f' + float(value).hex().encode('ascii')
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'biuf':
+        array = np.ascontiguousarray(value, dtype=np.float64)
+        return b'a' + str(array.shape).encode('ascii') + array.tobytes()
+    return None
+
+
+def evaluation_key(model, symbol_values):
+    """
+    Computes the cache key of a model evaluation.
+
+    Args:
+        model (AbstractModel): model being evaluated.
+        symbol_values (dict<str,id>): inputs of the evaluation, without units (in the units of the model).
+    Returns:
+        (str): key of the evaluation, None if any input cannot be cached (e.g. a structure).
+    """
+    digest = sha256()
+    digest.update(model.fingerprint.encode('ascii'))
+    for symbol in sorted(symbol_values):
+        value_key = _value_key(symbol_values[symbol])
+        if value_key is None:
+            return None
+        digest.update(symbol.encode('utf-8'))
+        digest.update(b'=')
+        digest.update(value_key)
+        digest.update(b';')
+    return digest.hexdigest()
+
+
+def _read_only(stored):
+    """
+    Makes read-only copies of the arrays of a stored result, so that results shared by every cache hit cannot be
+    changed by a caller.
+    """
+    for k, v in stored.items():
+        if isinstance(v, np.ndarray):
+            v = v.copy()
+            v.setflags(write=False)
+            stored[k] = v
+    return stored
+
+
+class EvaluationCache:
+    """
+    Memoizes the results of AbstractModel.evaluate, keyed by model, input symbols and input values.
+
+    Results are kept in an in-memory LRU tier and, if a path is given, in a SQLite database so that they are
+    reused across runs. Keys include the model's fingerprint, a hash of its metadata (connections, equations,
+    symbol mapping, ...) and source code, so results of a model are not reused once its .yaml file or code
+    change. Stale entries are removed from the database the first time a changed model is seen.
+
+    Evaluations with inputs other than numbers or NumPy arrays, e.g. structures, are not cached. Arrays in
+    cached results are read-only, as the same arrays are returned by every hit.
+
+    Enable it for all models with AbstractModel.evaluation_cache = EvaluationCache(...), or for a single model
+    by setting the attribute on the model.
+    """
+
+    def __init__(self, maxsize=10000, path=None):
+        """
+        Args:
+            maxsize (int): maximum number of results in the in-memory tier.
+            path (str): optional path of a SQLite database storing results on disk.
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._checked_models = set()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS evaluations '
+                             '(key TEXT PRIMARY KEY, model TEXT, fingerprint TEXT, result BLOB)')
+            self._db.commit()
+
+    def _check_model(self, model):
+        """
+        Removes stored results of previous versions of a model from the database.
+        """
+        if self._db is None or (model.name, model.fingerprint) in self._checked_models:
+            return
+        self._db.execute('DELETE FROM evaluations WHERE model = ? AND fingerprint != ?',
+                         (model.name, model.fingerprint))
+        self._db.commit()
+        self._checked_models.add((model.name, model.fingerprint))
+
+    @staticmethod
+    def _to_stored(result):
+        """Strips units from a result, pint Quantities are not pickled."""
+        return _read_only({k: v.magnitude if isinstance(v, ureg.Quantity) else v for k, v in result.items()})
+
+    @staticmethod
+    def _from_stored(model, stored):
+        """Adds units back to a result stripped by _to_stored."""
+        from propnet.core.units import to_quantity
+        result = dict(stored)
+        for k, v in stored.items():
+            if k in model.unit_mapping and k not in ('successful', 'message'):
+                result[k] = to_quantity(v, model.unit_mapping[k])
+        return result
+
+    def get(self, model, key):
+        """
+        Looks up the result of an evaluation.
+
+        Args:
+            model (AbstractModel): model being evaluated.
+            key (str): key from evaluation_key.
+        Returns:
+            (dict<str,id>): result of the evaluation as returned by AbstractModel.evaluate, None if not cached.
+        """
+        with self._lock:
+            stored = self._memory.get(key)
+            if stored is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._from_stored(model, stored)
+
+            if self._db is not None:
+                self._check_model(model)
+                row = self._db.execute('SELECT result FROM evaluations WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    stored = _read_only(pickle.loads(row[0]))
+                    self._remember(key, stored)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return self._from_stored(model, stored)
+
+            self.misses += 1
+            return None
+
+    def put(self, model, key, result):
+        """
+        Stores the result of an evaluation.
+
+        Args:
+            model (AbstractModel): model evaluated.
+            key (str): key from evaluation_key.
+            result (dict<str,id>): result of the evaluation as returned by AbstractModel.evaluate.
+        """
+        stored = self._to_stored(result)
+        with self._lock:
+            self._remember(key, stored)
+            if self._db is not None:
+                self._check_model(model)
+                try:
+                    blob = pickle.dumps(stored, protocol=pickle.HIGHEST_PROTOCOL)
+                except Exception:
+                    return
+                self._db.execute('INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?, ?)',
+                                 (key, model.name, model.fingerprint, blob))
+                self._db.commit()
+
+    def _remember(self, key, stored):
+        """Adds a result to the in-memory tier, evicting the least recently used results."""
+        self._memory[key] = stored
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    @property
+    def stats(self):
+        """
+        Returns:
+            (dict<str,id>): number of hits (of which disk_hits from the database), misses, hit rate and number
+                            of results in memory.
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'size': len(self._memory)}
+
+    def clear(self):
+        """
+        Removes all results, from memory and from the database, and resets the statistics.
+        """
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM evaluations')
+                self._db.commit()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -4,16 +4,29 @@ Module containing classes and methods for graph functionality in Propnet code.
 
 from typing import *
 
+import os
+import json
+import pickle
+import importlib
+
+import numpy as np
 import networkx as nx
 
-from propnet import logger
+from propnet import logger, ureg
 from propnet.models import DEFAULT_MODELS
 from propnet.symbols import DEFAULT_SYMBOL_TYPES
 
-from propnet.core.symbols import Symbol
+from propnet.core.symbols import Symbol, SymbolType
 from propnet.core.models import AbstractModel
+from propnet.core.store import SymbolStore, JOINT
+from propnet.core.units import to_magnitude
+from propnet.core.topology import PropnetTopology
 
 from enum import Enum
+from uuid import UUID
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
 from collections import Counter, namedtuple
 
 
@@ -25,6 +38,116 @@ PropnetNode.__repr__ = lambda self: "{}<{}>".format(self.node_type.name,
                                                     self.node_value.__repr__())
 
 
+def gen_input_dicts(symbols, candidate_props, new=None):
+    """
+    Lazily generates all possible combinations of input arguments.
+
+    Args:
+        symbols (list<str>): one set of input symbols required by the model.
+        candidate_props (list<list<Symbol>>): list of potential values that can be plugged into each symbol,
+                                              the outer list corresponds by ordering to the symbols list,
+                                              the inner list gives values that can be plugged in to each symbol.
+        new (set): optional set of new candidate values, if supplied only combinations containing at least
+                   one new value are generated, each exactly once.
+    Yields:
+        (dict<str, Symbol>) dictionaries giving symbol strings mapped to values.
+    """
+    if new is None:
+        for combination in product(*candidate_props):
+            yield dict(zip(symbols, combination))
+        return
+
+    old_props = [[v for v in candidates if v not in new] for candidates in candidate_props]
+    new_props = [[v for v in candidates if v in new] for candidates in candidate_props]
+    # partition by the position of the first new value in the combination
+    for i in range(len(candidate_props)):
+        for combination in product(*(old_props[:i] + [new_props[i]] + candidate_props[i + 1:])):
+            yield dict(zip(symbols, combination))
+
+
+def _symbol_type_to_payload(symbol_type):
+    """
+    Converts a SymbolType to a picklable payload, pint units are sent as tuples so that they are rebuilt using
+    the propnet unit registry on the receiving end.
+    """
+    units = symbol_type.units
+    if isinstance(units, ureg.Quantity):
+        units = units.to_tuple()
+    return dict(name=symbol_type.name, units=units, display_names=symbol_type.display_names,
+                display_symbols=symbol_type.display_symbols, dimension=symbol_type.dimension,
+                comment=symbol_type.comment, category=symbol_type.category)
+
+
+def _symbol_to_payload(symbol, derivation, producer=None):
+    """
+    Converts a Symbol, the names of the models used to derive it and of the model that derived it, to a
+    picklable payload.
+    Quantities are sent as magnitudes in the SymbolType's units.
+    """
+    value = symbol.value
+    is_quantity = isinstance(value, ureg.Quantity)
+    if is_quantity:
+        value = to_magnitude(value, symbol.type.units)
+    return (symbol.type.name, value, is_quantity, symbol.tags, symbol.provenance, derivation, producer)
+
+
+def _symbol_from_payload(payload, symbol_types):
+    """
+    Rebuilds a Symbol from a payload created by _symbol_to_payload.
+
+    Returns:
+        (Symbol, frozenset<str>, str) the Symbol, the names of the models used to derive it and of the model
+                                      that derived it.
+    """
+    name, value, is_quantity, tags, provenance, derivation, producer = payload
+    symbol_type = symbol_types[name]
+    if is_quantity:
+        value = ureg.Quantity(value, symbol_type.units)
+    return Symbol(symbol_type, value, tags, provenance=provenance), derivation, producer
+
+
+# Propnet instance of a worker process used by Propnet.evaluate_many
+_worker_propnet = None
+
+
+def _init_worker(models, symbol_type_payloads):
+    """
+    Initializes a worker process for Propnet.evaluate_many, building its own Propnet.
+    """
+    global _worker_propnet
+    symbol_types = {payload['name']: SymbolType(validate=False, **payload)
+                    for payload in symbol_type_payloads}
+    _worker_propnet = Propnet(models=models, symbol_types=symbol_types)
+
+
+def _evaluate_worker(symbol_payloads):
+    """
+    Evaluates a single material in a worker process for Propnet.evaluate_many.
+
+    Args:
+        symbol_payloads (list<tuple>): payloads of the Symbols of the material, with their derivations and
+                                       producers so that models are not applied to their own outputs.
+    Returns:
+        (list<tuple>) payloads of the Symbols derived for the material.
+    """
+    from propnet.core.materials import Material
+
+    material = Material()
+    _worker_propnet.add_material(material)
+    store = _worker_propnet._store
+    for payload in symbol_payloads:
+        symbol, derivation, producer = _symbol_from_payload(payload, _worker_propnet._symbol_types)
+        store.add(symbol, material._index, derivation=derivation, producer=producer)
+    input_keys = set(material._keys())
+    try:
+        _worker_propnet.evaluate(material=material)
+        derived = [_symbol_to_payload(store.symbol(key), store.derivation(key), store.producer(key))
+                   for key in material._keys() if key not in input_keys]
+    finally:
+        _worker_propnet.remove_material(material)
+    return derived
+
+
 class Propnet:
     """
     Class containing methods for creating and interacting with a Property Network.
@@ -37,14 +160,15 @@ class Propnet:
     given inputs and outputs of the models. At this stage the graph represents a symbolic web of properties without
     any actual input values.
 
-    Materials and Properties / Conditions can be added at runtime using appropriate support methods. These methods
-    dynamically create additional PropnetNodes and edges on the graph of Material and Symbol node_types respectively.
+    Materials and Properties / Conditions can be added at runtime using appropriate support methods. Their Symbols
+    are kept in a columnar SymbolStore rather than on the graph, the Material and Symbol nodes and their edges are
+    only created when the graph is requested.
 
     Given a set of Materials and Properties / Conditions, the symbolic web of properties can be utilized to predict
     values of connected properties on demand.
 
     Attributes:
-        graph (nx.MultiDiGraph<PropnetNode>): data structure supporting the property network.
+        graph (nx.MultiDiGraph<PropnetNode>): read-only view of the property network, including materials.
 
     """
 
@@ -57,21 +181,48 @@ class Propnet:
         models = models or DEFAULT_MODELS
         symbol_types = symbol_types or DEFAULT_SYMBOL_TYPES
 
-        # create the graph
-        self.graph = nx.MultiDiGraph()
+        # create the graph of SymbolTypes and Models, Symbols are kept in the store
+        self._graph = nx.MultiDiGraph()
+        self._store = SymbolStore()
+        # material index in the store -> Material
+        self._materials = {}
+        self._graph_view = None
+        self._graph_version = None
+
+        # bookkeeping for incremental evaluation, see evaluate()
+        self._evaluated_inputs = set()
+        self._settled_symbols = {}
 
         # add our symbols
         self._symbol_types = symbol_types
         self.add_symbol_types(symbol_types)
 
-        # add our models
+        # model classes, kept so that the network can be rebuilt in worker processes
+        self._models = {}
+
+        # add our models, along with edges to their input and output SymbolTypes
         self.add_models(models)
 
-        # add appropriate edges to the graph
+        if materials:
+            self.add_materials(materials)
+
+    def add_models(self, models):
+        """
+        Add user-defined models to the Propnet graph, connecting them to their input and output SymbolTypes.
+
+        Args:
+            models (dict<str,class>): model classes (subclasses of AbstractModel) keyed by name
+
+        Returns:
+
+        """
+        self._models.update(models)
+
         for model in models.values():
 
             model = model(symbol_types=self._symbol_types)  # instantiate model
             model_node = PropnetNode(node_type=PropnetNodeType.Model, node_value=model)
+            self._graph.add_node(model_node)
 
             # integer idx is used to disambiguate edges when
             # multiple paths exist between the same start and end nodes
@@ -85,35 +236,22 @@ class Propnet:
                     inputs = [inputs]
 
                 for input in inputs:
-                    symbol_type = symbol_types[model.symbol_mapping[input]]
+                    symbol_type = self._symbol_types[model.symbol_mapping[input]]
                     input_node = PropnetNode(node_type=PropnetNodeType.SymbolType,
                                              node_value=symbol_type)
-                    self.graph.add_edge(input_node, model_node, route=idx)
+                    self._graph.add_edge(input_node, model_node, route=idx)
 
                 for output in outputs:
-                    symbol_type = symbol_types[model.symbol_mapping[output]]
+                    symbol_type = self._symbol_types[model.symbol_mapping[output]]
                     output_node = PropnetNode(node_type=PropnetNodeType.SymbolType,
                                               node_value=symbol_type)
-                    self.graph.add_edge(model_node, output_node, route=idx)
-
-        if materials:
-            for material in materials:
-                self.add_material(material)
-
-    def add_models(self, models):
-        """
-        Add a user-defined model to the Propnet graph.
-
-        Args:
-            models: An instance of a model class (subclasses AbstractModel)
+                    self._graph.add_edge(model_node, output_node, route=idx)
 
-        Returns:
+        self._update_topology()
+        self._graph_view = None
 
-        """
-        model_nodes = [PropnetNode(node_type=PropnetNodeType.Model,
-                                   node_value=model(symbol_types=self._symbol_types))
-                       for model in models.values()]
-        self.graph.add_nodes_from(model_nodes)
+        # existing Symbols have not been given to the new models yet
+        self._settled_symbols = {}
 
     def add_symbol_types(self, symbol_types):
         """
@@ -129,7 +267,53 @@ class Propnet:
                                          node_value=symbol_type)
                              for symbol_type in symbol_types.values()]
 
-        self.graph.add_nodes_from(symbol_type_nodes)
+        self._graph.add_nodes_from(symbol_type_nodes)
+        self._graph_view = None
+
+        self._update_topology()
+
+    def _update_topology(self):
+        """
+        Rebuilds the topology index from the Model nodes and SymbolTypes on the graph.
+        """
+        models = [node.node_value for node in self._graph.nodes if node.node_type == PropnetNodeType.Model]
+        self._topology = PropnetTopology(models, self._symbol_types)
+
+    @property
+    def topology(self):
+        """
+        Returns:
+            (PropnetTopology): index of the Models and SymbolTypes of this Propnet and their connections.
+        """
+        return self._topology
+
+    @property
+    def graph(self):
+        """
+        Builds, or returns the cached, graph of the SymbolTypes and Models with the Materials and Symbols of this
+        Propnet. The graph is rebuilt when Symbols change and must not be modified.
+
+        Symbols of a single material have an edge from its Material node, Symbols derived from several materials
+        have edges from each of their Material nodes.
+
+        Returns:
+            (nx.MultiDiGraph<PropnetNode>)
+        """
+        if self._graph_view is None or self._graph_version != self._store.version:
+            graph = self._graph.copy()
+            for material in self._materials.values():
+                graph.add_node(material.root_node)
+            for key in self._store.keys():
+                symbol = self._store.symbol(key)
+                symbol_node = PropnetNode(node_type=PropnetNodeType.Symbol, node_value=symbol)
+                graph.add_edge(symbol_node, PropnetNode(node_type=PropnetNodeType.SymbolType,
+                                                        node_value=symbol.type))
+                for index in self._store.sources(key):
+                    if index in self._materials:
+                        graph.add_edge(self._materials[index].root_node, symbol_node)
+            self._graph_view = nx.freeze(graph)
+            self._graph_version = self._store.version
+        return self._graph_view
 
     def nodes_by_type(self, node_type):
         """
@@ -143,310 +327,585 @@ class Propnet:
         if node_type not in _ALLOWED_NODE_TYPES:
             raise ValueError("Unsupported node type, choose from: {}"
                              .format(_ALLOWED_NODE_TYPES))
-        return filter(lambda n: n.node_type.name == node_type, self.graph.nodes)
+        graph = self._graph if node_type in ('SymbolType', 'Model') else self.graph
+        return filter(lambda n: n.node_type.name == node_type, graph.nodes)
 
     def add_material(self, material):
         """
-        Add a material and any of its associated properties to the Propnet graph.
-        Mutates the graph instance variable.
+        Add a material and any of its associated properties to the Propnet.
+        The properties are moved to the store of this Propnet, further properties added to the material
+        are stored there as well. Takes time proportional to the number of properties of the material.
 
         Args:
             material (Material) Material whose information will be added to the graph.
         Returns:
             void
         """
-        material.parent = self
-        self.graph = nx.compose(material.graph, self.graph)
+        self.add_materials([material])
 
-    def remove_material(self, material):
+    def add_materials(self, materials):
         """
-        Removes a material and any of its associated properties from the Propnet graph.
-        Mutates the graph instance variable.
+        Add many materials and their associated properties to the Propnet, see add_material.
+        The properties of all materials are copied into the store at once, one SymbolType at a time.
+        Materials already on this Propnet are skipped, materials on another Propnet must be removed from it first.
 
         Args:
-            material (Material) Material whose information will be removed from the graph.
+            materials (iterable<Material>) Materials whose information will be added to the graph.
         Returns:
             void
         """
-        symbol_nodes = self.graph.neighbors(material.root_node)
-        self.graph.remove_node(material.root_node)
-        for symbol_node in symbol_nodes:
-            if any([x.node_type == 'Material' for x in self.graph.neighbors(symbol_node)]):
+        new_materials = {}
+        for material in materials:
+            if material.parent is self:
                 continue
-            self.graph.remove_node(symbol_node)
+            if material.parent is not None:
+                raise ValueError('Material {} is already on another Propnet.'.format(material.uuid))
+            new_materials.setdefault(id(material), material)
+        materials = list(new_materials.values())
+        indices = [self._store.add_material() for _ in materials]
+        self._store.copy_materials([(material._store, material._index, index)
+                                    for material, index in zip(materials, indices)])
+        for material, index in zip(materials, indices):
+            material._bind(self._store, index)
+            material.parent = self
+            self._materials[index] = material
 
-    def evaluate(self, material=None, property_type=None):
+    def remove_material(self, material):
+        """
+        Removes a material and any of its associated properties from the Propnet.
+        The material keeps its properties in a store of its own.
+
+        Args:
+            material (Material) Material whose information will be removed from the graph.
+        Returns:
+            void
         """
-        Expands the graph, producing the output of models that have the appropriate inputs supplied.
-        Mutates the graph instance variable.
+        index = material._index
+        if self._materials.get(index) is not material:
+            raise ValueError('Specified material not found.')
+        store = SymbolStore()
+        material_index = store.add_material()
+        self._store.copy_material(index, store, material_index)
+
+        removed = set(self._store.remove_material(index))
+        del self._materials[index]
+        # Symbols derived from several materials are kept while any of those materials remains
+        for key in self._store.keys(material=JOINT):
+            if not any(source in self._materials for source in self._store.sources(key)):
+                self._store.remove(key)
+                removed.add(key)
+        material._bind(store, material_index)
+        material.parent = None
+
+        if not self._materials:
+            # nothing left, release the memory held by removed Symbols
+            self._store.clear()
+            self._evaluated_inputs = set()
+            self._settled_symbols = {}
+            return
+
+        # forget incremental evaluation bookkeeping for the removed Symbols
+        self._evaluated_inputs = {key for key in self._evaluated_inputs
+                                  if not any(k in removed for k in key[2:])}
+        self._settled_symbols = {scope: settled - removed
+                                 for scope, settled in self._settled_symbols.items()
+                                 if scope[0] != material.uuid}
+
+    def evaluate(self, material=None, property_type=None, max_combinations=None, incremental=False,
+                 observer=None, by_material=False):
+        """
+        Expands the network, producing the output of models that have the appropriate inputs supplied.
+        Mutates the store of Symbols.
 
         Optional arguments limit the scope of which models or properties are tested.
             material parameter: produces output from models only if the input properties come from the specified material.
-                                mutated graph will modify the Material's graph instance as well as this graph instance.
-                                mutated graph will include edges from Material to Symbol to SymbolType.
+                                derived Symbols are added to the Material as well as this Propnet.
             property_type parameter: produces output from models only if the input properties are in the list.
 
-        If no material parameter is specified, the generated SymbolNodes will be added with edges to and from
-        corresponding SymbolTypeNodes specifically. No connections will be made to existing Material nodes because
-        a Symbol might be derived from a combination of materials in this case. Likewise existing Material nodes' graph
-        instances will not be mutated in this case.
+        If no material parameter is specified, Symbols derived from the properties of a single material are added to
+        that material. Symbols derived from a combination of materials are not added to any Material, they are only
+        connected to each of those materials on the graph of this Propnet. With by_material, only models declaring
+        themselves multi-material (see AbstractModel.multi_material) combine properties of different materials, so
+        that the work done grows linearly rather than combinatorially with the number of materials.
 
         Args:
             material (Material): optional limit on which material's properties will be expanded (default: all materials)
             property_type (list<SymbolType>): optional limit on which Symbols will be considered as input.
+            max_combinations (int): optional limit on the number of input combinations tried for each model,
+                                    guards against combinatorial explosion when a material has many values of
+                                    the same SymbolType.
+            incremental (bool): if True, only Symbols added since the last evaluation of the same material and
+                                property_type, and Symbols derived from them, are plugged into models. Input
+                                combinations already plugged into a model by a previous evaluation are skipped.
+            observer (EvaluationObserver): optional observer told about each round and model, e.g. an
+                                           EvaluationSummary, see propnet.core.profiling.
+            by_material (bool): if True, models that are not multi-material are only given input combinations
+                                whose Symbols all belong to, or were all derived from, the same materials.
         Returns:
             void
         """
+        self._evaluate(material=material, property_type=property_type, max_combinations=max_combinations,
+                       incremental=incremental, observer=observer, by_material=by_material)
+
+    def _evaluate(self, material=None, property_type=None, max_combinations=None, incremental=False,
+                  observer=None, by_material=False, routes=None):
+        """
+        Implements evaluate and derive, see evaluate for the arguments.
+
+        Args:
+            routes (dict<str,set<int>>): optional limit on the connections evaluated, model name -> routes of the
+                                         model's connections. Symbols of a limited evaluation are not marked as
+                                         evaluated for incremental evaluations.
+        """
+        if observer is not None:
+            observer.on_evaluate_start(self, material, property_type)
+            evaluate_start = perf_counter()
 
         ##
-        # Get existing Symbol nodes, 'active' SymbolType nodes, and 'candidate' Models.
-        # Filter by provided material and property_type arguments.
+        # Get keys of existing Symbols in the store, filtered by provided material and property_type arguments.
         ##
 
+        store = self._store
         if not material:
-            # All symbol_nodes are candidates for evaluation.
-            symbol_nodes = list(self.nodes_by_type('Symbol'))
+            # All Symbols are candidates for evaluation.
+            symbol_keys = store.keys()
         else:
-            # Only symbol_nodes connected to the given Material object are candidates for evaluation.
-            material_nodes = self.nodes_by_type('Material')
-            material_node = None
-            for node in material_nodes:
-                if node.node_value == material:
-                    if material_node:
-                        raise ValueError('Multiple identical materials found.')
-                    material_node = node
-            if not material_node:
+            # Only Symbols of the given Material object are candidates for evaluation.
+            if self._materials.get(material._index) is not material:
                 raise ValueError('Specified material not found.')
-            symbol_nodes = []
-            for node in self.graph.neighbors(material_node):
-                if node.node_type == PropnetNodeType['Symbol'] and node not in symbol_nodes:
-                    symbol_nodes.append(node)
+            symbol_keys = store.keys(material=material._index)
 
-        if property_type:
+        property_names = {t.name for t in property_type} if property_type else None
+        if property_names:
             # Only SymbolType objects in the property_type list are candidates for evaluation.
-            c = 0
-            while c < len(symbol_nodes):
-                if symbol_nodes[c].node_value.type not in property_type:
-                    symbol_nodes.remove(symbol_nodes[c])
-                else:
-                    c += 1
-
-        # Get set of SymbolTypes that have values provided.
-        active_symbol_type_nodes = set()
-        for node in symbol_nodes:
-            for neighbor in self.graph.neighbors(node):
-                if neighbor.node_type != PropnetNodeType.SymbolType:
-                    continue
-                active_symbol_type_nodes.add(neighbor)
-
-        # Get set of Models that have values provided to inputs.
-        candidate_models = set()
-        for node in active_symbol_type_nodes:
-            for neighbor in self.graph.neighbors(node):
-                if neighbor.node_type != PropnetNodeType.Model:
-                    continue
-                candidate_models.add(neighbor.node_value)
+            symbol_keys = [key for key in symbol_keys if key[0] in property_names]
 
         ##
         # Define helper data structures and methods.
         ##
 
-        # Create fast-lookup data structure (SymbolType -> Symbol):
+        # Create fast-lookup data structure (SymbolType name -> Symbol keys):
         lookup_dict = {}
-        for node in symbol_nodes:
-            if node.node_value.type not in lookup_dict:
-                lookup_dict[node.node_value.type] = [node.node_value]
-            else:
-                lookup_dict[node.node_value.type] += [node.node_value]
+        for key in symbol_keys:
+            lookup_dict.setdefault(key[0], []).append(key)
+
+        # Evaluating by material, the same per group of Symbols sharing their sources, i.e. belonging to the same
+        # material or derived jointly from the same materials (sources -> SymbolType name -> Symbol keys).
+        # A single material's Symbols are a single group anyway.
+        partitioned = by_material and not material
+        partitions = {}
+        if partitioned:
+            for key in symbol_keys:
+                partitions.setdefault(store.sources(key), {}).setdefault(key[0], []).append(key)
+
+        # Symbol objects are only created for Symbols that are plugged into models
+        symbol_cache = {}
+
+        def get_symbol(key):
+            """
+            Given the key of a Symbol in the store, returns the Symbol.
+            """
+            if key not in symbol_cache:
+                symbol_cache[key] = store.symbol(key)
+            return symbol_cache[key]
+
+        # Fast-lookup data structures for SymbolTypes and Models
+        topology = self._topology
+        symbol_types = topology.symbol_types
+
+        ##
+        # Work out which Symbols are new. In incremental mode only Symbols added since the last evaluation
+        # of the same scope are new, otherwise all Symbols are. Models are only given input combinations that
+        # contain at least one new Symbol, and the Symbols they derive are new as well (semi-naive evaluation).
+        #
+        # Models are evaluated in the order of the topology's schedule, after the models producing their inputs,
+        # so that each model only has to be visited once. Models depending on each other's outputs are visited in
+        # rounds until they derive nothing new, in each round only Symbols derived in the previous round are new.
+        # A model is never applied to its own outputs, and Symbols equal to stored Symbols are not added again, so
+        # rounds end once the models only reproduce known values.
+        ##
+
+        scope = (material.uuid if material else None,
+                 frozenset(property_names) if property_names else None)
+        settled_symbols = self._settled_symbols.setdefault(scope, set())
+        if incremental:
+            # Keys of input combinations already plugged into a model, combinations are only tried once.
+            evaluated_inputs = self._evaluated_inputs
+            new_keys = [key for key in symbol_keys if key not in settled_symbols]
+        else:
+            evaluated_inputs = set()
+            new_keys = symbol_keys
 
-        # Create fast-lookup data structure (Symbol -> MaterialNode)
-        source_dict = {}
+        combination_counts = Counter()
+        capped_models = set()
 
-        # Create fast-lookup data structure (str (SymbolType name) -> SymbolType)
-        symbol_type_nodes = self.nodes_by_type('SymbolType')
-        symbol_types = {x.node_value.name: x.node_value for x in symbol_type_nodes}
+        # Results of per-symbol constraints, (model name, symbol) -> Symbol key -> bool, each Symbol is only
+        # checked once.
+        constraint_checks = {}
+        filtered_counts = Counter()
 
-        def get_source_nodes(graph, node):
+        def check_candidates(model, symbol, keys, check, mask):
             """
-            Given a Symbol node on the graph, returns a list of connected material nodes.
-            This list symbolizes the set of materials for which this Symbol is a property.
-            Args:
-                graph (networkx.MultiDiGraph): graph on which the node is stored.
-                node (PropnetNode): node on the graph whose connected material nodes are to be found.
+            Filters candidate Symbols for one of a model's symbols by the model's per-symbol constraint, checking
+            the values of all new candidates at once if there is a vectorized mask.
+
             Returns:
-                (list<PropnetNode>): list of material type nodes that are connected to this node.
+                (list) keys of the candidates meeting the constraint.
             """
-            to_return = []
-            for n in graph.in_edges(node):
-                if n[0].node_type == PropnetNodeType['Material']:
-                    to_return.append(n[0])
-            return to_return
-
-        for node in symbol_nodes:
-            source_dict[node.node_value] = get_source_nodes(self.graph, node)
+            checked = constraint_checks.setdefault((model.name, symbol), {})
+            unchecked = [key for key in keys if key not in checked]
+            if unchecked:
+                if mask is not None:
+                    units = model.unit_mapping[symbol]
+                    magnitudes = store.magnitudes(unchecked, units)
+                    if magnitudes is None:
+                        magnitudes = np.array([to_magnitude(get_symbol(key).value, units) for key in unchecked])
+                    accepted = np.asarray(mask(magnitudes), dtype=bool).tolist()
+                else:
+                    accepted = [bool(check(get_symbol(key))) for key in unchecked]
+                checked.update(zip(unchecked, accepted))
+                filtered_counts[model] += accepted.count(False)
+            return [key for key in keys if checked[key]]
 
-        ##
-        # For each candidate model, check if we have active property types to match inputs and conditions.
-        # If so, produce the available output properties using all possible permutations of inputs & add
-        #     new models that can be calculated from previously-derived properties.
-        # If certain outputs have already been generated, do not generate duplicate outputs.
-        ##
+        def evaluate_model(model, model_routes, new_set, round, new_partitions):
+            """
+            Plugs all combinations of candidate Symbols containing at least one new Symbol into some of a model's
+            connections, adding the Symbols it derives to the store.
 
-        # Keeps track of number of Symbol_Types derived from the current loop iteration.
-        # Loop terminates when no new properties are derived from any models.
-
-        original_models = {x for x in candidate_models}
-        evaluated_models = set()
-        next_round_models = candidate_models
-        while True:
-            added_on_loop = False
-            candidate_models = next_round_models
-            next_round_models = set()
-            while len(candidate_models) > 0:
-                model = candidate_models.pop()
-                outputs = []
-                # Cache necessary data from model_node: input symbols, types, and conditions.
-                legend = model.symbol_mapping
-                sym_inputs = model.input_symbols
-                for i in sym_inputs:
-                    for c in model.constraint_symbols:
-                        if c not in i:
-                            i.append(c)
-
-                def get_types(symbols_in, legend, symbol_types):
-                    """Converts symbols used in equations to SymbolType objects"""
-                    to_return = []
-                    for l in symbols_in:
-                        if not isinstance(l, list):
-                            l = [l]
-                        out = []
-                        for i in l:
-                            to_append = symbol_types.get(legend[i])
-                            if not to_append:
-                                raise Exception('Error evaluating graph: Model references SymbolType'
-                                                'objects that do not appear in the graph.')
-                            out.append(to_append)
-                        to_return.append(out)
-                    return to_return
-
-                # list<list<SymbolType>>, representing sets of input properties the model accepts.
-                type_inputs = get_types(sym_inputs, legend, symbol_types)
-
-                # Recursive helper method.
-                # Look through all input sets and match with all combinations from lookup_dict.
-                def gen_input_dicts(symbols, candidate_props, level):
-                    """
-                    Recursively generates all possible combinations of input arguments.
-                    Args:
-                        symbols (list<str>):
-                            one set of input symbols required by the model.
-                        candidate_props (list<list<Symbol>>):
-                            list of potential values that can be plugged into each symbol,
-                            the outer list corresponds by ordering to the symbols list,
-                            the inner list gives values that can be plugged in to each symbol.
-                        level (int):
-                            internal parameter used for recursion, says which symbol is being enumerated, should
-                                     be set to the final index value of symbols.
-                    Returns:
-                        (list<dict<String, Symbol>>) list of dictionaries giving symbol strings mapped to values.
-                    """
-                    current_level = []
-                    candidates = candidate_props[level]
-                    for candidate in candidates:
-                        current_level.append({symbols[level]: candidate})
-                    if level == 0:
-                        return current_level
-                    else:
-                        others = gen_input_dicts(symbols, candidate_props, level-1)
-                        to_return = []
-                        for entry1 in current_level:
-                            for entry2 in others:
-                                merged_dict = {}
-                                for (k, v) in entry1.items():
-                                    merged_dict[k] = v
-                                for (k, v) in entry2.items():
-                                    merged_dict[k] = v
-                                to_return.append(merged_dict)
-                        return to_return
-
-                # Get candidate input Symbols for the given model.
-                # Skip over any input Symbol lists that have already been evaluated.
-                for i in range(0, len(type_inputs)):
-                    candidate_properties = []
-                    for j in range(0, len(type_inputs[i])):
-                        candidate_properties.append(lookup_dict.get(type_inputs[i][j], []))
-                    input_sets = gen_input_dicts(sym_inputs[i], candidate_properties, len(candidate_properties)-1)
-                    for input_set in input_sets:
-                        if not model.check_constraints(input_set):
+            Args:
+                model_routes (iterable<int>): routes (indices) of the connections to evaluate.
+                new_partitions (set<tuple<int>>): sources of the groups of Symbols containing new Symbols, when
+                                                  evaluating by material.
+            Returns:
+                (list) keys of the derived Symbols.
+            """
+            if observer is not None:
+                model_start = perf_counter()
+                model_combinations = combination_counts[model]
+                model_filtered = filtered_counts[model]
+            rejected = 0
+            derived_keys = []
+            outputs = []
+            legend = model.symbol_mapping
+            constraints = model.constraints
+            masks = model.constraint_masks
+            # the default check_constraints only applies the per-symbol constraints, already applied to candidates
+            custom_check = type(model).check_constraints is not AbstractModel.check_constraints
+            if partitioned and not model.multi_material:
+                lookups = [partitions[sources] for sources in new_partitions]
+            else:
+                lookups = [lookup_dict]
+
+            # Get candidate input Symbols for the given model.
+            # Skip over any input Symbol lists that have already been evaluated.
+            for i in model_routes:
+                sym_inputs, type_inputs = topology.connection_inputs[model.name][i]
+                for lookup in lookups:
+                    if model in capped_models:
+                        break
+                    # a model is never applied to Symbols it derived itself, by any of its connections
+                    candidate_properties = [[k for k in lookup.get(symbol_type.name, [])
+                                             if store.producer(k) != model.name]
+                                            for symbol_type in type_inputs]
+                    # Symbols rejected by a per-symbol constraint are never combined with others
+                    for j, symbol in enumerate(sym_inputs):
+                        if symbol in masks or symbol in constraints:
+                            candidate_properties[j] = check_candidates(model, symbol, candidate_properties[j],
+                                                                       constraints.get(symbol), masks.get(symbol))
+                    for input_keys in gen_input_dicts(sym_inputs, candidate_properties, new=new_set):
+                        input_key = (model.name, i) + tuple(input_keys.values())
+                        if input_key in evaluated_inputs:
+                            continue
+                        if max_combinations is not None and combination_counts[model] >= max_combinations:
+                            if model not in capped_models:
+                                logger.warning('Reached the limit of {} input combinations for the {} model, '
+                                               'skipping remaining combinations.'
+                                               .format(max_combinations, model.name))
+                                capped_models.add(model)
+                            break
+                        evaluated_inputs.add(input_key)
+                        combination_counts[model] += 1
+                        input_set = {k: get_symbol(v) for k, v in input_keys.items()}
+                        if custom_check and not model.check_constraints(input_set):
+                            rejected += 1
                             continue
                         plug_in_set = {}
                         sourcing = set()
-                        for (k, v) in input_set.items():
-                            plug_in_set[k] = v.value
-                            for elem in source_dict[v]:
-                                sourcing.add(elem)
-                        outputs.append({"output": model.evaluate(plug_in_set), "source": sourcing})
-
-                # For any new outputs generated, create the appropriate SymbolNode and connections to SymbolTypeNodes
-                # For any new outputs generated, create the appropriate connections from Material Nodes
-                # For any new outputs generated, add new models connected to the derived SymbolTypeNodes to the
-                #     candidate_models list & update convenience data structures.
-                # Mutates this graph.
-                symbol_outputs = []
-                output_sources = []
-                if len(outputs) == 0:
-                    next_round_models.add(model)
-                else:
-                    added_on_loop = True
-                    evaluated_models.add(model)
-                for entry in outputs:
-                    for (k, v) in entry['output'].items():
-                        prop_type = symbol_types.get(legend.get(k))
-                        if not prop_type:
-                            continue
-                        symbol_outputs.append(Symbol(prop_type, v, None))
-                        output_sources.append(entry['source'])
-                for i in range(0, len(symbol_outputs)):
-                    # Add outputs to graph.
-                    symbol = symbol_outputs[i]
-                    symbol_node = PropnetNode(node_type=PropnetNodeType['Symbol'], node_value=symbol)
-                    if symbol_node in self.graph:
+                        derivation = {model.name}
+                        for (k, v) in input_keys.items():
+                            plug_in_set[k] = input_set[k].value
+                            sourcing.update(store.sources(v))
+                            derivation.update(store.derivation(v))
+                        outputs.append({"output": model.evaluate(plug_in_set, observer), "source": sourcing,
+                                        "derivation": frozenset(derivation)})
+
+            # For any new outputs generated, add the Symbol to the store, belonging to its material if it was
+            # derived from a single material, or jointly to all materials it was derived from.
+            # For any new outputs generated, update convenience data structures.
+            for entry in outputs:
+                sources = tuple(sorted(entry['source']))
+                owner = sources[0] if len(sources) == 1 else JOINT
+                for (k, v) in entry['output'].items():
+                    prop_type = symbol_types.get(legend.get(k))
+                    if not prop_type:
+                        continue
+                    symbol = Symbol(prop_type, v, None)
+                    if store.find(symbol, owner, sources) is not None:
                         continue
-                    symbol_type_node = PropnetNode(node_type=PropnetNodeType['SymbolType'], node_value=symbol.type)
-                    self.graph.add_edge(symbol_node, symbol_type_node)
-                    for source_node in output_sources[i]:
-                        self.graph.add_edge(source_node, symbol_node)
-
-                    # Strategy A:
-
-                    if len(output_sources[i]) == 1:
-                        store = output_sources[i].__iter__().__next__()
-                        store.node_value.graph.add_edge(store.node_value.root_node, symbol_node)
-
-                    # Strategy B:
-                    """
-                    for store in output_sources[i]:
-                        store.node_value.graph.add_edge(store.node_value.root_node, symbol_node)
-                    """
-
-                    # Update helper data structures etc. for next cycle.
-                    source_dict[symbol] = get_source_nodes(self.graph, symbol_node)
-                    if symbol.type not in lookup_dict:
-                        lookup_dict[symbol.type] = [symbol]
-                    else:
-                        lookup_dict[symbol.type] += [symbol]
-                    if not property_type or symbol.type in property_type:
-                        for neighbor in self.graph.neighbors(symbol_type_node):
-                            if neighbor.node_type == PropnetNodeType['Model']:
-                                if neighbor.node_value not in original_models:
-                                    next_round_models.add(neighbor.node_value)
-            if not added_on_loop:
-                break
+                    key = store.add(symbol, owner, sources=sources if owner == JOINT else None,
+                                    derivation=entry['derivation'], producer=model.name)
+                    symbol_cache[key] = symbol
+                    lookup_dict.setdefault(key[0], []).append(key)
+                    if partitioned:
+                        partitions.setdefault(sources, {}).setdefault(key[0], []).append(key)
+                    derived_keys.append(key)
+
+            if observer is not None:
+                observer.on_model_round(model, round, perf_counter() - model_start,
+                                        combination_counts[model] - model_combinations, rejected,
+                                        len(derived_keys), filtered_counts[model] - model_filtered)
+            return derived_keys
+
+        # Keys of all new Symbols, and names of their SymbolTypes, growing as Symbols are derived.
+        new_set = set(new_keys)
+        new_types = {key[0] for key in new_keys}
+
+        def add_new(keys):
+            keys = [key for key in keys if not property_names or key[0] in property_names]
+            new_set.update(keys)
+            new_types.update(key[0] for key in keys)
+            return keys
+
+        # Only the connections that can fire given the available SymbolTypes are evaluated, following a plan
+        # compiled once per set of SymbolTypes.
+        rounds = 0
+        for step in topology.evaluation_plan(lookup_dict):
+            if step.input_types.isdisjoint(new_types):
+                continue
+            step_new = new_set
+            while step_new:
+                if observer is not None:
+                    observer.on_round_start(rounds, len(step_new))
+                derived_keys = []
+                new_partitions = {store.sources(key) for key in step_new} if partitioned else None
+                for model, model_routes in step.calls:
+                    if routes is not None:
+                        model_routes = [route for route in model_routes if route in routes.get(model.name, ())]
+                    if model_routes:
+                        derived_keys.extend(evaluate_model(model, model_routes, step_new, rounds,
+                                                           new_partitions))
+                rounds += 1
+                derived_keys = add_new(derived_keys)
+                if not step.cyclic:
+                    break
+                step_new = set(derived_keys)
+
+        if routes is None:
+            settled_symbols.update(new_set)
+
+        if not incremental:
+            self._evaluated_inputs.update(evaluated_inputs)
+
+        if observer is not None:
+            observer.on_evaluate_end(perf_counter() - evaluate_start, rounds)
+
+    def evaluate_many(self, materials, workers=None):
+        """
+        Evaluates many materials independently of each other, distributing the materials over a pool of worker
+        processes. Each worker holds its own copy of the SymbolTypes and Models of this Propnet, and is sent the
+        Symbols of one material at a time.
+
+        Equivalent to calling evaluate(material=material) for each material: only Symbols derived from a single
+        material are produced. Derived Symbols are added to this graph and to each Material's graph. Materials
+        not yet on this Propnet are added to it.
+
+        Models must be importable classes, so that they can be sent to the worker processes.
+
+        Args:
+            materials (list<Material>): materials to evaluate.
+            workers (int): number of worker processes (default: number of CPUs), if 1 materials are evaluated
+                           in this process.
+        Returns:
+            void
+        """
+        materials = list(materials)
+        self.add_materials([material for material in materials if material.parent is not self])
+
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(materials) <= 1:
+            for material in materials:
+                self.evaluate(material=material)
+            return
+
+        symbol_type_payloads = [_symbol_type_to_payload(symbol_type)
+                                for symbol_type in self._symbol_types.values()]
+        store = self._store
+        material_payloads = [[_symbol_to_payload(store.symbol(key), store.derivation(key), store.producer(key))
+                              for key in material._keys()]
+                             for material in materials]
+        chunksize = max(1, len(materials) // (4 * workers))
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self._models, symbol_type_payloads)) as executor:
+            results = executor.map(_evaluate_worker, material_payloads, chunksize=chunksize)
+            for material, derived_payloads in zip(materials, results):
+                for payload in derived_payloads:
+                    symbol, derivation, producer = _symbol_from_payload(payload, self._symbol_types)
+                    # Symbols derived before, by evaluate or another evaluate_many, are not added again
+                    if store.find(symbol, material._index) is None:
+                        store.add(symbol, material._index, derivation=derivation, producer=producer)
+                # the material has been evaluated to completion
+                self._settled_symbols.setdefault((material.uuid, None), set()).update(material._keys())
+
+    def save(self, path):
+        """
+        Saves this Propnet, with its Materials, Symbols and their provenance, to a directory, so that it can be
+        reloaded without evaluating it again. See SymbolStore.save for the format, numerical values are stored in
+        .npy files that are memory-mapped on load.
+
+        Models are saved by the import path of their class, so they must be importable classes.
+
+        Args:
+            path (str): directory to save to, created if needed.
+        Returns:
+            void
+        """
+        self._store.save(path)
+        manifest = {
+            'symbol_types': [_symbol_type_to_payload(symbol_type) for symbol_type in self._symbol_types.values()],
+            'models': {name: '{}:{}'.format(model.__module__, model.__qualname__)
+                       for name, model in self._models.items()},
+            'materials': [[index, str(material.uuid)] for index, material in self._materials.items()]
+        }
+        with open(os.path.join(path, 'propnet.json'), 'w') as f:
+            json.dump(manifest, f)
+        with open(os.path.join(path, 'propnet.pickle'), 'wb') as f:
+            pickle.dump({'evaluated_inputs': self._evaluated_inputs, 'settled_symbols': self._settled_symbols},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path, models=None, symbol_types=None, mmap=True):
+        """
+        Loads a Propnet saved with save(). Numerical values are memory-mapped rather than read, so loading takes
+        about as long as creating an empty Propnet.
+
+        Args:
+            path (str): directory the Propnet was saved to.
+            models (dict<str,class>): optional models to use instead of the saved ones.
+            symbol_types (dict<str,SymbolType>): optional SymbolTypes to use instead of the saved ones.
+            mmap (bool): if False, numerical values are read into memory.
+        Returns:
+            (Propnet)
+        """
+        from propnet.core.materials import Material
+
+        with open(os.path.join(path, 'propnet.json')) as f:
+            manifest = json.load(f)
+
+        if symbol_types is None:
+            symbol_types = {payload['name']: SymbolType(validate=False, **payload)
+                            for payload in manifest['symbol_types']}
+        if models is None:
+            models = {}
+            for name, import_path in manifest['models'].items():
+                module_name, _, qualname = import_path.partition(':')
+                try:
+                    model = importlib.import_module(module_name)
+                    for attr in qualname.split('.'):
+                        model = getattr(model, attr)
+                except (ImportError, AttributeError):
+                    raise ValueError('Model {} ({}) cannot be imported, please supply the models.'
+                                     .format(name, import_path))
+                models[name] = model
+
+        propnet = cls(models=models, symbol_types=symbol_types)
+        propnet._store = SymbolStore.load(path, propnet._symbol_types, mmap=mmap)
+        for index, uuid in manifest['materials']:
+            material = Material()
+            material.uuid = UUID(uuid)
+            material._bind(propnet._store, index)
+            material.parent = propnet
+            propnet._materials[index] = material
+
+        with open(os.path.join(path, 'propnet.pickle'), 'rb') as f:
+            bookkeeping = pickle.load(f)
+        propnet._evaluated_inputs = bookkeeping['evaluated_inputs']
+        propnet._settled_symbols = bookkeeping['settled_symbols']
+        return propnet
+
+    @property
+    def materials(self):
+        """
+        Returns:
+            (list<Material>): Materials added to this Propnet.
+        """
+        return list(self._materials.values())
+
+    def derive(self, material, target, max_combinations=None, observer=None):
+        """
+        Derives the Symbols of one SymbolType for a material, evaluating only the models needed to do so.
+
+        The cheapest chain of model connections leading from the SymbolTypes of the material's Symbols to the
+        target is found by searching backwards from the target, see PropnetTopology.plan. Only the connections
+        on that chain are evaluated, so the properties evaluate would derive along the way but which the target
+        does not need are not derived.
+
+        Args:
+            material (Material): material on this Propnet.
+            target (SymbolType or str): SymbolType to derive, or its name.
+            max_combinations (int): optional limit on the number of input combinations tried for each model,
+                                    see evaluate.
+            observer (EvaluationObserver): optional observer, see evaluate.
+        Returns:
+            (list<Symbol>): Symbols of the target SymbolType of the material, including existing ones, empty if
+                            the target cannot be derived from the material's Symbols.
+        """
+        if self._materials.get(material._index) is not material:
+            raise ValueError('Specified material not found.')
+        target = target.name if isinstance(target, SymbolType) else target
+        if target not in self._symbol_types:
+            raise ValueError('Unknown SymbolType {}.'.format(target))
+
+        available = {key[0] for key in self._store.keys(material=material._index)}
+        plan = self._topology.plan(available, target)
+        if plan:
+            routes = {}
+            for model, route in plan:
+                routes.setdefault(model.name, set()).add(route)
+            self._evaluate(material=material, max_combinations=max_combinations, observer=observer,
+                           routes=routes)
+        return [self._store.symbol(key) for key in material._keys(target)]
+
+    def derivable(self, symbol_types):
+        """
+        Finds the SymbolTypes that can be derived from a set of available SymbolTypes, and the models deriving
+        them, without evaluating anything, see PropnetTopology.derivable.
+
+        Args:
+            symbol_types (iterable<SymbolType or str>): available SymbolTypes, or their names, e.g. the
+                                                        available_properties of a Material.
+        Returns:
+            (Derivable): names of the derivable SymbolTypes, other than the available ones, and of the models.
+        """
+        names = {t.name if isinstance(t, SymbolType) else t for t in symbol_types}
+        unknown = names - set(self._symbol_types)
+        if unknown:
+            raise ValueError('Unknown SymbolTypes {}.'.format(', '.join(sorted(unknown))))
+        return self._topology.derivable(names)
 
     def shortest_path(self, property_one: str, property_two: str):
-        """ """
-        # very easy to do with networkx, use in-built algo
-        return NotImplementedError
+        """
+        Finds a shortest path between two SymbolTypes through the models connecting them, see
+        PropnetTopology.shortest_path.
+
+        Args:
+            property_one (str): name of the SymbolType to start from.
+            property_two (str): name of the SymbolType to reach.
+        Returns:
+            (list<str>): names of the SymbolTypes and models on the path, alternating and starting with
+                         property_one, None if there is no path.
+        """
+        return self._topology.shortest_path(property_one, property_two)
 
     def populate_with_test_values(self):
         """ """
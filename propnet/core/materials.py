@@ -5,6 +5,7 @@ Module containing classes and methods for Material functionality in propnet code
 import networkx as nx
 
 from propnet.core.graph import PropnetNodeType, PropnetNode
+from propnet.core.store import SymbolStore
 from propnet.core.symbols import Symbol
 
 from uuid import uuid4
@@ -27,8 +28,12 @@ class Material:
     differentiate between different
     materials at runtime.
 
+    Properties are kept in a SymbolStore: a Material not bound to a Propnet has a store of its own,
+    once added to a Propnet its properties are moved to the Propnet's store. The graph of the Material
+    is only built when requested.
+
     Attributes:
-        graph (nx.MultiDiGraph<PropnetNode>): data structure storing all Symbol nodes of the
+        graph (nx.MultiDiGraph<PropnetNode>): read-only view storing all Symbol nodes of the
         Material.
         uuid (int): unique hash number used as an identifier for this object.
         root_node (PropnetNode): the Material node associated with this material, has a unique
@@ -37,16 +42,59 @@ class Material:
     """
     def __init__(self):
         """
-        Creates a Material instance, instantiating a trivial graph of one node.
+        Creates a Material instance, with an empty store of its own.
         """
         self.uuid = uuid4()
 
-        self.graph = nx.MultiDiGraph()
         self.root_node = PropnetNode(node_type=PropnetNodeType.Material, node_value=self)
-        self.graph.add_node(self.root_node)
+        self._store = SymbolStore()
+        self._index = self._store.add_material()
+        self._graph = None
+        self._graph_version = None
 
         self.parent = None
 
+    def _bind(self, store, index):
+        """
+        Points this Material to its properties in another store.
+
+        Args:
+            store (SymbolStore): store holding the properties of this Material.
+            index (int): index of this Material in the store.
+        """
+        self._store = store
+        self._index = index
+        self._graph = None
+
+    def _keys(self, property_type=None):
+        """
+        Returns:
+            (list<tuple<str,int>>) store keys of the properties of this Material.
+        """
+        return self._store.keys(material=self._index, symbol_type=property_type)
+
+    @property
+    def graph(self):
+        """
+        Builds, or returns the cached, graph of the root material node, its Symbol nodes and their
+        SymbolType nodes. The graph is rebuilt when properties change and must not be modified.
+
+        Returns:
+            (nx.MultiDiGraph<PropnetNode>)
+        """
+        if self._graph is None or self._graph_version != (id(self._store), self._store.version):
+            graph = nx.MultiDiGraph()
+            graph.add_node(self.root_node)
+            for key in self._keys():
+                symbol = self._store.symbol(key)
+                symbol_node = PropnetNode(node_type=PropnetNodeType.Symbol, node_value=symbol)
+                graph.add_edge(self.root_node, symbol_node)
+                graph.add_edge(symbol_node, PropnetNode(node_type=PropnetNodeType.SymbolType,
+                                                        node_value=symbol.type))
+            self._graph = nx.freeze(graph)
+            self._graph_version = (id(self._store), self._store.version)
+        return self._graph
+
     @property
     def subgraph(self):
         """
@@ -59,23 +107,15 @@ class Material:
 
     def add_property(self, property):
         """
-        Adds a property to this material's property graph.
-        If the material has been bound to a Propnet instance, correctly adds the property to that instance.
-        Mutates graph instance variable.
+        Adds a property to this material.
+        If the material has been bound to a Propnet instance, the property is stored in that instance.
 
         Args:
             property (Symbol): property to be bound to the material.
         Returns:
             void
         """
-        property_node = PropnetNode(node_type=PropnetNodeType.Symbol, node_value=property)
-        property_symbol_node = PropnetNode(node_type=PropnetNodeType.SymbolType,
-                                           node_value=property.type)
-        self.graph.add_edge(self.root_node, property_node)
-        self.graph.add_edge(property_node, property_symbol_node)
-        if self.parent:
-            self.parent.graph.add_edge(self.root_node, property_node)
-            self.parent.graph.add_edge(property_node, property_symbol_node)
+        self._store.add(property, self._index)
 
     def remove_property(self, property):
         """
@@ -85,11 +125,9 @@ class Material:
         Returns:
             None
         """
-        for node in self.graph.neighbors(self.root_node):
-            if node.node_value == property:
-                self.graph.remove_node(node)
-                if self.parent:
-                    self.parent.graph.remove_node(node)
+        for key in self._keys(property.type.name):
+            if self._store.symbol(key) == property:
+                self._store.remove(key)
 
     def remove_property_type(self, property_type):
         """
@@ -100,11 +138,8 @@ class Material:
         Returns:
             None
         """
-        for node in self.graph.neighbors(self.root_node):
-            if node.node_value.type.name == property_type:
-                self.graph.remove_node(node)
-                if self.parent:
-                    self.parent.graph.remove_node(node)
+        for key in self._keys(property_type):
+            self._store.remove(key)
 
     def available_properties(self):
         """
@@ -113,11 +148,7 @@ class Material:
         Returns:
             (list<str>) list of all properties bound to this Material.
         """
-        available_propertes = []
-        for node in self.graph.nodes:
-            if node.node_type == PropnetNodeType.Symbol:
-                available_propertes.append(node.node_value.type.name)
-        return available_propertes
+        return [name for name, _ in self._keys()]
 
     def available_property_nodes(self):
         """
@@ -126,11 +157,8 @@ class Material:
         Returns:
             (list<PropnetNode<Symbol>>) list of all Symbol objects bound to this Material.
         """
-        to_return = []
-        for node in self.graph.nodes:
-            if node.node_type == PropnetNodeType['Symbol']:
-                to_return.append(node)
-        return to_return
+        return [PropnetNode(node_type=PropnetNodeType.Symbol, node_value=self._store.symbol(key))
+                for key in self._keys()]
 
     def __repr__(self):
         return str(self.uuid)
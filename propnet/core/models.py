@@ -5,26 +5,31 @@ Module containing classes and methods for Model functionality in Propnet code.
 # typing information, for type hinting only
 from typing import *
 
+import inspect
+import json
 import math
 
+import numpy as np
+
 from abc import ABCMeta, abstractmethod
-from functools import wraps
+from copy import deepcopy
+from functools import wraps, lru_cache
+from glob import glob
 from os.path import dirname, join, isfile
 from hashlib import sha256
+from time import perf_counter
 
 from ruamel.yaml import safe_load
 from monty.serialization import loadfn
 
-import sympy as sp
-from sympy.parsing.sympy_parser import parse_expr
-
 from propnet.symbols import DEFAULT_SYMBOL_TYPES
+from propnet.core.registry import load_registry_cache
+from propnet.core.units import to_magnitude, to_quantity
 from propnet import logger
 from propnet import ureg
 
 # TODO: add pint integration
 # TODO: decide on interface for conditions, assumptions etc.
-# TODO: decide on interface for multiple-material models.
 
 
 def load_metadata(path):
@@ -49,6 +54,71 @@ def load_metadata(path):
     return metadata
 
 
+@lru_cache(maxsize=None)
+def _default_model_metadata():
+    """
+    Loads the metadata of all models in the propnet/models folder, from the registry cache if
+    none of the .yaml files has changed.
+
+    Returns:
+        (dict<str,dict<str,id>>) model name -> metadata.
+    """
+    paths = glob(join(dirname(__file__), '..', 'models', '*.yaml'))
+    return load_registry_cache('models', paths, load_metadata)
+
+
+@lru_cache(maxsize=None)
+def compile_equations(equations, inputs, outputs, symbols=()):
+    """
+    Solves a set of model equations symbolically for the given outputs and converts each solution
+    into a numerical function of the given inputs, using NumPy as the backend.
+
+    This is the expensive, symbolic part of evaluating an equation-based model, so results are
+    cached: each distinct set of equations and connection is only solved once per process.
+
+    Args:
+        equations (tuple<str>): equations defining the model, each implicitly equal to zero.
+        inputs (tuple<str>): symbols supplied as inputs, in the order of the compiled
+            functions' positional arguments.
+        outputs (tuple<str>): symbols to solve for.
+        symbols (tuple<str>): all symbols used by the model, these are always parsed as
+            plain sympy Symbols (e.g. 'E' is not Euler's number).
+    Returns:
+        (dict<str,function>) mapping from output symbol to a function of the input symbols.
+    """
+    # sympy is slow to import and only needed here
+    import sympy as sp
+    from sympy.parsing.sympy_parser import parse_expr
+
+    local_dict = {symbol: sp.Symbol(symbol) for symbol in symbols}
+    input_symbols = [sp.Symbol(symbol) for symbol in inputs]
+    output_symbols = [sp.Symbol(symbol) for symbol in outputs]
+
+    # only equations involving an output are needed, any others
+    # only relate the inputs to each other
+    eqns = [parse_expr(eq, local_dict=local_dict) for eq in equations]
+    eqns = [eqn for eqn in eqns if eqn.free_symbols & set(output_symbols)]
+
+    solutions = sp.solve(eqns, output_symbols, dict=True)
+    if not solutions:
+        raise ValueError('Equations {} could not be solved for {}.'.format(equations, outputs))
+    # taking first solution only
+    solution = solutions[0]
+
+    compiled = {}
+    for output_symbol in output_symbols:
+        if output_symbol not in solution:
+            raise ValueError('Equations {} could not be solved for {}.'.format(equations, output_symbol))
+        expression = solution[output_symbol]
+        missing = expression.free_symbols - set(input_symbols)
+        if missing:
+            raise ValueError('Solution for {} depends on symbols that are not inputs: {}'
+                             .format(output_symbol, missing))
+        compiled[str(output_symbol)] = sp.lambdify(input_symbols, expression, modules='numpy')
+
+    return compiled
+
+
 class AbstractModel(metaclass=ABCMeta):
     """
     Baseclass for all models appearing in Propnet.
@@ -75,6 +145,8 @@ class AbstractModel(metaclass=ABCMeta):
         constraints () -> dict<str,lambda(Symbol)->bool>
             Returns a dictionary mapping symbol to a lambda function that takes in a Symbol object and returns a bool
             indicating whether that Symbol meets all necessary conditions for validity.
+        constraint_masks () -> dict<str,lambda(np.ndarray)->np.ndarray<bool>>
+            Vectorized form of constraints, taking an array of magnitudes in the units of the symbol.
         plug_in (dict<str,id>) -> dict<str,id>
             Given a dictionary specifying a value for a set of input symbols, returns the predicted value of the model
             for those inputs.
@@ -92,8 +164,12 @@ class AbstractModel(metaclass=ABCMeta):
     Attributes:
         _metadata (dict<str,id>): stores the .yaml dictionary contents specified upon instantiation.
         unit_mapping (dict<str,Pint.unit>): mapping from symbols used in the model to their corresponding units.
+        evaluation_cache (EvaluationCache): optional cache of evaluate results, see propnet.core.cache.
+                                            Set on AbstractModel to enable it for all models.
     """
 
+    evaluation_cache = None
+
     def __init__(self, metadata=None, symbol_types=None):
         """
         Constructs a Model object with the provided metadata.
@@ -111,14 +187,21 @@ class AbstractModel(metaclass=ABCMeta):
         if not metadata:
             try:
                 # try loading from local file, see /models/ for examples
-                path = '{}/../models/{}.yaml'.format(dirname(__file__), self.__class__.__name__)
-                metadata = load_metadata(path)
+                default_metadata = _default_model_metadata()
+                if self.__class__.__name__ in default_metadata:
+                    metadata = deepcopy(default_metadata[self.__class__.__name__])
+                else:
+                    path = '{}/../models/{}.yaml'.format(dirname(__file__), self.__class__.__name__)
+                    metadata = load_metadata(path)
             except Exception as e:
                 print(e)
                 metadata = {}
 
         self._metadata = metadata
 
+        # compiled equations for each connection, populated on first use
+        self._compiled_connections = {}
+
         # retrieve units for each symbol
         self.unit_mapping = {}
         for symbol, name in self.symbol_mapping.items():
@@ -130,7 +213,8 @@ class AbstractModel(metaclass=ABCMeta):
                                  'Exception: {}'
                                  .format(name, self.__class__.__name__, e))
 
-    # constraint_symbols, meets_constraints, plug_in, and evaluate methods are optional overrides in extending classes
+    # constraint_symbols, constraints, constraint_masks, check_constraints, plug_in, and evaluate methods are optional
+    # overrides in extending classes
     @property
     def constraint_symbols(self):
         """
@@ -141,19 +225,55 @@ class AbstractModel(metaclass=ABCMeta):
         """
         return []
 
+    @property
+    def constraints(self):
+        """
+        Conditions on individual input or constraint symbols. Unlike check_constraints, which is given a whole
+        combination of inputs, they are applied by Propnet.evaluate to each candidate Symbol before combinations
+        are generated, so rejected Symbols are never combined with others.
+
+        Returns:
+            (dict<str,function>): mapping from symbol to a function taking a Symbol and returning whether it meets
+                                  the model's conditions.
+        """
+        return {}
+
+    @property
+    def constraint_masks(self):
+        """
+        Vectorized form of constraints, applied to whole columns of values at once: by Propnet.evaluate to candidate
+        Symbols, in place of the symbol's constraints entry, and by evaluate_batch to its rows of inputs.
+
+        Returns:
+            (dict<str,function>): mapping from symbol to a function taking a NumPy array of magnitudes, in the units
+                                  of the symbol, and returning a boolean array of the same length, True for values
+                                  meeting the model's conditions.
+        """
+        return {}
+
     def check_constraints(self, constraint_inputs):
         """
-        Returns a dictionary mapping symbol to a lambda function that takes in a Symbol object and returns a bool
-        indicating whether that Symbol meets all necessary conditions for validity.
+        Checks whether a combination of inputs meets the conditions of the model. By default, applies the
+        per-symbol constraints, or constraint_masks, to the given Symbols. Override it for conditions relating
+        several symbols.
 
         Args:
-            constraint_inputs (dict<str, float>): Mapping from string symbol to symbol value
+            constraint_inputs (dict<str,Symbol>): Mapping from string symbol to Symbol
         Returns:
             (bool): bool stating whether the constraints of the model are met.
         """
+        constraints = self.constraints
+        for symbol, check in constraints.items():
+            if symbol in constraint_inputs and not check(constraint_inputs[symbol]):
+                return False
+        for symbol, mask in self.constraint_masks.items():
+            if symbol in constraint_inputs and symbol not in constraints:
+                value = to_magnitude(constraint_inputs[symbol].value, self.unit_mapping[symbol])
+                if not np.asarray(mask(np.asarray([value])), dtype=bool)[0]:
+                    return False
         return True
 
-    def evaluate(self, symbol_values):
+    def evaluate(self, symbol_values, observer=None):
         """
         Given a set of symbol_values, performs error checking to see if the input symbol_values represents a valid input
         set based on the self.connections() method. If so, it returns a dictionary representing the value of plug_in
@@ -161,15 +281,31 @@ class AbstractModel(metaclass=ABCMeta):
 
         Args:
             symbol_values (dict<str,float>): Mapping from string symbol to float value, giving inputs.
+            observer (EvaluationObserver): optional observer told about the evaluation, see propnet.core.profiling.
         Returns:
             (dict<str,float>), mapping from string symbol to float value giving result of applying the model to the
                                given inputs. Additionally contains a "successful" key -> bool pair.
         """
+        if observer is None:
+            return self._evaluate_checked(symbol_values)[0]
+        start = perf_counter()
+        out, cached = self._evaluate_checked(symbol_values)
+        observer.on_model_evaluated(self, perf_counter() - start, out, cached)
+        return out
+
+    def _evaluate_checked(self, symbol_values):
+        """
+        Implements evaluate.
+
+        Returns:
+            (dict<str,float>, bool): result of evaluate and whether it came from the evaluation cache.
+        """
 
         # strip units from input
         for symbol in symbol_values:
             if type(symbol_values[symbol]) == ureg.Quantity:
-                symbol_values[symbol] = float(symbol_values[symbol].to(self.unit_mapping[symbol]).magnitude)
+                magnitude = to_magnitude(symbol_values[symbol], self.unit_mapping[symbol])
+                symbol_values[symbol] = float(magnitude) if np.ndim(magnitude) == 0 else magnitude
 
         available_symbols = set(symbol_values.keys())
 
@@ -181,7 +317,26 @@ class AbstractModel(metaclass=ABCMeta):
                 'successful': False,
                 'message': "The {} model cannot generate any outputs for these inputs: {}".format(
                     self.name, available_symbols)
-            }
+            }, False
+
+        cache = self.evaluation_cache
+        if cache is not None:
+            from propnet.core.cache import evaluation_key
+            cache_key = evaluation_key(self, symbol_values)
+            if cache_key is not None:
+                cached = cache.get(self, cache_key)
+                if cached is not None:
+                    return cached, True
+                out = self._evaluate_uncached(symbol_values)
+                cache.put(self, cache_key, out)
+                return out, False
+
+        return self._evaluate_uncached(symbol_values), False
+
+    def _evaluate_uncached(self, symbol_values):
+        """
+        Applies plug_in to inputs already checked and stripped of units by evaluate.
+        """
         try:
             # evaluate is allowed to fail
             out = self.plug_in(symbol_values)
@@ -196,7 +351,96 @@ class AbstractModel(metaclass=ABCMeta):
         for key in out:
             if key == 'successful':
                 continue
-            out[key] = ureg.Quantity(out[key], self.unit_mapping[key])
+            out[key] = to_quantity(out[key], self.unit_mapping[key])
+
+        return out
+
+    def evaluate_batch(self, symbol_arrays):
+        """
+        Vectorized version of evaluate, applying the model to many sets of inputs at once.
+
+        Each input symbol is given a column of values, e.g. one entry per material. Units are
+        converted once per column rather than once per value. Equation-based models are evaluated
+        on whole columns with a single call; models overriding plug_in are called once per row.
+        Rows rejected by the model's constraint_masks are not plugged in, their outputs are NaN.
+
+        Args:
+            symbol_arrays (dict<str,id>): Mapping from string symbol to a sequence, NumPy array or
+                                          pint Quantity wrapping an array of values. All columns
+                                          must have the same length.
+        Returns:
+            (dict<str,id>), mapping from string symbol to a pint Quantity wrapping an array of
+                            outputs, one entry per row of inputs. Additionally contains a
+                            "successful" key -> bool pair.
+        """
+
+        # strip units from input, once per column
+        columns = {}
+        for symbol, values in symbol_arrays.items():
+            if isinstance(values, ureg.Quantity):
+                values = to_magnitude(values, self.unit_mapping[symbol])
+            columns[symbol] = np.asarray(values)
+
+        lengths = {len(column) for column in columns.values()}
+        if len(lengths) > 1:
+            return {
+                'successful': False,
+                'message': "Input arrays for the {} model have different lengths: {}".format(
+                    self.name, {symbol: len(column) for symbol, column in columns.items()})
+            }
+        n_rows = lengths.pop() if lengths else 0
+
+        available_symbols = set(columns.keys())
+
+        # check we support this combination of inputs
+        available_inputs = [len(set(possible_input_symbols) - available_symbols) == 0
+                            for possible_input_symbols in self.input_symbols]
+        if not any(available_inputs):
+            return {
+                'successful': False,
+                'message': "The {} model cannot generate any outputs for these inputs: {}".format(
+                    self.name, available_symbols)
+            }
+
+        # only plug in rows meeting the constraints
+        valid = np.ones(n_rows, dtype=bool)
+        for symbol, mask in self.constraint_masks.items():
+            if symbol in columns:
+                valid &= np.asarray(mask(columns[symbol]), dtype=bool)
+        n_valid = int(valid.sum())
+        masked = n_valid < n_rows
+        if masked:
+            columns = {symbol: column[valid] for symbol, column in columns.items()}
+        try:
+            # evaluate is allowed to fail
+            if type(self).plug_in is AbstractModel.plug_in:
+                # compiled equations are NumPy functions, so act on whole columns
+                out = self.plug_in(columns)
+                # outputs not depending on the inputs are broadcast to one value per row
+                out = {key: np.broadcast_to(value, (n_valid,) + np.shape(value)[1:]) for key, value in out.items()}
+            else:
+                rows = [self.plug_in({symbol: column[i] for symbol, column in columns.items()})
+                        for i in range(n_valid)]
+                keys = set().union(*rows) if rows else set()
+                out = {key: np.array([row[key] for row in rows]) for key in keys}
+            if masked:
+                for key, value in out.items():
+                    full = np.full((n_rows,) + value.shape[1:], np.nan,
+                                   dtype=np.result_type(value.dtype, np.float64))
+                    full[valid] = value
+                    out[key] = full
+            out['successful'] = True
+        except Exception as e:
+            return {
+                'successful': False,
+                'message': str(e)
+            }
+
+        # add units to output, once per column
+        for key in out:
+            if key == 'successful':
+                continue
+            out[key] = to_quantity(out[key], self.unit_mapping[key])
 
         return out
 
@@ -212,26 +456,54 @@ class AbstractModel(metaclass=ABCMeta):
             (dict<str,float>) mapping from string symbol to float value giving result of applying the model to the
                               given inputs.
         """
-        # Define sympy equations for the model
         if not self.equations:
             raise ValueError('Please implement the _evaluate '
                              'method for the {} model.'.format(self.name))
-        eqns = [parse_expr(eq) for eq in self.equations]
-        eqns = [eqn.subs(symbol_values) for eqn in eqns]
-        # Generate outputs from the sympy equations.
-        possible_outputs = set()
-        for eqn in eqns:
-            possible_outputs = possible_outputs.union(eqn.free_symbols)
+
+        available_symbols = set(symbol_values.keys())
         outputs = {}
-        for possible_output in possible_outputs:
-            solutions = sp.nonlinsolve(eqns, possible_output)
-            # taking first solution only, and only asking for one output symbol
-            # so know length of output tuple for solutions will be 1
-            solution = list(solutions)[0][0]
-            if not isinstance(solution, sp.EmptySet):
-                outputs[str(possible_output)] = sp.N(solution)
+        for idx, connection in enumerate(self.connections):
+            if not set(connection['inputs']) <= available_symbols:
+                continue
+            # do not re-derive symbols that were supplied or already calculated
+            if set(connection['outputs']) <= available_symbols | set(outputs.keys()):
+                continue
+            args = [symbol_values[symbol] for symbol in connection['inputs']]
+            for output, func in self.compiled_connection(idx).items():
+                if output not in available_symbols and output not in outputs:
+                    outputs[output] = func(*args)
+
+        if not outputs:
+            raise ValueError('The {} model cannot generate any outputs for these inputs: {}'
+                             .format(self.name, available_symbols))
+
         return outputs
 
+    def compiled_connection(self, idx):
+        """
+        Returns numerical functions giving the outputs of one of the model's connections, solving
+        the model's equations symbolically the first time the connection is used.
+
+        Args:
+            idx (int): index of the connection in self.connections
+        Returns:
+            (dict<str,function>) mapping from output symbol to a function taking the connection's
+                                 input symbols, in order, as positional arguments.
+        """
+        if idx not in self._compiled_connections:
+            connection = self.connections[idx]
+            try:
+                self._compiled_connections[idx] = compile_equations(
+                    tuple(self.equations), tuple(connection['inputs']),
+                    tuple(connection['outputs']), tuple(self.symbol_mapping.keys()))
+            except Exception as e:
+                # remember failures too, so we don't retry solving on every call
+                self._compiled_connections[idx] = e
+        compiled = self._compiled_connections[idx]
+        if isinstance(compiled, Exception):
+            raise compiled
+        return compiled
+
     # Suite of getter methods returning appropriate model data.
     @property
     def name(self):
@@ -287,6 +559,18 @@ class AbstractModel(metaclass=ABCMeta):
         """
         return self._metadata.get('connections', [])
 
+    @property
+    def multi_material(self):
+        """
+        Whether the model relates properties of different materials, e.g. of the components of a composite or of
+        the two sides of an interface. Only multi-material models are given inputs from different materials when
+        evaluating by material, see Propnet.evaluate.
+
+        Returns:
+            (bool): value of the 'multi_material' metadata key, False by default
+        """
+        return self._metadata.get('multi_material', False)
+
     @property
     def input_symbols(self):
         """
@@ -342,6 +626,25 @@ class AbstractModel(metaclass=ABCMeta):
         """
         return sha256(self.__class__.__name__.encode('utf-8')).hexdigest()[0:4]
 
+    @property
+    def fingerprint(self):
+        """
+        A hash of the model's metadata (connections, equations, symbol mapping, ...) and source code, which changes
+        whenever the model's .yaml or .py file does. Used to invalidate cached evaluations.
+
+        :return (str): hex string
+        """
+        if getattr(self, '_fingerprint', None) is None:
+            digest = sha256()
+            digest.update(self.__class__.__name__.encode('utf-8'))
+            digest.update(json.dumps(self._metadata, sort_keys=True, default=str).encode('utf-8'))
+            try:
+                digest.update(inspect.getsource(self.__class__).encode('utf-8'))
+            except (OSError, TypeError):
+                pass
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
     def __eq__(self, other):
         return self.model_id == getattr(other, "model_id", None)
 
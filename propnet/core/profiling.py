@@ -0,0 +1,169 @@
+"""
+Module containing observers of Propnet evaluations, used to find out where evaluation time goes.
+"""
+
+from collections import OrderedDict
+
+
+class EvaluationObserver:
+    """
+    Base class of observers passed to Propnet.evaluate and AbstractModel.evaluate. Every method does nothing,
+    subclasses override those they are interested in.
+
+    Observers are only called when given, evaluations without an observer are not instrumented at all.
+    """
+
+    def on_evaluate_start(self, propnet, material, property_type):
+        """
+        Called when Propnet.evaluate starts, with its arguments.
+        """
+        pass
+
+    def on_round_start(self, round, new_symbols):
+        """
+        Called at the start of each round of evaluation. A round visits one step of the topology's schedule, a
+        single model or a group of models depending on each other, which is visited in as many rounds as it
+        takes to derive nothing new.
+
+        Args:
+            round (int): index of the round, from 0.
+            new_symbols (int): number of Symbols that are new in this round, each input combination tried in
+                               the round contains at least one of them.
+        """
+        pass
+
+    def on_model_evaluated(self, model, seconds, result, cached):
+        """
+        Called by AbstractModel.evaluate after each evaluation.
+
+        Args:
+            model (AbstractModel): model evaluated.
+            seconds (float): wall time of the evaluation.
+            result (dict<str,id>): result of the evaluation, including the 'successful' key.
+            cached (bool): whether the result came from the model's evaluation_cache.
+        """
+        pass
+
+    def on_model_round(self, model, round, seconds, combinations, rejected, outputs, filtered=0):
+        """
+        Called after a model has been given its input combinations for a round.
+
+        Args:
+            model (AbstractModel): model.
+            round (int): index of the round.
+            seconds (float): wall time spent on the model in this round, including generating input combinations,
+                             checking constraints, evaluating the model and storing its outputs.
+            combinations (int): number of input combinations generated.
+            rejected (int): number of input combinations rejected by the model's check_constraints.
+            outputs (int): number of new Symbols derived, outputs equal to existing Symbols are not counted.
+            filtered (int): number of candidate Symbols rejected by the model's per-symbol constraints before
+                            input combinations were generated, see AbstractModel.constraints.
+        """
+        pass
+
+    def on_evaluate_end(self, seconds, rounds):
+        """
+        Called when Propnet.evaluate ends.
+
+        Args:
+            seconds (float): wall time of the evaluation.
+            rounds (int): number of rounds.
+        """
+        pass
+
+
+class ModelSummary:
+    """
+    Statistics of a model over one or more evaluations, see EvaluationSummary.
+    """
+
+    __slots__ = ['seconds', 'evaluate_seconds', 'filtered', 'combinations', 'rejected', 'evaluations', 'failures',
+                 'cache_hits', 'outputs']
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.evaluate_seconds = 0.0
+        self.filtered = 0
+        self.combinations = 0
+        self.rejected = 0
+        self.evaluations = 0
+        self.failures = 0
+        self.cache_hits = 0
+        self.outputs = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class EvaluationSummary(EvaluationObserver):
+    """
+    Observer collecting per-model statistics over one or more evaluations:
+
+        seconds: wall time spent on the model by Propnet.evaluate.
+        evaluate_seconds: wall time spent in AbstractModel.evaluate, a part of seconds.
+        filtered: number of candidate Symbols rejected by per-symbol constraints, before generating combinations.
+        combinations: number of input combinations generated.
+        rejected: number of input combinations rejected by check_constraints.
+        evaluations: number of calls to AbstractModel.evaluate.
+        failures: number of evaluations that were not successful.
+        cache_hits: number of evaluations served from the model's evaluation_cache.
+        outputs: number of new Symbols derived.
+
+    Along with the number of rounds and the total wall time of the evaluations.
+
+    Example:
+        summary = EvaluationSummary()
+        propnet.evaluate(observer=summary)
+        print(summary)
+    """
+
+    def __init__(self):
+        self.models = OrderedDict()
+        self.rounds = 0
+        self.seconds = 0.0
+
+    def _model(self, model):
+        summary = self.models.get(model.name)
+        if summary is None:
+            summary = self.models[model.name] = ModelSummary()
+        return summary
+
+    def on_model_evaluated(self, model, seconds, result, cached):
+        summary = self._model(model)
+        summary.evaluate_seconds += seconds
+        summary.evaluations += 1
+        if not result.get('successful'):
+            summary.failures += 1
+        if cached:
+            summary.cache_hits += 1
+
+    def on_model_round(self, model, round, seconds, combinations, rejected, outputs, filtered=0):
+        summary = self._model(model)
+        summary.seconds += seconds
+        summary.filtered += filtered
+        summary.combinations += combinations
+        summary.rejected += rejected
+        summary.outputs += outputs
+
+    def on_evaluate_end(self, seconds, rounds):
+        self.seconds += seconds
+        self.rounds += rounds
+
+    def as_dict(self):
+        """
+        Returns:
+            (dict<str,id>): 'seconds', 'rounds', and 'models', the statistics of each model by name.
+        """
+        return {'seconds': self.seconds, 'rounds': self.rounds,
+                'models': {name: summary.as_dict() for name, summary in self.models.items()}}
+
+    def __str__(self):
+        lines = ['Evaluated in {:.3f} s over {} rounds'.format(self.seconds, self.rounds),
+                 '{:<40} {:>10} {:>9} {:>12} {:>9} {:>11} {:>9} {:>10} {:>8}'.format(
+                     'model', 'seconds', 'filtered', 'combinations', 'rejected', 'evaluations', 'failures',
+                     'cache hits', 'outputs')]
+        for name, s in sorted(self.models.items(), key=lambda item: -item[1].seconds):
+            lines.append('{:<40} {:>10.4f} {:>9} {:>12} {:>9} {:>11} {:>9} {:>10} {:>8}'.format(
+                name, s.seconds, s.filtered, s.combinations, s.rejected, s.evaluations, s.failures, s.cache_hits,
+                s.outputs))
+        return '\n'.join(lines)
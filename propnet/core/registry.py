@@ -0,0 +1,152 @@
+"""
+Module containing lazily-loaded registries of SymbolTypes and Models, backed by an on-disk cache.
+"""
+
+import os
+import pickle
+
+from collections.abc import MutableMapping
+from hashlib import sha256
+
+from propnet import logger
+
+
+def registry_cache_dir():
+    """
+    Returns:
+        (str): directory of the registry cache, set by the PROPNET_CACHE_DIR environment variable
+               (default: ~/.cache/propnet).
+    """
+    return os.environ.get('PROPNET_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'propnet'))
+
+
+def load_registry_cache(name, paths, parse):
+    """
+    Parses a set of files, using a cache on disk in place of parsing when none of the files has changed.
+
+    The cache is keyed by a hash of the contents of all the files, so that editing, adding or removing a file
+    invalidates it. Files that fail to parse are logged and left out. Failing to read or write the cache is
+    not an error, the files are simply parsed.
+
+    Args:
+        name (str): name of the registry, used for the cache file name.
+        paths (list<str>): files to parse.
+        parse (function): function parsing a file path into picklable data.
+    Returns:
+        (dict<str,id>): file name without extension -> parsed data.
+    """
+    paths = sorted(paths)
+    digest = sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    cache_path = os.path.join(registry_cache_dir(), '{}-{}.pickle'.format(name, digest.hexdigest()[:16]))
+
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    parsed = {}
+    for path in paths:
+        try:
+            parsed[os.path.splitext(os.path.basename(path))[0]] = parse(path)
+        except Exception as e:
+            logger.error('Failed to parse {}, {}.'.format(os.path.basename(path), e))
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # write to a temporary file first, so that concurrent processes never read a partial cache
+        tmp_path = '{}.{}'.format(cache_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.debug('Could not write registry cache {}, {}.'.format(cache_path, e))
+
+    return parsed
+
+
+class LazyRegistry(MutableMapping):
+    """
+    Dictionary whose names are known upfront but whose values are only loaded on first access.
+
+    Values can be added, replaced or removed like in a dictionary. A value that fails to load is logged and
+    its name removed from the registry.
+    """
+
+    def __init__(self, names, loader):
+        """
+        Args:
+            names (iterable<str>): names of the values in the registry.
+            loader (function): function loading the value of a name.
+        """
+        self._names = list(names)
+        self._loader = loader
+        self._values = {}
+
+    def _load(self, name):
+        try:
+            self._values[name] = self._loader(name)
+        except Exception as e:
+            logger.error('Failed to load {}, {}.'.format(name, e))
+            self._names.remove(name)
+            raise KeyError(name)
+        return self._values[name]
+
+    def __getitem__(self, name):
+        if name in self._values:
+            return self._values[name]
+        if name not in self._names:
+            raise KeyError(name)
+        return self._load(name)
+
+    def __setitem__(self, name, value):
+        if name not in self._names:
+            self._names.append(name)
+        self._values[name] = value
+
+    def __delitem__(self, name):
+        if name not in self._names:
+            raise KeyError(name)
+        self._names.remove(name)
+        self._values.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __iter__(self):
+        return iter(list(self._names))
+
+    def __len__(self):
+        return len(self._names)
+
+    def values(self):
+        """
+        Loads all values, leaving out those that fail to load.
+        """
+        values = []
+        for name in list(self._names):
+            try:
+                values.append(self[name])
+            except KeyError:
+                pass
+        return values
+
+    def items(self):
+        """
+        Loads all values, leaving out those that fail to load.
+        """
+        items = []
+        for name in list(self._names):
+            try:
+                items.append((name, self[name]))
+            except KeyError:
+                pass
+        return items
+
+    def __repr__(self):
+        return "LazyRegistry<{} entries, {} loaded>".format(len(self._names), len(self._values))
@@ -0,0 +1,651 @@
+"""
+Module containing columnar storage for the Symbols of a Propnet.
+"""
+
+import os
+import json
+import pickle
+
+import numpy as np
+
+from propnet import ureg
+from propnet.core.symbols import Symbol, value_fingerprint, magnitude_fingerprints, neighbour_fingerprints, \
+    magnitudes_close
+from propnet.core.units import to_magnitude, convert_magnitude, intern_units, dimensionality
+
+
+# index in the material column for Symbols that do not belong to a single material
+JOINT = -1
+
+_INITIAL_CAPACITY = 8
+
+# version of the on-disk format written by SymbolStore.save
+_FORMAT_VERSION = 1
+
+
+def _grow(array, capacity):
+    """Returns a copy of the array whose first dimension is extended to the given capacity."""
+    grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class SymbolColumn:
+    """
+    Stores the values of all Symbols of one SymbolType.
+
+    Values of Symbols whose values are pint Quantities with numerical magnitudes of the same shape (scalars,
+    vectors, tensors) are stored as magnitudes in a single NumPy array of shape (rows, *shape), all in the same
+    units. Any other values (e.g. structures, booleans) are stored in a Python list. A column starts out as
+    numerical and falls back to a list on the first value that doesn't fit.
+
+    Rows are never reused, removed rows are only marked as deleted, so a row index identifies a Symbol for
+    the lifetime of the column.
+
+    Attributes:
+        symbol_type (SymbolType): SymbolType of all values in this column.
+        size (int): number of rows, including deleted rows.
+        units (pint.UnitsContainer): interned units of the magnitudes in a numerical column, None otherwise.
+        values (np.ndarray or list): magnitudes for a numerical column, values otherwise.
+        materials (np.ndarray<int>): index of the material each row belongs to, or JOINT.
+        deleted (np.ndarray<bool>): rows that have been removed.
+        tags (list<list<str>>): tags of each Symbol.
+        provenance (list<id>): provenance of each Symbol.
+        sources (list<tuple<int>>): for JOINT rows, the materials the Symbol was derived from.
+        derivations (list<frozenset<str>>): names of the models used to derive each Symbol, None if not derived.
+        producers (list<str>): name of the model that derived each Symbol from its inputs, None if not derived.
+        index (dict<tuple,list<int>>): live rows by (material, sources, value fingerprint), built on first use by
+                                       find and kept up to date afterwards, None until then.
+    """
+
+    __slots__ = ['symbol_type', 'size', 'units', 'values', 'materials', 'deleted',
+                 'tags', 'provenance', 'sources', 'derivations', 'producers', 'index']
+
+    def __init__(self, symbol_type):
+        self.symbol_type = symbol_type
+        self.size = 0
+        self.units = None
+        self.values = None
+        self.materials = np.zeros(_INITIAL_CAPACITY, dtype=np.int64)
+        self.deleted = np.zeros(_INITIAL_CAPACITY, dtype=bool)
+        self.tags = []
+        self.provenance = []
+        self.sources = []
+        self.derivations = []
+        self.producers = []
+        self.index = None
+
+    @property
+    def is_numerical(self):
+        """
+        Returns:
+            (bool): True if values are stored as magnitudes in a NumPy array.
+        """
+        return isinstance(self.values, np.ndarray)
+
+    def _fits(self, value):
+        """Checks if a value can be stored as a magnitude in the numerical array."""
+        if not isinstance(value, ureg.Quantity):
+            return False
+        magnitude = np.asarray(value.magnitude)
+        if not np.issubdtype(magnitude.dtype, np.number) or np.iscomplexobj(magnitude):
+            return False
+        if self.values is None:
+            return True
+        return magnitude.shape == self.values.shape[1:] and value.dimensionality == dimensionality(self.units)
+
+    def _to_list(self):
+        """Converts a numerical column to a list of values."""
+        values = [self.get_value(row) for row in range(self.size)] if self.values is not None else []
+        self.values = values
+        self.units = None
+        self.index = None
+
+    def append(self, value, material, tags, provenance, sources, derivation, producer=None):
+        """
+        Appends a row to the column.
+
+        Returns:
+            (int): index of the new row.
+        """
+        if self.values is None and self._fits(value):
+            self.units = intern_units(value)
+            shape = np.shape(value.magnitude)
+            self.values = np.zeros((_INITIAL_CAPACITY,) + shape, dtype=np.float64)
+        elif not isinstance(self.values, list) and not self._fits(value):
+            self._to_list()
+
+        row = self.size
+        if row == len(self.materials):
+            capacity = max(2 * len(self.materials), _INITIAL_CAPACITY)
+            self.materials = _grow(self.materials, capacity)
+            self.deleted = _grow(self.deleted, capacity)
+            if self.is_numerical:
+                self.values = _grow(self.values, capacity)
+
+        if self.is_numerical:
+            self.values[row] = to_magnitude(value, self.units)
+        else:
+            self.values.append(value)
+        self.materials[row] = material
+        self.deleted[row] = False
+        self.tags.append(tags)
+        self.provenance.append(provenance)
+        self.sources.append(sources)
+        self.derivations.append(derivation)
+        self.producers.append(producer)
+        self.size += 1
+        if self.index is not None:
+            self._index_rows(row, row + 1)
+        return row
+
+    def extend(self, chunks):
+        """
+        Appends rows copied from other columns of the same SymbolType, all at once.
+
+        Args:
+            chunks (list<tuple<SymbolColumn,list<int>,int>>): source column, rows to copy from it and the index
+                                                             of the material the copied rows belong to.
+        Returns:
+            (list<int>): indices of the new rows, in the order of the chunks.
+        """
+        n_rows = sum(len(rows) for _, rows, _ in chunks)
+        if not n_rows:
+            return []
+
+        numerical = not isinstance(self.values, list) and all(source.is_numerical for source, _, _ in chunks)
+        if numerical:
+            reference = self if self.is_numerical else chunks[0][0]
+            numerical = all(source.values.shape[1:] == reference.values.shape[1:] and
+                            (source.units is reference.units or
+                             dimensionality(source.units) == dimensionality(reference.units))
+                            for source, _, _ in chunks)
+        if numerical and self.values is None:
+            self.units = reference.units
+            self.values = np.zeros((len(self.materials),) + reference.values.shape[1:], dtype=np.float64)
+        elif not numerical and not isinstance(self.values, list):
+            self._to_list()
+
+        start = self.size
+        end = start + n_rows
+        if end > len(self.materials):
+            capacity = max(2 * len(self.materials), end)
+            self.materials = _grow(self.materials, capacity)
+            self.deleted = _grow(self.deleted, capacity)
+            if self.is_numerical:
+                self.values = _grow(self.values, capacity)
+
+        row = start
+        for source, rows, material in chunks:
+            if self.is_numerical:
+                self.values[row:row + len(rows)] = convert_magnitude(source.values[rows], source.units, self.units)
+            else:
+                self.values.extend(source.get_value(r) for r in rows)
+            self.materials[row:row + len(rows)] = material
+            self.tags.extend(source.tags[r] for r in rows)
+            self.provenance.extend(source.provenance[r] for r in rows)
+            self.sources.extend([None] * len(rows))
+            self.derivations.extend(source.derivations[r] for r in rows)
+            self.producers.extend(source.producers[r] for r in rows)
+            row += len(rows)
+        self.deleted[start:end] = False
+        self.size = end
+        if self.index is not None:
+            self._index_rows(start, end)
+        return list(range(start, end))
+
+    def delete(self, row):
+        """
+        Marks a row as deleted.
+        """
+        self.deleted[row] = True
+        if self.index is not None:
+            key = (int(self.materials[row]), self.sources[row], self.fingerprints(row, row + 1)[0])
+            rows = self.index[key]
+            rows.remove(row)
+            if not rows:
+                del self.index[key]
+
+    def fingerprints(self, start, end):
+        """
+        Returns:
+            (list<id>): value fingerprints of a range of rows, see propnet.core.symbols.value_fingerprint.
+        """
+        if self.is_numerical:
+            return magnitude_fingerprints(self.values[start:end])
+        return [value_fingerprint(value) for value in self.values[start:end]]
+
+    def _index_rows(self, start, end):
+        """Adds the live rows of a range to the index."""
+        fingerprints = self.fingerprints(start, end)
+        materials = self.materials[start:end].tolist()
+        deleted = self.deleted[start:end]
+        for i, fingerprint in enumerate(fingerprints):
+            if not deleted[i]:
+                self.index.setdefault((materials[i], self.sources[start + i], fingerprint), []).append(start + i)
+
+    def find(self, fingerprint, material, sources=None):
+        """
+        Looks up a live row by the fingerprint of its value, in constant time.
+
+        Args:
+            fingerprint (id): value fingerprint, in the units of the column for a numerical column.
+            material (int): index of the material of the row, or JOINT.
+            sources (tuple<int>): for JOINT rows, the materials the Symbol was derived from.
+        Returns:
+            (int): the first such row, None if there is none.
+        """
+        rows = self.rows(fingerprint, material, sources)
+        return rows[0] if rows else None
+
+    def rows(self, fingerprint, material, sources=None):
+        """
+        Looks up all live rows with a value fingerprint, see find.
+
+        Returns:
+            (list<int>)
+        """
+        if self.index is None:
+            self.index = {}
+            self._index_rows(0, self.size)
+        return self.index.get((material, sources, fingerprint), [])
+
+    def get_value(self, row):
+        """
+        Returns:
+            (id): value of the Symbol in the given row.
+        """
+        if self.is_numerical:
+            magnitude = self.values[row]
+            if magnitude.shape == ():
+                magnitude = float(magnitude)
+            return ureg.Quantity(magnitude, self.units)
+        return self.values[row]
+
+    def live_rows(self):
+        """
+        Returns:
+            (list<int>): rows that have not been deleted.
+        """
+        return np.flatnonzero(~self.deleted[:self.size]).tolist()
+
+
+class SymbolStore:
+    """
+    Columnar storage of Symbols, with one SymbolColumn per SymbolType.
+
+    Each stored Symbol is identified by a key (SymbolType name, row). Keys are stable: they stay valid
+    until the Symbol is removed and are not reused unless the store is cleared. Symbol objects are only
+    created when requested, the store itself only keeps the column data.
+
+    Symbols either belong to a single material, identified by an integer index, or are JOINT Symbols derived
+    from the properties of several materials.
+    """
+
+    def __init__(self):
+        self._columns = {}
+        # material index -> SymbolType name -> rows
+        self._material_rows = {}
+        self._next_material = 0
+        # incremented on every change, used to invalidate views of the store
+        self.version = 0
+
+    def add_material(self):
+        """
+        Registers a new material.
+
+        Returns:
+            (int): index of the material.
+        """
+        index = self._next_material
+        self._next_material += 1
+        self._material_rows[index] = {}
+        self.version += 1
+        return index
+
+    def remove_material(self, material):
+        """
+        Removes a material and all its Symbols.
+
+        Args:
+            material (int): index of the material.
+        Returns:
+            (list<tuple<str,int>>): keys of the removed Symbols.
+        """
+        removed = self.keys(material=material)
+        for key in removed:
+            self.remove(key)
+        del self._material_rows[material]
+        self.version += 1
+        return removed
+
+    def clear(self):
+        """
+        Removes all materials and Symbols, releasing the memory held by the columns. Keys of removed Symbols may be
+        reused afterwards, material indices are not.
+        """
+        self._columns = {}
+        self._material_rows = {}
+        self.version += 1
+
+    @property
+    def materials(self):
+        """
+        Returns:
+            (list<int>): indices of all registered materials.
+        """
+        return list(self._material_rows.keys())
+
+    def add(self, symbol, material=JOINT, sources=None, derivation=None, producer=None):
+        """
+        Stores a Symbol.
+
+        Args:
+            symbol (Symbol): Symbol to store.
+            material (int): index of the material the Symbol belongs to, JOINT if it belongs to no single material.
+            sources (tuple<int>): for JOINT Symbols, the materials the Symbol was derived from.
+            derivation (frozenset<str>): names of the models used to derive the Symbol, if any.
+            producer (str): name of the model that derived the Symbol from its inputs, if any.
+        Returns:
+            (tuple<str,int>): key of the stored Symbol.
+        """
+        name = symbol.type.name
+        column = self._columns.get(name)
+        if column is None:
+            column = self._columns[name] = SymbolColumn(symbol.type)
+        row = column.append(symbol.value, material, symbol.tags, symbol.provenance,
+                            tuple(sources) if sources else None, derivation, producer)
+        if material != JOINT:
+            self._material_rows[material].setdefault(name, []).append(row)
+        self.version += 1
+        return name, row
+
+    def remove(self, key):
+        """
+        Removes a Symbol.
+
+        Args:
+            key (tuple<str,int>): key of the Symbol.
+        """
+        name, row = key
+        column = self._columns[name]
+        column.delete(row)
+        material = int(column.materials[row])
+        if material != JOINT:
+            self._material_rows[material][name].remove(row)
+        self.version += 1
+
+    def __contains__(self, key):
+        name, row = key
+        column = self._columns.get(name)
+        return column is not None and row < column.size and not column.deleted[row]
+
+    def __len__(self):
+        return sum(int(np.count_nonzero(~column.deleted[:column.size])) for column in self._columns.values())
+
+    def column(self, name):
+        """
+        Returns:
+            (SymbolColumn): column of the given SymbolType name, None if no such Symbols were stored.
+        """
+        return self._columns.get(name)
+
+    def symbol_types(self):
+        """
+        Returns:
+            (list<SymbolType>): SymbolTypes of all stored Symbols.
+        """
+        return [column.symbol_type for column in self._columns.values()]
+
+    def keys(self, material=None, symbol_type=None):
+        """
+        Gathers keys of stored Symbols.
+
+        Args:
+            material (int): optional, only Symbols belonging to this material (JOINT for joint Symbols).
+            symbol_type (str): optional, only Symbols of the SymbolType with this name.
+        Returns:
+            (list<tuple<str,int>>): keys of the matching Symbols.
+        """
+        if material is not None and material != JOINT:
+            rows = self._material_rows[material]
+            names = [symbol_type] if symbol_type else list(rows.keys())
+            return [(name, row) for name in names for row in rows.get(name, [])]
+
+        names = [symbol_type] if symbol_type else list(self._columns.keys())
+        keys = []
+        for name in names:
+            column = self._columns.get(name)
+            if column is None:
+                continue
+            mask = ~column.deleted[:column.size]
+            if material == JOINT:
+                mask &= column.materials[:column.size] == JOINT
+            keys.extend((name, row) for row in np.flatnonzero(mask).tolist())
+        return keys
+
+    def symbol(self, key):
+        """
+        Creates a Symbol object for a stored Symbol.
+
+        Args:
+            key (tuple<str,int>): key of the Symbol.
+        Returns:
+            (Symbol)
+        """
+        name, row = key
+        column = self._columns[name]
+        return Symbol(column.symbol_type, column.get_value(row), column.tags[row],
+                      provenance=column.provenance[row])
+
+    def material(self, key):
+        """
+        Returns:
+            (int): index of the material of the Symbol with the given key, JOINT if none.
+        """
+        name, row = key
+        return int(self._columns[name].materials[row])
+
+    def magnitudes(self, keys, units):
+        """
+        Returns the values of Symbols of the same SymbolType as a single array, without creating Symbol objects.
+
+        Args:
+            keys (list<tuple<str,int>>): keys of Symbols of the same SymbolType.
+            units (str, pint.Unit or pint.Quantity): units to convert the values to.
+        Returns:
+            (np.ndarray): magnitudes in the given units, of shape (len(keys), *shape), None if the values are not
+                          stored in a numerical column.
+        """
+        if not keys:
+            return None
+        column = self._columns[keys[0][0]]
+        if not column.is_numerical:
+            return None
+        return convert_magnitude(column.values[[row for _, row in keys]], column.units, units)
+
+    def sources(self, key):
+        """
+        Returns:
+            (tuple<int>): indices of the materials the Symbol with the given key belongs to or was derived from.
+        """
+        name, row = key
+        column = self._columns[name]
+        material = int(column.materials[row])
+        if material != JOINT:
+            return (material,)
+        return column.sources[row] or ()
+
+    def derivation(self, key):
+        """
+        Returns:
+            (frozenset<str>): names of the models used to derive the Symbol with the given key.
+        """
+        name, row = key
+        return self._columns[name].derivations[row] or frozenset()
+
+    def producer(self, key):
+        """
+        Returns:
+            (str): name of the model that derived the Symbol with the given key from its inputs, None if the Symbol
+                   was not derived.
+        """
+        name, row = key
+        return self._columns[name].producers[row]
+
+    def find(self, symbol, material=JOINT, sources=None):
+        """
+        Looks for a stored Symbol equal to the given Symbol, belonging to the same material, or for JOINT
+        Symbols derived from the same materials.
+
+        Numerical values are looked up by fingerprint, and in the neighbouring buckets of values within
+        FINGERPRINT_RTOL that round differently because they are on either side of a rounding edge, see
+        neighbour_fingerprints. Candidates from neighbouring buckets are confirmed with the tolerance of Symbol
+        equality.
+
+        Args:
+            symbol (Symbol): Symbol to look for.
+            material (int): material index, or JOINT.
+            sources (tuple<int>): for JOINT Symbols, the materials the Symbol was derived from.
+        Returns:
+            (tuple<str,int>): key of an equal Symbol, None if there is none.
+        """
+        name = symbol.type.name
+        column = self._columns.get(name)
+        if column is None:
+            return None
+        sources = tuple(sources) if sources and material == JOINT else None
+        if column.is_numerical:
+            if not column._fits(symbol.value):
+                return None
+            magnitude = np.asarray(to_magnitude(symbol.value, column.units), dtype=np.float64)
+            fingerprints = neighbour_fingerprints(magnitude)
+            row = column.find(fingerprints[0], material, sources)
+            if row is not None:
+                return name, row
+            for fingerprint in fingerprints[1:]:
+                for row in column.rows(fingerprint, material, sources):
+                    if magnitudes_close(column.values[row], magnitude):
+                        return name, row
+            return None
+        row = column.find(symbol.fingerprint, material, sources)
+        return (name, row) if row is not None else None
+
+    def copy_material(self, material, target, target_material):
+        """
+        Copies all Symbols of a material into another store.
+
+        Args:
+            material (int): index of the material in this store.
+            target (SymbolStore): store to copy into.
+            target_material (int): index of the material in the target store.
+        """
+        target.copy_materials([(self, material, target_material)])
+
+    def copy_materials(self, materials):
+        """
+        Copies all Symbols of many materials from other stores into this store. Rows are copied column by column,
+        without creating Symbol objects, and each column is only extended once.
+
+        Args:
+            materials (list<tuple<SymbolStore,int,int>>): source store, index of the material in the source store
+                                                         and index of the material in this store.
+        """
+        chunks = {}
+        for source, material, target_material in materials:
+            for name, rows in source._material_rows[material].items():
+                if rows:
+                    chunks.setdefault(name, []).append((source._columns[name], list(rows), target_material))
+
+        for name, name_chunks in chunks.items():
+            column = self._columns.get(name)
+            if column is None:
+                column = self._columns[name] = SymbolColumn(name_chunks[0][0].symbol_type)
+            new_rows = column.extend(name_chunks)
+            start = 0
+            for _, rows, target_material in name_chunks:
+                self._material_rows[target_material].setdefault(name, []).extend(new_rows[start:start + len(rows)])
+                start += len(rows)
+        self.version += 1
+
+    def save(self, path):
+        """
+        Saves the store to a directory.
+
+        Numerical columns are saved as NumPy .npy files, one per column, so that they can be memory-mapped when
+        loaded. Everything else (tags, provenance, non-numerical values, ...) is pickled. A manifest.json file
+        describes the columns.
+
+        Args:
+            path (str): directory to save to, created if needed.
+        """
+        os.makedirs(path, exist_ok=True)
+        columns = []
+        data = {'material_rows': self._material_rows, 'next_material': self._next_material, 'columns': {}}
+        for i, (name, column) in enumerate(self._columns.items()):
+            prefix = 'column{}'.format(i)
+            np.save(os.path.join(path, prefix + '_materials.npy'), column.materials[:column.size])
+            np.save(os.path.join(path, prefix + '_deleted.npy'), column.deleted[:column.size])
+            numerical = column.is_numerical
+            if numerical:
+                np.save(os.path.join(path, prefix + '_values.npy'), column.values[:column.size])
+            columns.append({'name': name, 'prefix': prefix, 'size': column.size, 'numerical': numerical,
+                            'units': str(ureg.Unit(column.units)) if numerical else None})
+            data['columns'][name] = {'values': None if numerical else column.values,
+                                     'tags': column.tags, 'provenance': column.provenance,
+                                     'sources': column.sources, 'derivations': column.derivations,
+                                     'producers': column.producers}
+
+        with open(os.path.join(path, 'store.pickle'), 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump({'version': _FORMAT_VERSION, 'columns': columns}, f, indent=2)
+
+    @classmethod
+    def load(cls, path, symbol_types, mmap=True):
+        """
+        Loads a store saved with save().
+
+        Numerical columns are memory-mapped copy-on-write by default: loading does not read the values, and
+        values are only copied into memory when the column is modified.
+
+        Args:
+            path (str): directory the store was saved to.
+            symbol_types (dict<str,SymbolType>): SymbolTypes of the stored Symbols, keyed by name.
+            mmap (bool): if False, numerical columns are read into memory.
+        Returns:
+            (SymbolStore)
+        """
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest['version'] != _FORMAT_VERSION:
+            raise ValueError('Unsupported store format version {} in {}'.format(manifest['version'], path))
+        with open(os.path.join(path, 'store.pickle'), 'rb') as f:
+            data = pickle.load(f)
+
+        mmap_mode = 'c' if mmap else None
+        store = cls()
+        store._material_rows = data['material_rows']
+        store._next_material = data['next_material']
+        for entry in manifest['columns']:
+            name = entry['name']
+            if name not in symbol_types:
+                raise ValueError('SymbolType {} of the stored Symbols is not known.'.format(name))
+            column = SymbolColumn(symbol_types[name])
+            prefix = os.path.join(path, entry['prefix'])
+            column.size = entry['size']
+            column.materials = np.load(prefix + '_materials.npy', mmap_mode=mmap_mode)
+            column.deleted = np.load(prefix + '_deleted.npy', mmap_mode=mmap_mode)
+            column_data = data['columns'][name]
+            if entry['numerical']:
+                column.units = intern_units(entry['units'])
+                column.values = np.load(prefix + '_values.npy', mmap_mode=mmap_mode)
+            else:
+                column.values = column_data['values']
+            column.tags = column_data['tags']
+            column.provenance = column_data['provenance']
+            column.sources = column_data['sources']
+            column.derivations = column_data['derivations']
+            column.producers = column_data.get('producers', [None] * column.size)
+            store._columns[name] = column
+        return store
@@ -1,11 +1,180 @@
 import numpy as np
 import sys
+import json
 
+from hashlib import sha1
+from itertools import product
 from typing import *
 from propnet import logger, ureg
+from propnet.core.units import convert
 from pybtex.database.input.bibtex import Parser
 from monty.json import MSONable
 
+# number of significant digits kept by value fingerprints, values agreeing to this many digits are equal,
+# i.e. equal within a relative tolerance of about 1e-6
+FINGERPRINT_DIGITS = 6
+
+# relative tolerance within which values rounding differently are looked up as near-duplicates, see
+# neighbour_fingerprints
+FINGERPRINT_RTOL = 1e-9
+
+# tolerances within which numerical values of Symbols are equal, those of np.isclose
+EQUALITY_RTOL = 1e-5
+EQUALITY_ATOL = 1e-8
+
+
+def _round_significant(flat):
+    """
+    Rounds values to FINGERPRINT_DIGITS significant digits.
+
+    Args:
+        flat (np.ndarray): values, of shape (n, k).
+    Returns:
+        (np.ndarray, np.ndarray): integer mantissas and decimal exponents of the rounded values, NaN and infinite
+                                  values are kept as mantissas.
+    """
+    nonzero = flat != 0
+    exponents = np.zeros(flat.shape)
+    np.floor(np.log10(np.abs(flat), where=nonzero, out=np.ones(flat.shape)), where=nonzero, out=exponents)
+    scale = 10.0 ** (exponents - (FINGERPRINT_DIGITS - 1))
+    mantissas = np.rint(flat / scale)
+    # rounding may carry over to an extra digit, e.g. 9.999999 -> 10.0000
+    carry = np.abs(mantissas) >= 10 ** FINGERPRINT_DIGITS
+    if carry.any():
+        exponents[carry] += 1
+        mantissas[carry] = np.rint(mantissas[carry] / 10)
+    # no negative zero
+    mantissas += 0.0
+    # NaN and infinite values are kept as they are
+    special = ~np.isfinite(flat)
+    if special.any():
+        mantissas[special] = flat[special]
+    return mantissas, exponents
+
+
+def magnitude_fingerprints(magnitudes):
+    """
+    Computes the fingerprints of many numerical values at once, see value_fingerprint.
+
+    Args:
+        magnitudes (np.ndarray): values, of shape (n, *shape) for n values of the given shape.
+    Returns:
+        (list<bytes>): fingerprint of each value.
+    """
+    magnitudes = np.asarray(magnitudes, dtype=np.float64)
+    mantissas, exponents = _round_significant(magnitudes.reshape(len(magnitudes), -1))
+    prefix = str(magnitudes.shape[1:]).encode('ascii')
+    rows = np.concatenate([mantissas, exponents], axis=1)
+    return [prefix + row.tobytes() for row in rows]
+
+
+def neighbour_fingerprints(magnitude, rtol=FINGERPRINT_RTOL, limit=64):
+    """
+    Computes the fingerprints of the values within a relative tolerance of a value that round differently.
+
+    Rounding to a fixed number of digits puts values just either side of a rounding edge, e.g. 1.2345649999 and
+    1.234565, in different buckets however close they are. Looking up these neighbouring buckets as well finds
+    such near-duplicates, see SymbolStore.find. Only the components of a tensor that are close to an edge have
+    neighbours.
+
+    Args:
+        magnitude (np.ndarray): numerical value.
+        rtol (float): relative tolerance.
+        limit (int): maximum number of fingerprints returned, values with too many components close to an edge
+                     only get their own fingerprint.
+    Returns:
+        (list<bytes>): fingerprint of the value, followed by those of its neighbouring buckets.
+    """
+    magnitude = np.asarray(magnitude, dtype=np.float64)
+    flat = magnitude.reshape(1, -1)
+    rounded = [_round_significant(flat * factor) for factor in (1.0, 1.0 - rtol, 1.0 + rtol)]
+    # alternative (mantissa, exponent) pairs of each component, its own first
+    alternatives = []
+    n_fingerprints = 1
+    for i in range(flat.shape[1]):
+        pairs = []
+        for mantissas, exponents in rounded:
+            pair = (mantissas[0, i], exponents[0, i])
+            if pair not in pairs and not np.isnan(pair[0]):
+                pairs.append(pair)
+        alternatives.append(pairs or [(rounded[0][0][0, i], rounded[0][1][0, i])])
+        n_fingerprints *= len(alternatives[-1])
+    if n_fingerprints > limit:
+        alternatives = [pairs[:1] for pairs in alternatives]
+
+    prefix = str(magnitude.shape).encode('ascii')
+    fingerprints = []
+    for combination in product(*alternatives):
+        row = np.array([mantissa for mantissa, _ in combination] + [exponent for _, exponent in combination],
+                       dtype=np.float64)
+        fingerprints.append(prefix + row.tobytes())
+    return fingerprints
+
+
+def _numerical_magnitude(value):
+    """Returns the magnitude of a numerical value as a float array, None for other values."""
+    if isinstance(value, ureg.Quantity):
+        value = value.magnitude
+    if isinstance(value, (bool, np.bool_)) or not isinstance(value, (int, float, np.number, np.ndarray)):
+        return None
+    magnitude = np.asarray(value)
+    if not np.issubdtype(magnitude.dtype, np.number) or np.iscomplexobj(magnitude):
+        return None
+    return magnitude.astype(np.float64)
+
+
+def magnitudes_close(a, b):
+    """
+    Checks if two numerical values of a Symbol, in the same units, are equal within EQUALITY_RTOL and
+    EQUALITY_ATOL.
+
+    Args:
+        a (np.ndarray): magnitude.
+        b (np.ndarray): magnitude.
+    Returns:
+        (bool): True if the values have the same shape and are close.
+    """
+    a = np.asarray(a)
+    b = np.asarray(b)
+    return a.shape == b.shape and bool(np.allclose(a, b, rtol=EQUALITY_RTOL, atol=EQUALITY_ATOL, equal_nan=True))
+
+
+def value_fingerprint(value):
+    """
+    Computes a canonical, hashable fingerprint of the value of a Symbol.
+
+    Numbers, and NumPy arrays of numbers, are rounded to FINGERPRINT_DIGITS significant digits so that values
+    differing only by floating-point noise get the same fingerprint. The magnitudes of Quantities are used, a
+    Symbol's value is always in the units of its SymbolType. Objects with an as_dict method (e.g. structures)
+    are fingerprinted by their serialization, other objects by their value.
+
+    Rounding is to a fixed grid: values on either side of a rounding edge, e.g. 1.2345649999 and 1.234565, get
+    different fingerprints however close they are. The Symbols are still equal, Symbol equality compares values
+    within a tolerance, but they hash differently so a set may keep both. SymbolStore.find detects such
+    near-duplicates, see neighbour_fingerprints.
+
+    Args:
+        value (id): value of a Symbol.
+    Returns:
+        (id): fingerprint, equal for equal values.
+    """
+    if isinstance(value, ureg.Quantity):
+        value = value.magnitude
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.number, np.ndarray)):
+        magnitude = np.asarray(value)
+        if np.issubdtype(magnitude.dtype, np.number) and not np.iscomplexobj(magnitude):
+            return magnitude_fingerprints(magnitude[np.newaxis])[0]
+    if hasattr(value, 'as_dict'):
+        serialized = json.dumps(value.as_dict(), sort_keys=True, default=str)
+        return type(value).__name__, sha1(serialized.encode('utf-8')).hexdigest()
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
 
 class SymbolType(MSONable):
     """
@@ -189,12 +358,22 @@ class Symbol(MSONable):
         if type(value) == float or type(value) == int:
             value = ureg.Quantity(value, symbol_type.units)
         elif type(value) == ureg.Quantity:
-            value = value.to(symbol_type.units)
+            value = convert(value, symbol_type.units)
+        elif isinstance(value, (np.ndarray, list)) and isinstance(symbol_type.units, ureg.Quantity):
+            # numerical arrays (e.g. tensors) get the units of their SymbolType like numbers do
+            try:
+                magnitude = np.asarray(value)
+            except ValueError:
+                magnitude = None
+            if magnitude is not None and np.issubdtype(magnitude.dtype, np.number) \
+                    and not np.iscomplexobj(magnitude):
+                value = ureg.Quantity(magnitude, symbol_type.units)
 
         self._symbol_type = symbol_type
         self._value = value
         self._tags = tags
         self._provenance = provenance
+        self._fingerprint = None
 
     # Associated accessor methods.
     @property
@@ -229,25 +408,30 @@ class Symbol(MSONable):
         """
         return self._provenance
 
+    @property
+    def fingerprint(self):
+        """
+        Returns:
+            (id): fingerprint of the value of the Symbol, see value_fingerprint, used to hash the Symbol.
+        """
+        if getattr(self, '_fingerprint', None) is None:
+            self._fingerprint = value_fingerprint(self._value)
+        return self._fingerprint
+
     def __hash__(self):
-        return hash(self.type.name)
+        # equal Symbols hash equally, except for values close to each other on either side of a rounding edge
+        return hash((self.type.name, self.fingerprint))
 
     def __eq__(self, other):
         if not isinstance(other, Symbol):
             return False
         if self.type != other.type:
             return False
-        if type(self.value) == ureg.Quantity:
-            val1 = float(self.value.magnitude)
-        else:
-            val1 = self.value
-        if type(other.value) == ureg.Quantity:
-            val2 = float(other.value.magnitude)
-        else:
-            val2 = other.value
-        if not np.isclose(val1, val2):
-            return False
-        return True
+        a = _numerical_magnitude(self.value)
+        b = _numerical_magnitude(other.value)
+        if a is not None and b is not None:
+            return magnitudes_close(a, b)
+        return self.fingerprint == other.fingerprint
 
     def __str__(self):
         to_return = '<' + self._symbol_type.name + ', ' + str(self._value) + ', ' + str(self._tags) + '>'
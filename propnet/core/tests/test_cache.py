@@ -0,0 +1,76 @@
+import unittest
+import os
+import tempfile
+
+import numpy as np
+
+from propnet import ureg
+from propnet.core.cache import EvaluationCache
+from propnet.models import DEFAULT_MODELS
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.model = DEFAULT_MODELS['RefractiveIndexfromRelPerm']()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'evaluations.sqlite')
+
+    def tearDown(self):
+        self.model.evaluation_cache = None
+        self.tmp.cleanup()
+
+    def test_memory_cache(self):
+        """
+        Repeated evaluations with equal inputs, whatever their units, are served from the cache.
+        """
+        cache = EvaluationCache(maxsize=1)
+        self.model.evaluation_cache = cache
+        expected = self.model.evaluate({'Er': 2, 'Ur': 8})
+
+        out = self.model.evaluate({'Er': ureg.Quantity(2, 'dimensionless'), 'Ur': 8})
+        self.assertEqual(out, expected)
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 1)
+
+        # maxsize=1, the first result is evicted
+        self.model.evaluate({'Er': 1, 'Ur': 4})
+        self.model.evaluate({'Er': 2, 'Ur': 8})
+        self.assertEqual(cache.stats['misses'], 3)
+        self.assertEqual(cache.stats['size'], 1)
+
+        # arrays of cached results are read-only copies, shared by every hit
+        values = np.array([1.0, 2.0])
+        cache.put(self.model, 'array', {'n': values, 'successful': True})
+        values[0] = 0.0
+        out = cache.get(self.model, 'array')
+        with self.assertRaises(ValueError):
+            out['n'].magnitude[0] = 0.0
+        self.assertEqual(list(cache.get(self.model, 'array')['n'].magnitude), [1.0, 2.0])
+
+    def test_disk_cache(self):
+        """
+        Results are reused across caches sharing a database, unless the model changed.
+        """
+        self.model.evaluation_cache = EvaluationCache(path=self.path)
+        expected = self.model.evaluate({'Er': 2, 'Ur': 8})
+        self.model.evaluation_cache.close()
+
+        cache = EvaluationCache(path=self.path)
+        self.model.evaluation_cache = cache
+        self.assertEqual(self.model.evaluate({'Er': 2, 'Ur': 8}), expected)
+        self.assertEqual(cache.stats['disk_hits'], 1)
+        cache.close()
+
+        changed = DEFAULT_MODELS['RefractiveIndexfromRelPerm']()
+        changed._metadata['equations'] = ['n - 2*sqrt(Ur*Er)']
+        cache = EvaluationCache(path=self.path)
+        changed.evaluation_cache = cache
+        self.assertNotEqual(changed.fingerprint, self.model.fingerprint)
+        changed.evaluate({'Er': 2, 'Ur': 8})
+        self.assertEqual(cache.stats['hits'], 0)
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,29 @@ from propnet.core.symbols import *
 from propnet.core.models import *
 
 from propnet.symbols import DEFAULT_SYMBOL_TYPES
+from propnet.core.profiling import EvaluationSummary
+
+
+class ChainModel(AbstractModel):
+    """
+    Derives B = A + 1 and C = B + 1, so it derives C from B only when B was not derived by itself. Defined at
+    module level so that it can be sent to the worker processes of Propnet.evaluate_many.
+    """
+
+    def __init__(self, symbol_types=None):
+        AbstractModel.__init__(self, metadata={
+            'title': 'Chain', 'tags': [], 'references': [],
+            'symbol_mapping': {'a': 'A', 'b': 'B', 'c': 'C'},
+            'connections': [{'inputs': ['a'], 'outputs': ['b']},
+                            {'inputs': ['b'], 'outputs': ['c']}],
+            'description': ''},
+            symbol_types=symbol_types)
+
+    def plug_in(self, symbol_values):
+        if 'a' in symbol_values:
+            return {'b': symbol_values['a'] + 1}
+        return {'c': symbol_values['b'] + 1}
+
 
 class GraphTest(unittest.TestCase):
 
@@ -439,3 +462,379 @@ class GraphTest(unittest.TestCase):
         self.assertTrue(GraphTest.check_graph_symbols(mat2.graph, m2_s_outputs, 'Symbol'))
         self.assertTrue(GraphTest.check_graph_symbols(mat2.graph, [mat2], 'Material'))
         self.assertTrue(GraphTest.check_graph_symbols(mat2.graph, [A, B, Constraint], 'SymbolType'))
+
+    def testEvaluationByMaterial(self):
+        """
+        Same materials and models as testDoubleMaterialNonDegeneratePropertyDoublePropagationProperies.
+        Evaluating by material, no joint properties are derived unless model2 is declared multi-material.
+        """
+        A = SymbolType('A', [1.0, []], ['A'], ['A'], [1], '', validate=False)
+        B = SymbolType('B', [1.0, []], ['B'], ['B'], [1], '', validate=False)
+        C = SymbolType('C', [1.0, []], ['C'], ['C'], [1], '', validate=False)
+        E = SymbolType('E', [1.0, []], ['E'], ['E'], [1], '', validate=False)
+        symbol_type_dict = {'A': A, 'B': B, 'C': C, 'E': E}
+
+        for multi_material, joint_outputs in [(False, []),
+                                              (True, [Symbol(E, 6/5, []), Symbol(E, 7/3, [])])]:
+            mat1 = Material()
+            mat2 = Material()
+            mat1.add_property(Symbol(A, 2, []))
+            mat1.add_property(Symbol(B, 3, []))
+            mat2.add_property(Symbol(B, 5, []))
+            mat2.add_property(Symbol(C, 7, []))
+
+            class Model1(AbstractModel):
+                def __init__(self, symbol_types=None):
+                    AbstractModel.__init__(self, metadata={
+                        'title': 'model1', 'tags': [], 'references': [],
+                        'symbol_mapping': {'a': 'A', 'b': 'B', 'c': 'C'},
+                        'connections': [{'inputs': ['a', 'b'], 'outputs': ['c']}],
+                        'equations': ['c=a*b'], 'description': ''},
+                        symbol_types=symbol_types)
+
+            class Model2(AbstractModel):
+                def __init__(self, symbol_types=None):
+                    AbstractModel.__init__(self, metadata={
+                        'title': 'model2', 'tags': [], 'references': [],
+                        'symbol_mapping': {'e': 'E', 'c': 'C', 'b': 'B'},
+                        'connections': [{'inputs': ['c', 'b'], 'outputs': ['e']}],
+                        'equations': ['e=c/b'], 'description': '', 'multi_material': multi_material},
+                        symbol_types=symbol_types)
+
+            p = Propnet(materials=[mat1, mat2],
+                        models={'model1': Model1, 'model2': Model2},
+                        symbol_types=symbol_type_dict)
+            p.evaluate(by_material=True)
+
+            m1_s_outputs = [Symbol(A, 2, []), Symbol(B, 3, []), Symbol(C, 6, []), Symbol(E, 2, [])]
+            m2_s_outputs = [Symbol(B, 5, []), Symbol(C, 7, []), Symbol(E, 7/5, [])]
+            self.assertTrue(GraphTest.check_graph_symbols(mat1.graph, m1_s_outputs, 'Symbol'))
+            self.assertTrue(GraphTest.check_graph_symbols(mat2.graph, m2_s_outputs, 'Symbol'))
+            self.assertTrue(GraphTest.check_graph_symbols(
+                p.graph, m1_s_outputs + m2_s_outputs + joint_outputs, 'Symbol'))
+
+    def testEvaluationWithSymbolConstraint(self):
+        """
+        The Wiedemann-Franz law only applies to metals: the non-metallic material's is_metallic Symbol is
+        rejected before any input combination is generated, no combination is tried for that material.
+        """
+        p = Propnet()
+        metal = Material()
+        metal.add_property(Symbol('is_metallic', 1, None))
+        metal.add_property(Symbol('temperature', 300, None))
+        metal.add_property(Symbol('electrical_conductivity', 2, None))
+        insulator = Material()
+        insulator.add_property(Symbol('is_metallic', 0, None))
+        for value in (300, 400):
+            insulator.add_property(Symbol('temperature', value, None))
+        for value in (2, 3):
+            insulator.add_property(Symbol('electrical_conductivity', value, None))
+        p.add_materials([metal, insulator])
+
+        for mat, expected in ((metal, 1), (insulator, 0)):
+            summary = EvaluationSummary()
+            p.evaluate(material=mat, observer=summary)
+            wiedemann_franz = summary.models['WiedemannFranzLaw']
+            self.assertEqual(wiedemann_franz.combinations, expected)
+            # the rejected is_metallic Symbol is reported
+            self.assertEqual(wiedemann_franz.filtered, 1 - expected)
+            self.assertEqual('electronic_thermal_conductivity' in mat.available_properties(), bool(expected))
+
+    def testEvaluationMultiRouteChain(self):
+        """
+        Model M derives B from A and D from C, model N derives C from B. M is applied to C even though B was
+        derived by M: a model is only never applied to Symbols it derived itself.
+        """
+        symbol_type_dict = {name: SymbolType(name, [1.0, []], [name], [name], [1], '', validate=False)
+                            for name in 'ABCD'}
+
+        class M(AbstractModel):
+            def __init__(self, symbol_types=None):
+                AbstractModel.__init__(self, metadata={
+                    'title': 'M', 'tags': [], 'references': [],
+                    'symbol_mapping': {'a': 'A', 'b': 'B', 'c': 'C', 'd': 'D'},
+                    'connections': [{'inputs': ['a'], 'outputs': ['b']},
+                                    {'inputs': ['c'], 'outputs': ['d']}],
+                    'description': ''},
+                    symbol_types=symbol_types)
+
+            def plug_in(self, symbol_values):
+                if 'a' in symbol_values:
+                    return {'b': 2 * symbol_values['a']}
+                return {'d': symbol_values['c'] + 1}
+
+        class N(AbstractModel):
+            def __init__(self, symbol_types=None):
+                AbstractModel.__init__(self, metadata={
+                    'title': 'N', 'tags': [], 'references': [],
+                    'symbol_mapping': {'b': 'B', 'c': 'C'},
+                    'connections': [{'inputs': ['b'], 'outputs': ['c']}],
+                    'description': ''},
+                    symbol_types=symbol_types)
+
+            def plug_in(self, symbol_values):
+                return {'c': 3 * symbol_values['b']}
+
+        mat = Material()
+        mat.add_property(Symbol(symbol_type_dict['A'], 1, []))
+        p = Propnet(materials=[mat], models={'M': M, 'N': N}, symbol_types=symbol_type_dict)
+        self.assertEqual(p.derivable(['A']).symbol_types, frozenset('BCD'))
+
+        p.evaluate()
+        self.assertEqual(sorted(mat.available_properties()), list('ABCD'))
+        self.assertTrue(GraphTest.check_graph_symbols(
+            mat.graph, [Symbol(symbol_type_dict[name], value, []) for name, value in zip('ABCD', (1, 2, 6, 7))],
+            'Symbol'))
+
+    def testEvaluationCombinationLimit(self):
+        """
+        Material with degenerate relative permittivity and relative permeability values.
+        Without a limit all 4 combinations are evaluated and 4 refractive_index properties
+        derived, with max_combinations=1 only a single one should be derived.
+        """
+        for max_combinations, expected in [(None, 4), (1, 1)]:
+            propnet = Propnet()
+            mat1 = Material()
+            mat1.add_property(Symbol('relative_permeability', 1, None))
+            mat1.add_property(Symbol('relative_permeability', 2, None))
+            mat1.add_property(Symbol('relative_permittivity', 3, None))
+            mat1.add_property(Symbol('relative_permittivity', 5, None))
+            propnet.add_material(mat1)
+
+            propnet.evaluate(material=mat1, max_combinations=max_combinations)
+
+            derived = [node for node in mat1.graph.nodes
+                       if node.node_type == PropnetNodeType['Symbol'] and
+                       node.node_value.type.name == 'refractive_index']
+            self.assertEqual(len(derived), expected)
+
+    def testIncrementalEvaluation(self):
+        """
+        Graph has one material with properties A=2 and B=3, and one model deriving C=A*B.
+        Incremental evaluation should only plug in input combinations involving Symbols added
+        since the last evaluation: after adding B=5, only (A=2, B=5) is evaluated.
+        """
+        A = SymbolType('A', [1.0, []], ['A'], ['A'], [1], '', validate=False)
+        B = SymbolType('B', [1.0, []], ['B'], ['B'], [1], '', validate=False)
+        C = SymbolType('C', [1.0, []], ['C'], ['C'], [1], '', validate=False)
+        symbol_type_dict = {'A': A, 'B': B, 'C': C}
+
+        calls = []
+
+        class Model1(AbstractModel):
+            def __init__(self, symbol_types=None):
+                AbstractModel.__init__(self, metadata={
+                    'title': 'model1',
+                    'symbol_mapping': {'a': 'A', 'b': 'B', 'c': 'C'},
+                    'connections': [{'inputs': ['a', 'b'], 'outputs': ['c']}],
+                    'equations': ['c - a*b']
+                }, symbol_types=symbol_types)
+
+            def plug_in(self, symbol_values):
+                calls.append(symbol_values)
+                return AbstractModel.plug_in(self, symbol_values)
+
+        mat1 = Material()
+        mat1.add_property(Symbol(A, 2, []))
+        mat1.add_property(Symbol(B, 3, []))
+        p = Propnet(materials=[mat1], models={'model1': Model1}, symbol_types=symbol_type_dict)
+
+        p.evaluate(material=mat1, incremental=True)
+        self.assertEqual(len(calls), 1)
+
+        mat1.add_property(Symbol(B, 5, []))
+        p.evaluate(material=mat1, incremental=True)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[-1], {'a': 2, 'b': 5})
+
+        # nothing new to evaluate
+        p.evaluate(material=mat1, incremental=True)
+        self.assertEqual(len(calls), 2)
+
+        m1_s_outputs = [Symbol(A, 2, []), Symbol(B, 3, []), Symbol(B, 5, []),
+                        Symbol(C, 6, []), Symbol(C, 10, [])]
+        self.assertTrue(GraphTest.check_graph_symbols(mat1.graph, m1_s_outputs, 'Symbol'))
+        self.assertEqual(len(list(p.nodes_by_type('Symbol'))), 5)
+
+    def testEvaluateMany(self):
+        """
+        Evaluating materials in worker processes should derive the same Symbols as evaluating
+        each material in turn, and add them to both the material graphs and the Propnet graph.
+        """
+        values = [(1, 3), (2, 5), (4, 7)]
+
+        def make_materials():
+            materials = []
+            for permeability, permittivity in values:
+                mat = Material()
+                mat.add_property(Symbol('relative_permeability', permeability, None))
+                mat.add_property(Symbol('relative_permittivity', permittivity, None))
+                materials.append(mat)
+            return materials
+
+        serial = make_materials()
+        p_serial = Propnet(materials=serial)
+        for mat in serial:
+            p_serial.evaluate(material=mat)
+
+        parallel = make_materials()
+        p_parallel = Propnet()
+        p_parallel.evaluate_many(parallel, workers=2)
+
+        for mat_serial, mat_parallel, (permeability, permittivity) in zip(serial, parallel, values):
+            expected = [node.node_value for node in mat_serial.available_property_nodes()]
+            self.assertIn(Symbol('refractive_index', (permeability * permittivity) ** 0.5, None), expected)
+            self.assertEqual(len(expected), len(mat_parallel.available_property_nodes()))
+            self.assertTrue(GraphTest.check_graph_symbols(mat_parallel.graph, expected, 'Symbol'))
+            self.assertIs(mat_parallel.parent, p_parallel)
+        self.assertTrue(GraphTest.check_graph_symbols(
+            p_parallel.graph, [node.node_value for node in p_serial.nodes_by_type('Symbol')], 'Symbol'))
+
+        # on a partly evaluated Propnet, Symbols already derived are neither re-derived from nor duplicated
+        partial = make_materials()
+        p_partial = Propnet(materials=partial)
+        p_partial.evaluate(material=partial[0])
+        p_partial.evaluate_many(partial, workers=2)
+        p_partial.evaluate_many(partial, workers=2)
+        for mat_serial, mat_partial in zip(serial, partial):
+            expected = [node.node_value for node in mat_serial.available_property_nodes()]
+            symbols = [node.node_value for node in mat_partial.available_property_nodes()]
+            self.assertEqual(len(symbols), len(expected))
+            self.assertTrue(GraphTest.check_graph_symbols(mat_partial.graph, expected, 'Symbol'))
+
+    def testEvaluateManyAfterEvaluate(self):
+        """
+        evaluate_many on materials already evaluated sends the provenance of derived Symbols to the workers, so
+        it derives the same Symbols as evaluate, and none are added twice.
+        """
+        symbol_type_dict = {name: SymbolType(name, [1.0, []], [name], [name], [1], '', validate=False)
+                            for name in 'ABC'}
+        materials = []
+        for value in (1, 10):
+            mat = Material()
+            mat.add_property(Symbol(symbol_type_dict['A'], value, []))
+            materials.append(mat)
+        p = Propnet(materials=materials, models={'Chain': ChainModel}, symbol_types=symbol_type_dict)
+        p.evaluate(material=materials[0])
+        p.evaluate_many(materials, workers=2)
+        p.evaluate_many(materials, workers=2)
+
+        for mat, value in zip(materials, (1, 10)):
+            self.assertEqual(sorted(mat.available_properties()), ['A', 'B'])
+            self.assertTrue(GraphTest.check_graph_symbols(
+                mat.graph, [Symbol(symbol_type_dict['A'], value, []), Symbol(symbol_type_dict['B'], value + 1, [])],
+                'Symbol'))
+            key = mat._keys('B')[0]
+            self.assertEqual(p._store.producer(key), 'ChainModel')
+
+    def test_topology(self):
+        """
+        The topology index should agree with the Model and SymbolType nodes of the graph, and should
+        not change when materials are added.
+        """
+        p = Propnet()
+        topology = p.topology
+
+        model_nodes = list(p.nodes_by_type('Model'))
+        self.assertEqual(set(topology.models), {node.node_value.name for node in model_nodes})
+        for node in model_nodes:
+            successors = {n.node_value for n in p.graph.successors(node)}
+            outputs = {t for c in topology.connections[node.node_value.name] for t in c.output_types}
+            self.assertEqual(successors, outputs)
+
+        for node in p.nodes_by_type('SymbolType'):
+            models = {n.node_value for n in p.graph.successors(node)}
+            self.assertTrue(models <= set(topology.consumers[node.node_value.name]))
+
+        self.assertIn('is_metallic', topology.constraint_symbols['WiedemannFranzLaw'])
+        self.assertIn(p.topology.models['WiedemannFranzLaw'], topology.consumers['is_metallic'])
+        self.assertIn(p.topology.models['RefractiveIndexfromRelPerm'], topology.producers['refractive_index'])
+
+        # every model is scheduled once, after the models producing its inputs unless they depend on each other
+        steps = {model.name: i for i, step in enumerate(topology.schedule) for model in step.models}
+        self.assertEqual(set(steps), set(topology.models))
+        for name in topology.models:
+            for symbol_type in {t for _, types in topology.connection_inputs[name] for t in types}:
+                for producer in topology.producers[symbol_type.name]:
+                    self.assertLessEqual(steps[producer.name], steps[name])
+        cyclic = [{model.name for model in step.models} for step in topology.schedule if step.cyclic]
+        self.assertIn({'ElResistivityfromElConductivity', 'WiedemannFranzLaw'}, cyclic)
+
+        # evaluation plans only contain connections whose inputs are available or derivable, and are cached
+        plan = topology.evaluation_plan({'relative_permeability', 'relative_permittivity', 'wavelength'})
+        calls = [(model.name, routes) for step in plan for model, routes in step.calls]
+        self.assertEqual(calls, [('RefractiveIndexfromRelPerm', (0,))])
+        self.assertIs(topology.evaluation_plan(['wavelength', 'relative_permittivity', 'relative_permeability']),
+                      plan)
+        self.assertIn('IsMetallic', {model.name for step in topology.evaluation_plan({'band_gap'})
+                                     for model, _ in step.calls})
+        self.assertEqual(topology.evaluation_plan({'band_gap_pbe'}), ())
+
+        mat = Material()
+        mat.add_property(Symbol('refractive_index', 1, []))
+        p.add_material(mat)
+        self.assertIs(p.topology, topology)
+
+    def test_derive(self):
+        """
+        derive only evaluates the models needed for the target, evaluate derives the rest.
+        """
+        p = Propnet()
+        mat = Material()
+        mat.add_property(Symbol('relative_permeability', 1, None))
+        mat.add_property(Symbol('relative_permittivity', 4, None))
+        mat.add_property(Symbol('extinction_coefficient', 0.5, None))
+        mat.add_property(Symbol('wavelength', 500, None))
+        p.add_material(mat)
+
+        plan = p.topology.plan(['relative_permeability', 'relative_permittivity', 'extinction_coefficient'],
+                               'reflectance')
+        self.assertEqual([(model.name, route) for model, route in plan],
+                         [('RefractiveIndexfromRelPerm', 0), ('OpticalReflectance', 0)])
+        self.assertIsNone(p.topology.plan(['band_gap_pbe'], 'reflectance'))
+
+        reflectance = p.derive(mat, 'reflectance')
+        self.assertEqual(len(reflectance), 1)
+        self.assertAlmostEqual(reflectance[0].value.magnitude, (1 + 0.25) / (9 + 0.25))
+        self.assertEqual(set(mat.available_properties()),
+                         {'relative_permeability', 'relative_permittivity', 'extinction_coefficient',
+                          'wavelength', 'refractive_index', 'reflectance'})
+        self.assertEqual(p.derive(mat, DEFAULT_SYMBOL_TYPES['band_gap_pbe']), [])
+
+        # a later full evaluation still derives everything
+        p.evaluate(material=mat, incremental=True)
+        self.assertIn('absorption_coefficient', mat.available_properties())
+
+    def test_derivable(self):
+        """
+        The closure agrees with evaluation: everything evaluate derives is derivable.
+        """
+        p = Propnet()
+        mat = Material()
+        mat.add_property(Symbol('relative_permeability', 1, None))
+        mat.add_property(Symbol('relative_permittivity', 9, None))
+        mat.add_property(Symbol('extinction_coefficient', 0.5, None))
+        mat.add_property(Symbol('wavelength', 500, None))
+        p.add_material(mat)
+        available = set(mat.available_properties())
+
+        derivable = p.derivable(available)
+        self.assertIs(p.derivable([DEFAULT_SYMBOL_TYPES[name] for name in available]), derivable)
+        self.assertIn('reflectance', derivable.symbol_types)
+        self.assertIn('RefractiveIndexfromRelPerm', derivable.models)
+        self.assertNotIn('band_gap', derivable.symbol_types)
+
+        p.evaluate(material=mat)
+        self.assertEqual(set(mat.available_properties()) - available, set(derivable.symbol_types))
+
+        self.assertEqual(p.derivable([]).symbol_types, frozenset())
+        with self.assertRaises(ValueError):
+            p.derivable(['not_a_symbol_type'])
+
+    def test_shortest_path(self):
+        p = Propnet()
+        self.assertEqual(p.shortest_path('relative_permeability', 'reflectance'),
+                         ['relative_permeability', 'RefractiveIndexfromRelPerm', 'refractive_index',
+                          'OpticalReflectance', 'reflectance'])
+        self.assertEqual(p.shortest_path('refractive_index', 'refractive_index'), ['refractive_index'])
+        self.assertIsNone(p.shortest_path('reflectance', 'band_gap_pbe'))
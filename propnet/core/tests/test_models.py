@@ -1,6 +1,8 @@
 import unittest
 import os
 
+import numpy as np
+
 from glob import glob
 from monty.serialization import loadfn
 
@@ -95,3 +97,75 @@ class ModelTest(unittest.TestCase):
 
         self.assertTrue(math.isclose(out['a'].magnitude, 200.0))
         self.assertTrue(out['a'].units == A.units)
+
+    def test_compiled_equations(self):
+        """
+        Tests that equations are solved symbolically once per connection and that
+        the compiled functions reproduce the analytical result.
+        Returns:
+            None
+        """
+        model = models.RefractiveIndexfromRelPerm()
+
+        out = model.plug_in({'Ur': 2.0, 'Er': 8.0})
+        self.assertTrue(math.isclose(out['n'], 4.0))
+        out = model.plug_in({'Ur': 2.0, 'n': 4.0})
+        self.assertTrue(math.isclose(out['Er'], 8.0))
+
+        # compiled functions are reused across calls and across instances
+        compiled = model.compiled_connection(0)
+        self.assertIs(compiled, model.compiled_connection(0))
+        self.assertIs(compiled, models.RefractiveIndexfromRelPerm().compiled_connection(0))
+
+    def test_evaluate_batch(self):
+        """
+        Tests that batch evaluation agrees with scalar evaluation, both for an equation-based
+        model and for a model with a custom plug_in method, and that units are coerced per column.
+        Returns:
+            None
+        """
+        model = models.OpticalReflectance()
+        n = [1.2, 1.5, 2.0]
+        k = [0.0, 0.1, 0.3]
+        out = model.evaluate_batch({'n': n, 'k': np.array(k)})
+        self.assertTrue(out['successful'])
+        self.assertEqual(out['R'].magnitude.shape, (3,))
+        for i in range(3):
+            expected = model.evaluate({'n': n[i], 'k': k[i]})['R']
+            self.assertTrue(math.isclose(out['R'].magnitude[i], expected.magnitude))
+
+        model = models.IsMetallic()
+        band_gaps = ureg.Quantity(np.array([0.0, 1e-19, 0.5]), 'joule')
+        out = model.evaluate_batch({'E_g': band_gaps})
+        self.assertTrue(out['successful'])
+        self.assertEqual(list(out['is_metallic'].magnitude), [1, 0, 0])
+
+        out = model.evaluate_batch({'E_g': [0.0, 1.0], 'unused': [0.0]})
+        self.assertFalse(out['successful'])
+
+        # rows rejected by constraint masks are not plugged in
+        model = models.WiedemannFranzLaw()
+        # per-symbol constraints are applied by check_constraints too
+        self.assertFalse(model.check_constraints({'is_metallic': Symbol('is_metallic', 0, [])}))
+        self.assertTrue(model.check_constraints({'is_metallic': Symbol('is_metallic', 1, [])}))
+
+        out = model.evaluate_batch({'T': [300, 300], 'o': [1e6, 1e6], 'is_metallic': [1, 0]})
+        self.assertTrue(out['successful'])
+        k = out['k'].magnitude
+        self.assertTrue(math.isclose(k[0], model.evaluate({'T': 300, 'o': 1e6, 'is_metallic': 1})['k'].magnitude))
+        self.assertTrue(math.isnan(k[1]))
+
+        # equations act element-wise on vector inputs, giving a vector output per row
+        vector_types = {name: SymbolType(name, [1.0, []], [name], [name], [3], '', validate=False)
+                        for name in ('A', 'B')}
+        model = AbstractModel(metadata={
+            'title': 'Double', 'tags': [], 'references': [], 'description': '',
+            'symbol_mapping': {'a': 'A', 'b': 'B'},
+            'connections': [{'inputs': ['a'], 'outputs': ['b']}],
+            'equations': ['b - 2*a']},
+            symbol_types=vector_types)
+        vectors = np.arange(6.0).reshape(2, 3)
+        out = model.evaluate_batch({'a': vectors})
+        self.assertTrue(out['successful'])
+        self.assertEqual(out['b'].magnitude.shape, (2, 3))
+        self.assertTrue(np.allclose(out['b'].magnitude, 2 * vectors))
@@ -0,0 +1,44 @@
+import unittest
+
+from propnet.core.symbols import Symbol
+from propnet.core.graph import Propnet
+from propnet.core.materials import Material
+from propnet.core.cache import EvaluationCache
+from propnet.core.profiling import EvaluationSummary
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def test_summary(self):
+        """
+        The summary counts combinations, evaluations, outputs, rounds and cache hits of each model.
+        """
+        p = Propnet()
+        mat = Material()
+        mat.add_property(Symbol('relative_permeability', 2, None))
+        mat.add_property(Symbol('relative_permittivity', 8, None))
+        p.add_material(mat)
+
+        summary = EvaluationSummary()
+        p.evaluate(material=mat, observer=summary)
+        refractive = summary.models['RefractiveIndexfromRelPerm']
+        self.assertEqual(refractive.combinations, 1)
+        self.assertEqual(refractive.evaluations, 1)
+        self.assertEqual(refractive.outputs, 1)
+        self.assertEqual(refractive.rejected, 0)
+        self.assertGreaterEqual(summary.rounds, 2)
+        self.assertGreater(summary.seconds, 0)
+        self.assertIn('RefractiveIndexfromRelPerm', str(summary))
+
+        model = [node.node_value for node in p.nodes_by_type('Model')
+                 if node.node_value.name == 'RefractiveIndexfromRelPerm'][0]
+        model.evaluation_cache = EvaluationCache()
+        summary = EvaluationSummary()
+        for _ in range(2):
+            model.evaluate({'Er': 2, 'Ur': 8}, observer=summary)
+        self.assertEqual(summary.models['RefractiveIndexfromRelPerm'].cache_hits, 1)
+        self.assertEqual(summary.as_dict()['models']['RefractiveIndexfromRelPerm']['evaluations'], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import unittest
+import tempfile
+
+from unittest import mock
+
+from propnet.core.registry import LazyRegistry, load_registry_cache
+
+
+class RegistryTest(unittest.TestCase):
+
+    def test_lazy_registry(self):
+        loaded = []
+
+        def loader(name):
+            loaded.append(name)
+            if name == 'bad':
+                raise ValueError('cannot load')
+            return name.upper()
+
+        registry = LazyRegistry(['a', 'b', 'bad'], loader)
+        self.assertEqual(len(registry), 3)
+        self.assertIn('a', registry)
+        self.assertEqual(loaded, [])
+
+        self.assertEqual(registry['a'], 'A')
+        self.assertEqual(registry['a'], 'A')
+        self.assertEqual(loaded, ['a'])
+
+        registry['c'] = 'custom'
+        self.assertEqual(registry['c'], 'custom')
+        self.assertEqual(sorted(registry.values()), ['A', 'B', 'custom'])
+        self.assertNotIn('bad', registry)
+        with self.assertRaises(KeyError):
+            registry['missing']
+
+    def test_registry_cache(self):
+        """
+        Files are only parsed again once their contents change.
+        """
+        parsed = []
+
+        def parse(path):
+            parsed.append(path)
+            with open(path) as f:
+                return f.read()
+
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict(os.environ, {'PROPNET_CACHE_DIR': os.path.join(directory, 'cache')}):
+                path = os.path.join(directory, 'x.yaml')
+                with open(path, 'w') as f:
+                    f.write('one')
+                self.assertEqual(load_registry_cache('test', [path], parse), {'x': 'one'})
+                self.assertEqual(load_registry_cache('test', [path], parse), {'x': 'one'})
+                self.assertEqual(len(parsed), 1)
+
+                with open(path, 'w') as f:
+                    f.write('two')
+                self.assertEqual(load_registry_cache('test', [path], parse), {'x': 'two'})
+                self.assertEqual(len(parsed), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+import unittest
+import tempfile
+
+import numpy as np
+
+from propnet import ureg
+from propnet.core.store import SymbolStore, JOINT
+from propnet.core.symbols import Symbol, SymbolType
+from propnet.core.graph import Propnet
+from propnet.core.materials import Material
+
+
+class StoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SymbolStore()
+        self.mat1 = self.store.add_material()
+        self.mat2 = self.store.add_material()
+
+    def test_add_and_get(self):
+        """
+        Scalar and tensor Quantities are stored in NumPy columns and come back as equal Symbols.
+        """
+        key = self.store.add(Symbol('refractive_index', 1.5, ['a']), self.mat1)
+        symbol = self.store.symbol(key)
+        self.assertEqual(symbol, Symbol('refractive_index', 1.5, []))
+        self.assertEqual(symbol.tags, ['a'])
+        self.assertTrue(self.store.column('refractive_index').is_numerical)
+
+        tensor = np.arange(9.0).reshape(3, 3)
+        key = self.store.add(Symbol('lattice_unit_cell', ureg.Quantity(tensor, 'angstrom'), None), self.mat2)
+        self.assertTrue(np.allclose(self.store.symbol(key).value.magnitude, tensor))
+        self.assertEqual(self.store.column('lattice_unit_cell').values.shape[1:], (3, 3))
+
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(self.store.keys(material=self.mat2), [key])
+
+    def test_object_column(self):
+        """
+        Values that are not numerical Quantities turn the column into a list, keeping earlier values.
+        """
+        A = SymbolType('A', [1.0, []], ['A'], ['A'], [1], '', validate=False)
+        first = self.store.add(Symbol(A, 2, []), self.mat1)
+        for i in range(10):
+            self.store.add(Symbol(A, i, []), self.mat1)
+        second = self.store.add(Symbol(A, 'text', []), self.mat1)
+        column = self.store.column('A')
+        self.assertFalse(column.is_numerical)
+        self.assertEqual(self.store.symbol(first).value, ureg.Quantity(2.0, column.symbol_type.units))
+        self.assertEqual(self.store.symbol(second).value, 'text')
+
+    def test_find_and_remove(self):
+        key = self.store.add(Symbol('refractive_index', 1.5, []), self.mat1)
+        joint = self.store.add(Symbol('refractive_index', 2, []), sources=(self.mat1, self.mat2))
+
+        self.assertEqual(self.store.find(Symbol('refractive_index', 1.5, []), self.mat1), key)
+        self.assertIsNone(self.store.find(Symbol('refractive_index', 1.5, []), self.mat2))
+        self.assertEqual(self.store.find(Symbol('refractive_index', 2, []), JOINT, (self.mat1, self.mat2)), joint)
+        self.assertEqual(self.store.sources(joint), (self.mat1, self.mat2))
+
+        # later additions and removals keep the index up to date
+        other = self.store.add(Symbol('refractive_index', 1.5 + 1e-12, []), self.mat2)
+        self.assertEqual(self.store.find(Symbol('refractive_index', 1.5, []), self.mat2), other)
+        self.store.remove(other)
+        self.assertIsNone(self.store.find(Symbol('refractive_index', 1.5, []), self.mat2))
+
+        self.store.remove_material(self.mat1)
+        self.assertNotIn(key, self.store)
+        self.assertIn(joint, self.store)
+        self.assertEqual(self.store.keys(), [joint])
+
+        # near-duplicates on either side of a rounding edge are found, values further apart are not
+        edge = self.store.add(Symbol('refractive_index', 1.234565, []), self.mat2)
+        self.assertEqual(self.store.find(Symbol('refractive_index', 1.2345650000001, []), self.mat2), edge)
+        self.assertEqual(self.store.find(Symbol('refractive_index', 1.2345649999999, []), self.mat2), edge)
+        self.assertIsNone(self.store.find(Symbol('refractive_index', 1.2345651, []), self.mat2))
+        tensor = np.array([[1.234565, 2.0], [3.0, 4.0]])
+        tensor_key = self.store.add(Symbol('lattice_unit_cell', ureg.Quantity(tensor, 'angstrom'), None), self.mat2)
+        near = tensor + np.array([[1e-13, 0], [0, 1e-15]])
+        self.assertEqual(self.store.find(Symbol('lattice_unit_cell', ureg.Quantity(near, 'angstrom'), None),
+                                         self.mat2), tensor_key)
+
+    def test_propnet_store(self):
+        """
+        Materials added to a Propnet share its store, and get their properties back when removed.
+        """
+        p = Propnet()
+        mat = Material()
+        mat.add_property(Symbol('relative_permeability', 2, None))
+        mat.add_property(Symbol('relative_permittivity', 8, None))
+        p.add_material(mat)
+        self.assertIs(mat._store, p._store)
+
+        p.evaluate(material=mat)
+        self.assertIn(Symbol('refractive_index', 4, None),
+                      [node.node_value for node in mat.available_property_nodes()])
+        self.assertIn(mat.root_node, p.graph)
+
+        p.remove_material(mat)
+        self.assertIsNot(mat._store, p._store)
+        self.assertEqual(len(p._store), 0)
+        self.assertIn('refractive_index', mat.available_properties())
+
+    def test_add_materials(self):
+        """
+        Bulk insertion copies every material's properties, including object values and values
+        converted to the SymbolType's units.
+        """
+        materials = []
+        for i in range(20):
+            mat = Material()
+            mat.add_property(Symbol('density', ureg.Quantity(1000.0 * (i + 1), 'kg/m^3'), None))
+            mat.add_property(Symbol('refractive_index', i, ['tag']))
+            materials.append(mat)
+        materials[3].add_property(Symbol('structure', 'not a structure', None))
+
+        p = Propnet()
+        p.add_materials(materials)
+        self.assertEqual(len(p._store), 41)
+        for i, mat in enumerate(materials):
+            self.assertIs(mat.parent, p)
+            symbols = [node.node_value for node in mat.available_property_nodes()]
+            self.assertIn(Symbol('density', ureg.Quantity(i + 1.0, 'g/cm^3'), None), symbols)
+            self.assertIn(Symbol('refractive_index', i, None), symbols)
+        self.assertIn('structure', materials[3].available_properties())
+        self.assertEqual(len(list(p.nodes_by_type('Material'))), 20)
+
+        # materials already on the Propnet are not added twice, materials on another Propnet are rejected
+        p.add_material(materials[0])
+        p.add_materials([materials[1], materials[1]])
+        self.assertEqual(len(p.materials), 20)
+        self.assertEqual(len(p._store), 41)
+        p.remove_material(materials[0])
+        self.assertEqual(len(p.materials), 19)
+        self.assertEqual(len(p._store), 39)
+        self.assertEqual(len(materials[0].available_properties()), 2)
+        with self.assertRaises(ValueError):
+            Propnet().add_material(materials[1])
+
+    def test_save_load(self):
+        """
+        A saved Propnet reloads with the same materials and Symbols, tensors memory-mapped.
+        """
+        p = Propnet()
+        mat = Material()
+        mat.add_property(Symbol('relative_permeability', 2, None))
+        mat.add_property(Symbol('relative_permittivity', 8, None))
+        mat.add_property(Symbol('elastic_tensor_voigt', ureg.Quantity(np.eye(6), 'GPa'), ['mp-1']))
+        # plain arrays and lists, as built by ext.matproj, are stored numerically as well
+        mat.add_property(Symbol('lattice_unit_cell', np.eye(3), None))
+        mat.add_property(Symbol('lattice_unit_cell', [[2.0, 0, 0], [0, 2.0, 0], [0, 0, 2.0]], None))
+        mat.add_property(Symbol('structure', 'not a structure', None))
+        p.add_material(mat)
+        p.evaluate(material=mat)
+        expected = [node.node_value for node in mat.available_property_nodes()]
+
+        with tempfile.TemporaryDirectory() as path:
+            p.save(path)
+            loaded = Propnet.load(path)
+
+            self.assertEqual(len(loaded.materials), 1)
+            loaded_mat = loaded.materials[0]
+            self.assertEqual(loaded_mat.uuid, mat.uuid)
+            self.assertIs(loaded_mat.parent, loaded)
+            symbols = [node.node_value for node in loaded_mat.available_property_nodes()]
+            self.assertEqual(len(symbols), len(expected))
+            for symbol in expected:
+                if symbol.type.name not in ('elastic_tensor_voigt', 'structure'):
+                    self.assertIn(symbol, symbols)
+            column = loaded._store.column('elastic_tensor_voigt')
+            self.assertIsInstance(column.values, np.memmap)
+            tensor = [s for s in symbols if s.type.name == 'elastic_tensor_voigt'][0]
+            self.assertTrue(np.allclose(tensor.value.magnitude, np.eye(6)))
+            self.assertEqual(tensor.tags, ['mp-1'])
+            self.assertIsInstance(loaded._store.column('lattice_unit_cell').values, np.memmap)
+            cells = [s.value.magnitude for s in symbols if s.type.name == 'lattice_unit_cell']
+            self.assertEqual(sorted(cell[0, 0] for cell in cells), [1.0, 2.0])
+            refractive_index = loaded_mat._keys('refractive_index')[0]
+            self.assertEqual(loaded._store.producer(refractive_index), 'RefractiveIndexfromRelPerm')
+
+            # loaded Propnets can be modified and evaluated further
+            loaded_mat.add_property(Symbol('relative_permeability', 0.5, None))
+            loaded.evaluate(material=loaded_mat, incremental=True)
+            self.assertIn(Symbol('refractive_index', 2, None),
+                          [node.node_value for node in loaded_mat.available_property_nodes()])
+            del column, tensor, cells, symbols, loaded, loaded_mat
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -46,4 +46,31 @@ class PropertiesTest(unittest.TestCase):
 
     def test_all_properties(self):
         self.assertEqual(str(DEFAULT_SYMBOL_TYPES['density'].units),
-                         '1.0 gram / centimeter ** 3')
\ No newline at end of file
+                         '1.0 gram / centimeter ** 3')
+
+    def test_symbol_fingerprint(self):
+        """
+        Values equal up to floating-point noise have equal fingerprints and hashes.
+        """
+        a = Symbol('refractive_index', 0.1 + 0.2, [])
+        b = Symbol('refractive_index', 0.3, [])
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertEqual(len({a, b, Symbol('refractive_index', 0.31, [])}), 2)
+        self.assertEqual(Symbol('refractive_index', 0.0, []), Symbol('refractive_index', -0.0, []))
+        self.assertEqual(magnitude_fingerprints([9.9999999, 10.0]), magnitude_fingerprints([10.0, 10.0]))
+
+        tensor = ureg.Quantity([[1.0, 2.0], [3.0, 4.0]], 'angstrom')
+        a = Symbol('lattice_unit_cell', tensor, [])
+        b = Symbol('lattice_unit_cell', tensor * (1 + 1e-12), [])
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertNotEqual(a, Symbol('lattice_unit_cell', tensor.T, []))
+
+        # values straddling a rounding edge are equal, although their fingerprints differ
+        self.assertEqual(Symbol('refractive_index', 1.234565, []), Symbol('refractive_index', 1.2345650000001, []))
+        self.assertEqual(Symbol('refractive_index', 1e-13, []), Symbol('refractive_index', 0.0, []))
+        self.assertNotEqual(Symbol('refractive_index', 1.2345, []), Symbol('refractive_index', 1.2346, []))
+        self.assertIn(magnitude_fingerprints([1.234565])[0], neighbour_fingerprints(1.2345650000001))
+        self.assertEqual(neighbour_fingerprints(1.2345650000001)[0], magnitude_fingerprints([1.2345650000001])[0])
+        self.assertEqual(len(neighbour_fingerprints(1.5)), 1)
@@ -0,0 +1,36 @@
+import unittest
+
+import numpy as np
+
+from propnet import ureg
+from propnet.core.units import conversion_factors, to_magnitude, to_quantity, convert
+
+
+class UnitsTest(unittest.TestCase):
+
+    def test_to_magnitude(self):
+        """
+        Cached conversions should agree with pint, including for units with an offset and arrays.
+        """
+        for value, units in [(ureg.Quantity(3.0, 'GPa'), 'Pa'),
+                             (ureg.Quantity(25.0, 'degC'), 'K'),
+                             (ureg.Quantity(1.0, 'eV'), 'J'),
+                             (ureg.Quantity(np.array([1.0, 2.0]), 'angstrom'), 'nm')]:
+            self.assertTrue(np.allclose(to_magnitude(value, units), value.to(units).magnitude))
+        self.assertEqual(to_magnitude(2.0, 'Pa'), 2.0)
+
+    def test_conversion_cached(self):
+        conversion_factors.cache_clear()
+        to_magnitude(ureg.Quantity(1.0, 'GPa'), 'Pa')
+        to_magnitude(ureg.Quantity(2.0, 'GPa'), 'Pa')
+        self.assertEqual(conversion_factors.cache_info().misses, 1)
+
+    def test_convert(self):
+        value = ureg.Quantity(1.0, 'Pa')
+        self.assertIs(convert(value, 'Pa'), value)
+        self.assertEqual(convert(ureg.Quantity(1.0, 'kPa'), 'Pa'), ureg.Quantity(1000.0, 'Pa'))
+        self.assertEqual(to_quantity(2.0, ureg.Quantity(1.0, 'Pa')), ureg.Quantity(2.0, 'Pa'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,425 @@
+"""
+Module containing an index of the static structure of a Propnet: which models connect which SymbolTypes.
+"""
+
+import heapq
+
+from types import MappingProxyType
+from collections import namedtuple, deque, OrderedDict
+
+import networkx as nx
+
+
+# One set of inputs -> outputs of a model, see AbstractModel.connections.
+#   route (int): index of the connection in the model's connections.
+#   input_symbols, output_symbols (tuple<str>): symbols used in the model's equations.
+#   input_types, output_types (tuple<SymbolType>): corresponding SymbolTypes, in the same order.
+Connection = namedtuple('Connection', ['route', 'input_symbols', 'output_symbols',
+                                       'input_types', 'output_types'])
+
+
+# One step of the evaluation schedule of a Propnet, see PropnetTopology.schedule.
+#   models (tuple<AbstractModel>): models evaluated together.
+#   cyclic (bool): whether the models depend on each other's outputs, and must be evaluated until they
+#                  derive nothing new.
+#   input_types (frozenset<str>): names of the SymbolTypes the models take as inputs, including as constraints.
+ScheduleStep = namedtuple('ScheduleStep', ['models', 'cyclic', 'input_types'])
+
+
+# One step of an evaluation plan, see PropnetTopology.evaluation_plan.
+#   calls (tuple<tuple<AbstractModel,tuple<int>>>): models evaluated together, with the routes (indices of the
+#                                                  connections) of each model that can fire.
+#   cyclic (bool): whether the models must be evaluated until they derive nothing new, see ScheduleStep.
+#   input_types (frozenset<str>): names of the SymbolTypes the connections take as inputs, including as constraints.
+PlanStep = namedtuple('PlanStep', ['calls', 'cyclic', 'input_types'])
+
+# maximum number of evaluation plans cached by a PropnetTopology
+_PLAN_CACHE_SIZE = 1024
+
+
+# What can be derived from a set of SymbolTypes, see PropnetTopology.derivable.
+#   symbol_types (frozenset<str>): names of the SymbolTypes that can be derived, other than the available ones.
+#   models (frozenset<str>): names of the models deriving them.
+Derivable = namedtuple('Derivable', ['symbol_types', 'models'])
+
+
+def _as_tuple(symbols):
+    """Connection inputs and outputs may be given as a single string or a list of strings."""
+    if isinstance(symbols, str):
+        return (symbols,)
+    return tuple(symbols)
+
+
+def _schedule(models, connection_inputs, consumers):
+    """
+    Orders models so that each model comes after the models it depends on, i.e. the models producing its inputs.
+
+    Models that depend on each other, through a cycle of SymbolTypes, form a strongly connected component of the
+    dependency graph and are grouped into a single cyclic step. The steps are in topological order of the
+    components, ties broken by model name so that the schedule does not depend on the order of the models.
+    A model is never applied to its own outputs, so a model alone is not cyclic even if its outputs are among
+    its inputs.
+
+    Args:
+        models (list<AbstractModel>): models to schedule.
+        connection_inputs (dict<str,tuple>): see PropnetTopology.connection_inputs.
+        consumers (dict<str,tuple<AbstractModel>>): see PropnetTopology.consumers.
+    Returns:
+        (tuple<ScheduleStep>)
+    """
+    dependencies = nx.DiGraph()
+    dependencies.add_nodes_from(model.name for model in models)
+    for model in models:
+        for connection in model.connections:
+            for symbol in _as_tuple(connection['outputs']):
+                for consumer in consumers.get(model.symbol_mapping[symbol], ()):
+                    if consumer.name != model.name:
+                        dependencies.add_edge(model.name, consumer.name)
+
+    by_name = {model.name: model for model in models}
+    condensed = nx.condensation(dependencies)
+    components = {node: sorted(condensed.nodes[node]['members']) for node in condensed.nodes}
+    schedule = []
+    for node in nx.lexicographical_topological_sort(condensed, key=lambda node: components[node][0]):
+        names = components[node]
+        input_types = frozenset(symbol_type.name for name in names
+                                for _, types in connection_inputs[name] for symbol_type in types)
+        schedule.append(ScheduleStep(models=tuple(by_name[name] for name in names),
+                                     cyclic=len(names) > 1, input_types=input_types))
+    return tuple(schedule)
+
+
+class PropnetTopology:
+    """
+    Immutable index of the Models and SymbolTypes of a Propnet and the connections between them.
+
+    The index only depends on the Models and SymbolTypes, not on Materials or Symbols, so queries against
+    it do not get slower as more Materials are added to the Propnet. It is built once when a Propnet is
+    created and rebuilt only when Models or SymbolTypes are added.
+
+    Attributes:
+        models (MappingProxy<str,AbstractModel>): model name -> model instance.
+        symbol_types (MappingProxy<str,SymbolType>): SymbolType name -> SymbolType.
+        connections (MappingProxy<str,tuple<Connection>>): model name -> the model's connections.
+        constraint_symbols (MappingProxy<str,tuple<str>>): model name -> symbols used by the model's constraints.
+        constraint_types (MappingProxy<str,tuple<SymbolType>>): model name -> SymbolTypes of those symbols.
+        connection_inputs (MappingProxy<str,tuple<tuple<tuple<str>,tuple<SymbolType>>>>):
+            model name -> for each connection, all symbols (inputs followed by any constraint symbols) needed
+            to evaluate it, and their SymbolTypes.
+        consumers (MappingProxy<str,tuple<AbstractModel>>): SymbolType name -> models taking it as an input,
+                                                           including as a constraint.
+        producers (MappingProxy<str,tuple<AbstractModel>>): SymbolType name -> models giving it as an output.
+        schedule (tuple<ScheduleStep>): order in which to evaluate the models, see _schedule.
+    """
+
+    __slots__ = ['models', 'symbol_types', 'connections', 'constraint_symbols', 'constraint_types',
+                 'connection_inputs', 'consumers', 'producers', 'schedule', '_plans',
+                 '_bits', '_connection_masks', '_closures']
+
+    def __init__(self, models, symbol_types):
+        """
+        Args:
+            models (list<AbstractModel>): instantiated models.
+            symbol_types (dict<str,SymbolType>): SymbolTypes referenced by the models, keyed by name.
+        """
+
+        def get_type(model, symbol):
+            """Converts a symbol used in a model's equations to its SymbolType."""
+            symbol_type = symbol_types.get(model.symbol_mapping.get(symbol))
+            if not symbol_type:
+                raise ValueError('Model {} references symbol {} whose SymbolType does not appear in the '
+                                 'graph.'.format(model.name, symbol))
+            return symbol_type
+
+        connections = {}
+        constraint_symbols = {}
+        constraint_types = {}
+        connection_inputs = {}
+        consumers = {symbol_type.name: [] for symbol_type in symbol_types.values()}
+        producers = {symbol_type.name: [] for symbol_type in symbol_types.values()}
+
+        for model in models:
+            model_connections = []
+            for route, connection in enumerate(model.connections):
+                input_symbols = _as_tuple(connection['inputs'])
+                output_symbols = _as_tuple(connection['outputs'])
+                model_connections.append(Connection(
+                    route=route,
+                    input_symbols=input_symbols,
+                    output_symbols=output_symbols,
+                    input_types=tuple(get_type(model, symbol) for symbol in input_symbols),
+                    output_types=tuple(get_type(model, symbol) for symbol in output_symbols)))
+            connections[model.name] = tuple(model_connections)
+
+            constraint_symbols[model.name] = tuple(model.constraint_symbols)
+            constraint_types[model.name] = tuple(get_type(model, symbol) for symbol in model.constraint_symbols)
+
+            model_inputs = []
+            for connection in model_connections:
+                symbols = list(connection.input_symbols)
+                types = list(connection.input_types)
+                for symbol, symbol_type in zip(constraint_symbols[model.name], constraint_types[model.name]):
+                    if symbol not in symbols:
+                        symbols.append(symbol)
+                        types.append(symbol_type)
+                model_inputs.append((tuple(symbols), tuple(types)))
+            connection_inputs[model.name] = tuple(model_inputs)
+
+            for connection in model_connections:
+                for symbol_type in connection.input_types:
+                    if model not in consumers[symbol_type.name]:
+                        consumers[symbol_type.name].append(model)
+                for symbol_type in connection.output_types:
+                    if model not in producers[symbol_type.name]:
+                        producers[symbol_type.name].append(model)
+            for symbol_type in constraint_types[model.name]:
+                if model not in consumers[symbol_type.name]:
+                    consumers[symbol_type.name].append(model)
+
+        self.models = MappingProxyType({model.name: model for model in models})
+        self.symbol_types = MappingProxyType({symbol_type.name: symbol_type
+                                              for symbol_type in symbol_types.values()})
+        self.connections = MappingProxyType(connections)
+        self.constraint_symbols = MappingProxyType(constraint_symbols)
+        self.constraint_types = MappingProxyType(constraint_types)
+        self.connection_inputs = MappingProxyType(connection_inputs)
+        self.consumers = MappingProxyType({k: tuple(v) for k, v in consumers.items()})
+        self.producers = MappingProxyType({k: tuple(v) for k, v in producers.items()})
+        self.schedule = _schedule(models, self.connection_inputs, self.consumers)
+        self._plans = OrderedDict()
+        self._bits = None
+        self._connection_masks = None
+        self._closures = OrderedDict()
+
+    def evaluation_plan(self, available):
+        """
+        Finds the model connections that can fire when evaluating Symbols of a set of SymbolTypes, in the order of
+        the schedule: connections whose inputs are all available, or derivable by connections of other models.
+        Evaluating only these connections gives the same result as walking the whole schedule.
+
+        Materials usually come with one of a few sets of SymbolTypes, so plans are cached by set of SymbolTypes.
+
+        Args:
+            available (iterable<str>): names of the available SymbolTypes.
+        Returns:
+            (tuple<PlanStep>)
+        """
+        available = frozenset(available)
+        plan = self._plans.get(available)
+        if plan is not None:
+            self._plans.move_to_end(available)
+            return plan
+
+        # SymbolType name -> names of the models deriving it, a model is never applied to its own outputs
+        derivable = {type_name: set() for type_name in available}
+
+        def usable(model, type_name):
+            return type_name in available or bool(derivable.get(type_name, set()) - {model.name})
+
+        plan = []
+        for step in self.schedule:
+            if step.input_types.isdisjoint(derivable):
+                continue
+            fired = {}
+            changed = True
+            while changed:
+                changed = False
+                for model in step.models:
+                    for route, (_, types) in enumerate(self.connection_inputs[model.name]):
+                        if route in fired.get(model.name, ()) or \
+                                not all(usable(model, symbol_type.name) for symbol_type in types):
+                            continue
+                        fired.setdefault(model.name, set()).add(route)
+                        for symbol_type in self.connections[model.name][route].output_types:
+                            producers = derivable.setdefault(symbol_type.name, set())
+                            if symbol_type.name not in available and model.name not in producers:
+                                producers.add(model.name)
+                                changed = step.cyclic
+            if fired:
+                calls = tuple((model, tuple(sorted(fired[model.name])))
+                              for model in step.models if model.name in fired)
+                input_types = frozenset(symbol_type.name for model, routes in calls for route in routes
+                                        for symbol_type in self.connection_inputs[model.name][route][1])
+                plan.append(PlanStep(calls=calls, cyclic=step.cyclic, input_types=input_types))
+
+        plan = tuple(plan)
+        self._plans[available] = plan
+        if len(self._plans) > _PLAN_CACHE_SIZE:
+            self._plans.popitem(last=False)
+        return plan
+
+    def plan(self, available, target):
+        """
+        Finds the cheapest way of deriving a SymbolType from a set of available SymbolTypes, searching backwards
+        from the target to the available inputs. The cost of deriving a SymbolType is the number of model
+        connections evaluated, including those deriving their inputs, and is found with Knuth's generalization
+        of Dijkstra's algorithm to connections with several inputs.
+
+        Args:
+            available (iterable<str>): names of the available SymbolTypes.
+            target (str): name of the SymbolType to derive.
+        Returns:
+            (list<tuple<AbstractModel,int>>): model and route (index of the connection) of each connection to
+                                             evaluate, inputs before the connections using them. Empty if the
+                                             target is available, None if it cannot be derived.
+        """
+        available = set(available)
+        if target in available:
+            return []
+
+        # connections still missing inputs: (model name, route) -> [number of missing inputs, cost of inputs]
+        pending = {}
+        waiting = {}
+        for name, routes in self.connection_inputs.items():
+            for route, (_, types) in enumerate(routes):
+                names = {symbol_type.name for symbol_type in types}
+                pending[(name, route)] = [len(names), 0]
+                for type_name in names:
+                    waiting.setdefault(type_name, []).append((name, route))
+
+        costs = {}
+        best = {}
+        queue = [(0, type_name) for type_name in sorted(available)]
+        heapq.heapify(queue)
+        while queue:
+            cost, type_name = heapq.heappop(queue)
+            if type_name in costs:
+                continue
+            costs[type_name] = cost
+            if type_name == target:
+                break
+            for name, route in waiting.get(type_name, ()):
+                state = pending[(name, route)]
+                state[0] -= 1
+                state[1] += cost
+                if state[0]:
+                    continue
+                output_cost = state[1] + 1
+                for symbol_type in self.connections[name][route].output_types:
+                    if symbol_type.name not in costs and \
+                            output_cost < best.get(symbol_type.name, (output_cost + 1,))[0]:
+                        best[symbol_type.name] = (output_cost, name, route)
+                        heapq.heappush(queue, (output_cost, symbol_type.name))
+
+        if target not in costs:
+            return None
+
+        plan = []
+        planned = set()
+
+        def add(type_name):
+            if type_name in available:
+                return
+            _, name, route = best[type_name]
+            if (name, route) in planned:
+                return
+            planned.add((name, route))
+            for symbol_type in self.connection_inputs[name][route][1]:
+                add(symbol_type.name)
+            plan.append((self.models[name], route))
+
+        add(target)
+        return plan
+
+    def _encode(self, type_names):
+        """
+        Encodes a set of SymbolTypes as a bitset, an integer with one bit per SymbolType of the topology.
+        Also encodes the inputs and outputs of every connection, the first time it is called.
+        """
+        if self._bits is None:
+            self._bits = {name: 1 << i for i, name in enumerate(sorted(self.symbol_types))}
+            self._connection_masks = tuple(
+                (name, self._mask(symbol_type.name for symbol_type in types),
+                 self._mask(symbol_type.name for symbol_type in self.connections[name][route].output_types))
+                for name in sorted(self.connection_inputs)
+                for route, (_, types) in enumerate(self.connection_inputs[name]))
+        return self._mask(type_names)
+
+    def _mask(self, type_names):
+        mask = 0
+        for type_name in type_names:
+            mask |= self._bits[type_name]
+        return mask
+
+    def derivable(self, available):
+        """
+        Finds everything that can be derived from a set of available SymbolTypes, and the models involved: the
+        closure of the available SymbolTypes over model connections, a connection being evaluable once all its
+        inputs, including constraints, are available or derivable by other models. Whether values meet the
+        constraints is not known in advance, so the closure is an upper bound on what evaluate derives.
+
+        Sets of SymbolTypes are encoded as bitsets and closures are cached, repeated queries take microseconds.
+
+        Args:
+            available (iterable<str>): names of the available SymbolTypes.
+        Returns:
+            (Derivable)
+        """
+        available = self._encode(available)
+        derivable = self._closures.get(available)
+        if derivable is not None:
+            self._closures.move_to_end(available)
+            return derivable
+
+        # model name -> bitset of the SymbolTypes derived by the model, a model is never applied to its own outputs
+        derived = {}
+        changed = True
+        while changed:
+            changed = False
+            for name, inputs, outputs in self._connection_masks:
+                usable = available
+                for other, mask in derived.items():
+                    if other != name:
+                        usable |= mask
+                if inputs & ~usable or not outputs & ~(available | derived.get(name, 0)):
+                    continue
+                derived[name] = derived.get(name, 0) | outputs
+                changed = True
+
+        mask = 0
+        for outputs in derived.values():
+            mask |= outputs
+        mask &= ~available
+        derivable = Derivable(symbol_types=frozenset(type_name for type_name, bit in self._bits.items()
+                                                     if mask & bit),
+                              models=frozenset(derived))
+        self._closures[available] = derivable
+        if len(self._closures) > _PLAN_CACHE_SIZE:
+            self._closures.popitem(last=False)
+        return derivable
+
+    def shortest_path(self, source, target):
+        """
+        Finds a shortest path from one SymbolType to another through the models connecting them, regardless of
+        any other inputs the models need.
+
+        Args:
+            source (str): name of the SymbolType to start from.
+            target (str): name of the SymbolType to reach.
+        Returns:
+            (list<str>): names of the SymbolTypes and models on the path, alternating and starting with source,
+                         None if there is no path.
+        """
+        # SymbolType name -> (model name, SymbolType name) it was reached from
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            type_name = queue.popleft()
+            if type_name == target:
+                path = [type_name]
+                while previous[type_name] is not None:
+                    model_name, type_name = previous[type_name]
+                    path.extend((model_name, type_name))
+                return path[::-1]
+            for model in self.consumers.get(type_name, ()):
+                for connection in self.connections[model.name]:
+                    if type_name not in {symbol_type.name for symbol_type in connection.input_types}:
+                        continue
+                    for symbol_type in connection.output_types:
+                        if symbol_type.name not in previous:
+                            previous[symbol_type.name] = (model.name, type_name)
+                            queue.append(symbol_type.name)
+        return None
+
+    def __repr__(self):
+        return "PropnetTopology<{} models, {} symbol types>".format(len(self.models), len(self.symbol_types))
@@ -0,0 +1,142 @@
+"""
+Module containing cached unit conversions.
+
+Converting a pint Quantity with Quantity.to() looks up and combines unit definitions on every call. Here the
+conversion between two units is worked out once, as a factor and an offset, after which converting a value
+only multiplies plain floats or NumPy arrays.
+"""
+
+from functools import lru_cache
+
+from pint.util import UnitsContainer
+
+from propnet import ureg
+
+# canonical instance of each distinct UnitsContainer, see intern_units
+_interned_units = {}
+
+
+@lru_cache(maxsize=None)
+def _parse_units(units):
+    """Parses a unit string, e.g. 'W/m/K'."""
+    return ureg.parse_units(units)._units
+
+
+def _units_container(units):
+    """
+    Returns the pint UnitsContainer of units given as a string, pint Unit, pint Quantity or UnitsContainer.
+    SymbolType units are Quantities, only their units are used, not their magnitude.
+    """
+    if isinstance(units, UnitsContainer):
+        return units
+    if isinstance(units, str):
+        return _parse_units(units)
+    return units._units
+
+
+def intern_units(units):
+    """
+    Returns a shared UnitsContainer equal to the given units, so that interned units can be compared by identity.
+
+    Args:
+        units (str, pint.Unit, pint.Quantity or pint.UnitsContainer): units to intern.
+    Returns:
+        (pint.UnitsContainer)
+    """
+    units = _units_container(units)
+    return _interned_units.setdefault(units, units)
+
+
+@lru_cache(maxsize=None)
+def dimensionality(units):
+    """
+    Returns:
+        (pint.UnitsContainer): dimensionality of the given pint UnitsContainer.
+    """
+    return ureg.get_dimensionality(units)
+
+
+@lru_cache(maxsize=None)
+def conversion_factors(from_units, to_units):
+    """
+    Computes the factor and offset converting magnitudes between two units, such that
+    magnitude_to = magnitude_from * factor + offset. The offset is only non-zero for units with a shifted origin,
+    e.g. degrees Celsius to kelvin.
+
+    Args:
+        from_units (pint.UnitsContainer): units to convert from.
+        to_units (pint.UnitsContainer): units to convert to.
+    Returns:
+        (float, float): factor and offset.
+    """
+    offset = ureg.Quantity(0.0, from_units).to(to_units).magnitude
+    factor = ureg.Quantity(1.0, from_units).to(to_units).magnitude - offset
+    return factor, offset
+
+
+def to_magnitude(value, units):
+    """
+    Converts a value to the given units and strips the units, equivalent to value.to(units).magnitude.
+    Values that are not Quantities are returned unchanged.
+
+    Args:
+        value (id): pint Quantity wrapping a float or NumPy array, or any other value.
+        units (str, pint.Unit or pint.Quantity): units to convert to.
+    Returns:
+        (id): magnitude of the value in the given units.
+    """
+    if not isinstance(value, ureg.Quantity):
+        return value
+    return convert_magnitude(value.magnitude, value._units, units)
+
+
+def convert_magnitude(magnitude, from_units, to_units):
+    """
+    Converts a magnitude, a float or NumPy array, between two units.
+
+    Args:
+        magnitude (id): float or NumPy array.
+        from_units (str, pint.Unit, pint.Quantity or pint.UnitsContainer): units of the magnitude.
+        to_units (str, pint.Unit, pint.Quantity or pint.UnitsContainer): units to convert to.
+    Returns:
+        (id): magnitude in the units converted to.
+    """
+    from_units = _units_container(from_units)
+    to_units = _units_container(to_units)
+    if from_units is to_units or from_units == to_units:
+        return magnitude
+    factor, offset = conversion_factors(from_units, to_units)
+    magnitude = magnitude * factor
+    if offset:
+        magnitude = magnitude + offset
+    return magnitude
+
+
+def to_quantity(magnitude, units):
+    """
+    Attaches units to a magnitude, equivalent to ureg.Quantity(magnitude, units).
+
+    Args:
+        magnitude (id): float or NumPy array.
+        units (str, pint.Unit or pint.Quantity): units of the magnitude.
+    Returns:
+        (pint.Quantity)
+    """
+    return ureg.Quantity(magnitude, _units_container(units))
+
+
+def convert(value, units):
+    """
+    Converts a Quantity to the given units, equivalent to value.to(units). Quantities already in the given units
+    are returned as they are.
+
+    Args:
+        value (pint.Quantity): value to convert.
+        units (str, pint.Unit or pint.Quantity): units to convert to.
+    Returns:
+        (pint.Quantity)
+    """
+    to_units = _units_container(units)
+    if value._units == to_units:
+        return value
+    return ureg.Quantity(to_magnitude(value, units), to_units)
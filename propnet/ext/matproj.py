@@ -1,7 +1,13 @@
+import os
+import pickle
+import time
+
 from datetime import datetime
+from hashlib import sha256
+from concurrent.futures import ThreadPoolExecutor
 
-from pymatgen import MPRester
 from pymatgen.core.structure import IStructure
+from propnet import logger
 from propnet.core.symbols import Symbol
 from propnet.core.materials import Material
 from propnet.symbols import DEFAULT_SYMBOL_TYPES
@@ -31,59 +37,181 @@ AVAILABLE_MP_PROPERTIES = list(PROPNET_FROM_MP_NAME_MAPPING.keys()) + ['task_id'
 PROPNET_PROPERTIES_ON_MP = list(MP_FROM_PROPNET_NAME_MAPPING.keys())
 
 
-def import_materials(mp_ids, api_key=None):
+def _get_rester(rester, api_key):
+    """
+    Returns the given rester, or an MPRester using the given api key.
+    """
+    if rester is not None:
+        return rester
+    from pymatgen import MPRester
+    return MPRester(api_key)
+
+
+def _cache_path(cache_dir, mp_id, properties):
+    """
+    Path of the cached response for a material id and list of queried properties.
+    """
+    properties_key = sha256(','.join(sorted(properties)).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, properties_key, '{}.pickle'.format(mp_id))
+
+
+def _load_cached(cache_dir, mp_id, properties):
+    """
+    Returns the cached response for a material id, None if there is none.
+    """
+    try:
+        with open(_cache_path(cache_dir, mp_id, properties), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def _save_cached(cache_dir, data, properties):
+    """
+    Stores the response for one material id in the cache.
+    """
+    path = _cache_path(cache_dir, data['task_id'], properties)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '{}.{}'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.debug('Could not write to the Materials Project cache {}, {}.'.format(path, e))
+
+
+def _query(rester, criteria, properties, max_retries, backoff):
+    """
+    Sends a query, retrying failed queries with exponential backoff.
+
+    Args:
+        rester (MPRester): rester used to send the query.
+        criteria (dict): query criteria.
+        properties (list<str>): properties to retrieve.
+        max_retries (int): number of times a failed query is retried.
+        backoff (float): seconds to wait before the first retry, doubled for each further retry.
+    Returns:
+        (list<dict>): query results.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return rester.query(criteria=criteria, properties=properties)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            wait = backoff * 2 ** attempt
+            logger.warning('Materials Project query failed ({}), retrying in {} s.'.format(e, wait))
+            time.sleep(wait)
+
+
+def material_from_data(data):
+    """
+    Creates a Material from the Materials Project data of one material.
+
+    Args:
+        data (dict): query result for one material, with keys from AVAILABLE_MP_PROPERTIES.
+    Returns:
+        (Material): material object with associated data.
+    """
+    mat = Material()
+    tag_string = data['task_id']
+    mat.add_property(Symbol('structure', data['structure'], [tag_string]))
+    mat.add_property(Symbol('lattice_unit_cell', data['structure'].lattice.matrix, [tag_string]))
+    for key in data:
+        if not data[key] is None and key in PROPNET_FROM_MP_NAME_MAPPING.keys():
+            prop_type = DEFAULT_SYMBOL_TYPES[PROPNET_FROM_MP_NAME_MAPPING[key]]
+            p = Symbol(prop_type, data[key], [tag_string])
+            mat.add_property(p)
+    return mat
+
+
+def import_materials(mp_ids, api_key=None, rester=None, chunk_size=500, max_workers=4,
+                     max_retries=3, backoff=1.0, cache_dir=None):
     """
     Given a list of material ids, returns a list of Material objects with all
     available properties from the Materials Project.
+
+    Ids are queried in chunks of chunk_size ids, with up to max_workers chunks queried
+    concurrently. Failed queries are retried with exponential backoff. If a cache_dir is
+    given, responses are stored there and ids found in the cache are not queried again.
+
     Args:
         mp_ids (list<str>): list of material ids whose information will be retrieved.
         api_key (str): api key to be used to conduct the query.
+        rester (MPRester): optional rester to query, anything with an MPRester-like
+                           query(criteria, properties) method (default: MPRester(api_key)).
+        chunk_size (int): number of ids per query.
+        max_workers (int): maximum number of concurrent queries.
+        max_retries (int): number of times a failed query is retried.
+        backoff (float): seconds to wait before the first retry, doubled for each further retry.
+        cache_dir (str): optional directory of the on-disk response cache.
     Returns:
-        (list<Material>): list of material objects with associated data.
-    """
-    mpr = MPRester(api_key)
-    to_return = []
-    query = mpr.query(criteria={"task_id": {'$in': mp_ids}}, properties=AVAILABLE_MP_PROPERTIES)
-    for data in query:
-        # properties of one mp-id
-        mat = Material()
-        tag_string = data['task_id']
-        mat.add_property(Symbol('structure', data['structure'], [tag_string]))
-        mat.add_property(Symbol('lattice_unit_cell', data['structure'].lattice.matrix, [tag_string]))
-        for key in data:
-            if not data[key] is None and key in PROPNET_FROM_MP_NAME_MAPPING.keys():
-                prop_type = DEFAULT_SYMBOL_TYPES[PROPNET_FROM_MP_NAME_MAPPING[key]]
-                p = Symbol(prop_type, data[key], [tag_string])
-                mat.add_property(p)
-        to_return.append(mat)
-    return to_return
-
-
-def import_material(mp_id, api_key=None):
+        (list<Material>): list of material objects with associated data, in the order of
+                          mp_ids, ids without data on the Materials Project are left out.
+    """
+    mp_ids = list(dict.fromkeys(mp_ids))
+    properties = AVAILABLE_MP_PROPERTIES
+
+    results = {}
+    if cache_dir:
+        for mp_id in mp_ids:
+            data = _load_cached(cache_dir, mp_id, properties)
+            if data is not None:
+                results[mp_id] = data
+
+    missing = [mp_id for mp_id in mp_ids if mp_id not in results]
+    if missing:
+        rester = _get_rester(rester, api_key)
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+
+        def query_chunk(chunk):
+            return _query(rester, {"task_id": {'$in': chunk}}, properties, max_retries, backoff)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+            for chunk_results in executor.map(query_chunk, chunks):
+                for data in chunk_results:
+                    results[data['task_id']] = data
+                    if cache_dir:
+                        _save_cached(cache_dir, data, properties)
+
+    return [material_from_data(results[mp_id]) for mp_id in mp_ids if mp_id in results]
+
+
+def import_material(mp_id, api_key=None, rester=None, cache_dir=None):
     """
     Given a material id, returns a Material object with all available properties from
     the Materials Project
     Args:
         mp_id (str): material id whose information will be retrieved.
         api_key (str): api key to be used to conduct the query.
+        rester (MPRester): optional rester to query, see import_materials.
+        cache_dir (str): optional directory of the on-disk response cache.
     Returns:
         (Material): material object with associated data.
     """
-    return import_materials([mp_id], api_key)[0]
+    return import_materials([mp_id], api_key, rester=rester, cache_dir=cache_dir)[0]
 
 
-def materials_from_formula(formula, api_key=None):
+def materials_from_formula(formula, api_key=None, rester=None, max_retries=3, backoff=1.0, cache_dir=None):
     """
     Given a material chemical formula, returns all Material objects with a matching formula
     with all their available properties from the Materials Project.
+    All properties are retrieved with a single query.
     Args:
         formula (str): material's formula
         api_key (str): api key to be used to conduct the query.
+        rester (MPRester): optional rester to query, see import_materials.
+        max_retries (int): number of times a failed query is retried.
+        backoff (float): seconds to wait before the first retry, doubled for each further retry.
+        cache_dir (str): optional directory of the on-disk response cache, responses are
+                         stored there for later calls of import_materials.
     Returns:
         (list<Material>): all materials with matching formula
     """
-    mpr = MPRester(api_key)
-    query_results = mpr.query(criteria={'pretty_formula': formula},
-                              properties=['task_id'])
-    mpids = [entry['task_id'] for entry in query_results]
-    return import_materials(mpids, api_key)
+    rester = _get_rester(rester, api_key)
+    query_results = _query(rester, {'pretty_formula': formula}, AVAILABLE_MP_PROPERTIES, max_retries, backoff)
+    if cache_dir:
+        for data in query_results:
+            _save_cached(cache_dir, data, AVAILABLE_MP_PROPERTIES)
+    return [material_from_data(data) for data in query_results]
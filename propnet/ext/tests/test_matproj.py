@@ -11,4 +11,56 @@ class MatProjTest(unittest.TestCase):
         mp_id = 'mp-1153'
         mat = import_material(mp_id)
         self.assertTrue('structure' in mat.available_properties())
-        self.assertTrue('lattice_unit_cell' in mat.available_properties())
\ No newline at end of file
+        self.assertTrue('lattice_unit_cell' in mat.available_properties())
+
+class LocalRester:
+    """
+    Stand-in for MPRester answering queries from local data, failing the first query if asked to.
+    """
+    def __init__(self, fail_first=False):
+        from pymatgen.core.structure import Structure
+        from pymatgen.core.lattice import Lattice
+        structure = Structure(Lattice.cubic(3.0), ['Si'], [[0, 0, 0]])
+        self.data = {'mp-{}'.format(i): {'task_id': 'mp-{}'.format(i), 'structure': structure,
+                                         'density': 2.0 + i, 'e_above_hull': None}
+                     for i in range(10)}
+        self.fail_first = fail_first
+        self.queries = []
+
+    def query(self, criteria, properties):
+        self.queries.append(criteria)
+        if self.fail_first:
+            self.fail_first = False
+            raise IOError('connection reset')
+        if 'pretty_formula' in criteria:
+            return list(self.data.values())
+        return [self.data[mp_id] for mp_id in criteria['task_id']['$in'] if mp_id in self.data]
+
+
+class MatProjLocalTest(unittest.TestCase):
+
+    def test_import_materials_chunked(self):
+        rester = LocalRester(fail_first=True)
+        mp_ids = ['mp-3', 'mp-1', 'mp-missing', 'mp-2', 'mp-1']
+        materials = import_materials(mp_ids, rester=rester, chunk_size=2, max_workers=2, backoff=0)
+        # one chunk was retried
+        self.assertEqual(len(rester.queries), 3)
+        self.assertEqual([mat.available_properties().count('density') for mat in materials], [1, 1, 1])
+        densities = [node.node_value.value.magnitude for mat in materials
+                     for node in mat.available_property_nodes() if node.node_value.type.name == 'density']
+        self.assertEqual(densities, [5.0, 3.0, 4.0])
+
+    def test_cache(self):
+        import tempfile
+        rester = LocalRester()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            import_materials(['mp-1', 'mp-2'], rester=rester, cache_dir=cache_dir)
+            materials = import_materials(['mp-1', 'mp-2', 'mp-3'], rester=rester, cache_dir=cache_dir)
+        self.assertEqual(len(materials), 3)
+        self.assertEqual(rester.queries[-1], {'task_id': {'$in': ['mp-3']}})
+
+    def test_materials_from_formula(self):
+        rester = LocalRester()
+        materials = materials_from_formula('Si', rester=rester)
+        self.assertEqual(len(materials), 10)
+        self.assertEqual(len(rester.queries), 1)
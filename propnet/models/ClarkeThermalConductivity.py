@@ -1,10 +1,10 @@
 from propnet.core.models import AbstractModel
-from pymatgen.analysis.elasticity.elastic import ElasticTensor
 
 
 class ClarkeThermalConductivity(AbstractModel):
 
    def _evaluate(self, symbol_values):
+       from pymatgen.analysis.elasticity.elastic import ElasticTensor
 
        tensor = ElasticTensor.from_voigt(symbol_values["C_ij"])
        structure = symbol_values["_structure"]
@@ -1,10 +1,9 @@
 from propnet.core.models import AbstractModel
 
-from pymatgen.analysis.elasticity import ElasticTensor
-
 class DebyeTemperature(AbstractModel):
 
     def _evaluate(self, symbol_values):
+        from pymatgen.analysis.elasticity import ElasticTensor
 
         structure = symbol_values['structure']
         cij = symbol_values['C_ij']
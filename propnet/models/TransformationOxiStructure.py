@@ -1,10 +1,9 @@
 from propnet.core.models import AbstractModel
 
-from pymatgen.transformations.standard_transformations import AutoOxiStateDecorationTransformation
-
 class TransformationOxiStructure(AbstractModel):
 
     def _evaluate(self, symbol_values):
+        from pymatgen.transformations.standard_transformations import AutoOxiStateDecorationTransformation
 
         s = symbol_values['s']
 
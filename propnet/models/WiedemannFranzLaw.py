@@ -7,5 +7,10 @@ class WiedemannFranzLaw(AbstractModel):
     def constraint_symbols(self):
         return ['is_metallic']
 
-    def check_constraints(self, constraint_inputs):
-        return constraint_inputs['is_metallic'].value.magnitude != 0
+    @property
+    def constraints(self):
+        return {'is_metallic': lambda is_metallic: is_metallic.value.magnitude != 0}
+
+    @property
+    def constraint_masks(self):
+        return {'is_metallic': lambda is_metallic: is_metallic != 0}
@@ -1,17 +1,41 @@
+import sys
+
 from os.path import dirname, basename, isfile
 from glob import glob
+from types import ModuleType
+
+from propnet.core.registry import LazyRegistry
 
 _DEFAULT_MODEL_FILES = glob(dirname(__file__) + "/*.py")
 
 DEFAULT_MODEL_NAMES = [basename(f)[:-3] for f in _DEFAULT_MODEL_FILES
                        if isfile(f) and not basename(f).startswith('_')]
 
-# auto loading of defined models
-# it's a bit hack-y due to wanting to store each class in a separate file
-# but also have them available in the propnet.models namespace
-DEFAULT_MODELS = {}
-for model in DEFAULT_MODEL_NAMES:
-    model_cls = getattr(__import__('propnet.models.{}'.format(model),
-                                   fromlist=['model']), model)
-    locals()[model] = model_cls
-    DEFAULT_MODELS[model] = model_cls
\ No newline at end of file
+
+def _load_model(name):
+    """
+    Imports the module of the given model, returning its model class.
+    """
+    model_cls = getattr(__import__('propnet.models.{}'.format(name), fromlist=['model']), name)
+    # importing the module binds it to this namespace, bind the class instead
+    setattr(sys.modules[__name__], name, model_cls)
+    return model_cls
+
+
+# lazy loading of defined models
+# each class is stored in a separate file but also available in the propnet.models namespace,
+# the module of a model is only imported on first access
+DEFAULT_MODELS = LazyRegistry(DEFAULT_MODEL_NAMES, _load_model)
+
+
+class _ModelsModule(ModuleType):
+    """
+    Imports models on first attribute access, e.g. propnet.models.IsMetallic.
+    """
+    def __getattr__(self, name):
+        if name in DEFAULT_MODELS:
+            return DEFAULT_MODELS[name]
+        raise AttributeError("module {} has no attribute {}".format(__name__, name))
+
+
+sys.modules[__name__].__class__ = _ModelsModule
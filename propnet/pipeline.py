@@ -0,0 +1,138 @@
+"""
+Module containing a streaming pipeline deriving the properties of materials one at a time.
+"""
+
+import json
+
+import numpy as np
+
+from monty.json import MontyEncoder
+
+from propnet import ureg
+from propnet.core.graph import Propnet
+from propnet.core.materials import Material
+from propnet.core.symbols import Symbol
+
+
+def material_from_dict(properties, symbol_types=None):
+    """
+    Creates a Material from a dictionary of properties.
+
+    Materials Project documents (with 'task_id' and 'structure' keys, as returned by MPRester.query)
+    are converted as in propnet.ext.matproj. Any other dictionary maps SymbolType names to values or
+    Symbols, keys that are not SymbolType names are ignored.
+
+    Args:
+        properties (dict<str,id>): properties of one material.
+        symbol_types (dict<str,SymbolType>): SymbolTypes the keys refer to (default: DEFAULT_SYMBOL_TYPES).
+    Returns:
+        (Material)
+    """
+    if 'task_id' in properties and 'structure' in properties:
+        from propnet.ext.matproj import material_from_data
+        return material_from_data(properties)
+
+    if symbol_types is None:
+        from propnet.symbols import DEFAULT_SYMBOL_TYPES
+        symbol_types = DEFAULT_SYMBOL_TYPES
+
+    material = Material()
+    for name, value in properties.items():
+        if isinstance(value, Symbol):
+            material.add_property(value)
+        elif value is not None and name in symbol_types:
+            material.add_property(Symbol(symbol_types[name], value, None))
+    return material
+
+
+def stream(source, models=None, symbol_types=None, sink=None, max_combinations=None):
+    """
+    Derives all properties of a stream of materials, yielding each material once it has been evaluated.
+
+    Materials are evaluated one at a time on a single Propnet and removed from it before the next one is
+    added, so memory use does not grow with the number of materials. Only Symbols derived from a single
+    material are produced, as with Propnet.evaluate(material=...).
+
+    Args:
+        source (iterable<Material or dict>): Materials, or dictionaries of properties converted with
+                                             material_from_dict, e.g. Materials Project documents.
+        models (dict<str,class>): optional models to evaluate (default: DEFAULT_MODELS).
+        symbol_types (dict<str,SymbolType>): optional SymbolTypes (default: DEFAULT_SYMBOL_TYPES).
+        sink (function): optional function called with each derived Material as soon as it has been
+                         evaluated, e.g. a JsonLinesSink.
+        max_combinations (int): optional limit on the number of input combinations tried for each model,
+                                see Propnet.evaluate.
+    Yields:
+        (Material): each material with its derived properties, no longer bound to a Propnet.
+    """
+    propnet = Propnet(models=models, symbol_types=symbol_types)
+    for item in source:
+        material = item if isinstance(item, Material) else material_from_dict(item, propnet._symbol_types)
+        propnet.add_material(material)
+        try:
+            propnet.evaluate(material=material, max_combinations=max_combinations)
+        finally:
+            propnet.remove_material(material)
+        if sink is not None:
+            sink(material)
+        yield material
+
+
+def _to_json_value(value):
+    """
+    Converts a Symbol value to a JSON-serializable value and units string.
+    """
+    units = None
+    if isinstance(value, ureg.Quantity):
+        units = str(value.units)
+        value = value.magnitude
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    elif isinstance(value, np.generic):
+        value = value.item()
+    return value, units
+
+
+class JsonLinesSink:
+    """
+    Writes materials to a file as JSON lines, one line per material, for use as the sink of stream().
+
+    Each line holds the material's uuid and its properties, with name, value, units, tags and whether
+    the property was derived. Objects such as structures are serialized with their as_dict() method.
+    Set derived_only to only write derived properties.
+    """
+
+    def __init__(self, file, derived_only=False):
+        """
+        Args:
+            file (str or file): path of the file to write to, or an open text file.
+            derived_only (bool): only write derived properties.
+        """
+        self._owns_file = isinstance(file, str)
+        self._file = open(file, 'w') if self._owns_file else file
+        self.derived_only = derived_only
+
+    def __call__(self, material):
+        store = material._store
+        properties = []
+        for key in material._keys():
+            derived = bool(store.derivation(key))
+            if self.derived_only and not derived:
+                continue
+            symbol = store.symbol(key)
+            value, units = _to_json_value(symbol.value)
+            properties.append({'name': symbol.type.name, 'value': value, 'units': units,
+                               'tags': symbol.tags, 'derived': derived})
+        self._file.write(json.dumps({'material': str(material.uuid), 'properties': properties},
+                                    cls=MontyEncoder))
+        self._file.write('\n')
+
+    def close(self):
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -2,28 +2,37 @@ import os
 
 from glob import glob
 from monty.serialization import loadfn
-from propnet import logger
 
+from propnet.core.registry import LazyRegistry, load_registry_cache
 from propnet.core.symbols import SymbolType
 
-# Auto loading of all allowed properties
-
-# stores all loaded properties as PropertyMetadata instances in a dictionary,
-# mapped to their names
-DEFAULT_SYMBOL_TYPES = {}
+# Lazy loading of all allowed properties
 
+# stores all loaded properties as SymbolType instances in a dictionary,
+# mapped to their names, each SymbolType is only created on first access
 _DEFAULT_SYMBOL_TYPE_FILES = glob(os.path.join(os.path.dirname(__file__),
                                            '../symbols/**/*.yaml'),
                                   recursive=True)
 
-for f in _DEFAULT_SYMBOL_TYPE_FILES:
-    try:
-        symbol_type = SymbolType.from_dict(loadfn(f))
-        DEFAULT_SYMBOL_TYPES[symbol_type.name] = symbol_type
-        if "{}.yaml".format(symbol_type.name) not in f:
-            raise ValueError('Name/filename mismatch in {}'.format(f))
-    except Exception as e:
-        logger.error('Failed to parse {}, {}.'.format(os.path.basename(f), e))
+_symbol_type_data = None
+
+
+def _load_symbol_type(name):
+    """
+    Creates the SymbolType of the given name from its .yaml file, all .yaml files are parsed once
+    and kept in the registry cache.
+    """
+    global _symbol_type_data
+    if _symbol_type_data is None:
+        _symbol_type_data = load_registry_cache('symbol_types', _DEFAULT_SYMBOL_TYPE_FILES, loadfn)
+    symbol_type = SymbolType.from_dict(_symbol_type_data[name])
+    if symbol_type.name != name:
+        raise ValueError('Name/filename mismatch in {}.yaml'.format(name))
+    return symbol_type
+
+
+DEFAULT_SYMBOL_TYPES = LazyRegistry(
+    (os.path.splitext(os.path.basename(f))[0] for f in _DEFAULT_SYMBOL_TYPE_FILES), _load_symbol_type)
 
 # Stores all loaded properties' names in a tuple in the global scope.
-DEFAULT_SYMBOL_TYPE_NAMES = tuple(DEFAULT_SYMBOL_TYPES.keys())
\ No newline at end of file
+DEFAULT_SYMBOL_TYPE_NAMES = tuple(DEFAULT_SYMBOL_TYPES.keys())
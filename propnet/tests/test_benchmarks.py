@@ -0,0 +1,35 @@
+import json
+import unittest
+
+import numpy as np
+
+from propnet.benchmarks import synthetic_material, run, compare
+from propnet.symbols import DEFAULT_SYMBOL_TYPES
+
+
+class BenchmarksTest(unittest.TestCase):
+
+    def test_synthetic_material(self):
+        """
+        Synthetic values take the shape of their SymbolType, objects are left out.
+        """
+        symbol_types = [DEFAULT_SYMBOL_TYPES[name] for name in ('density', 'elastic_tensor_voigt', 'structure')]
+        material = synthetic_material(symbol_types, np.random.RandomState(0), duplicates=2)
+        symbols = [node.node_value for node in material.available_property_nodes()]
+        self.assertEqual(len(symbols), 4)
+        self.assertEqual(set(material.available_properties()), {'density', 'elastic_tensor_voigt'})
+        tensors = [s for s in symbols if s.type.name == 'elastic_tensor_voigt']
+        self.assertEqual(tensors[0].value.magnitude.shape, (6, 6))
+
+    def test_run_and_compare(self):
+        results = json.loads(json.dumps(run(['construction'], quick=True)))
+        self.assertIn('construction', results['results'])
+        self.assertEqual(compare(results, results), [])
+
+        slower = json.loads(json.dumps(results))
+        slower['results']['construction']['median'] *= 2
+        self.assertEqual(compare(results, slower)[0][0], 'construction')
+
+
+if __name__ == "__main__":
+    unittest.main()
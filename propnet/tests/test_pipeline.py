@@ -0,0 +1,43 @@
+import io
+import json
+import unittest
+
+from propnet.core.symbols import Symbol
+from propnet.core.materials import Material
+from propnet.pipeline import stream, material_from_dict, JsonLinesSink
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_stream(self):
+        """
+        Materials given as dictionaries or Materials are evaluated one at a time and written to the sink.
+        """
+        material = Material()
+        material.add_property(Symbol('relative_permeability', 1, None))
+        material.add_property(Symbol('relative_permittivity', 9, None))
+        source = iter([{'relative_permeability': 2, 'relative_permittivity': 8, 'not_a_symbol': 1}, material])
+
+        out = io.StringIO()
+        with JsonLinesSink(out, derived_only=True) as sink:
+            results = list(stream(source, sink=sink))
+
+        self.assertIs(results[1], material)
+        for result, expected in zip(results, [4, 3]):
+            self.assertIsNone(result.parent)
+            self.assertIn(Symbol('refractive_index', expected, None),
+                          [node.node_value for node in result.available_property_nodes()])
+
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['material'], str(results[0].uuid))
+        self.assertTrue(all(p['derived'] for p in lines[0]['properties']))
+        self.assertIn(4.0, [p['value'] for p in lines[0]['properties'] if p['name'] == 'refractive_index'])
+
+    def test_material_from_dict(self):
+        material = material_from_dict({'density': 2.5, 'band_gap': None})
+        self.assertEqual(material.available_properties(), ['density'])
+
+
+if __name__ == "__main__":
+    unittest.main()
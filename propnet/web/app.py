@@ -18,14 +18,7 @@ from force_graph import ForceGraphComponent
 from propnet.web.utils import graph_conversion, parse_path
 from propnet.core.graph import Propnet
 
-from propnet.ext.matproj import PROPNET_PROPERTIES_ON_MP, MP_FROM_PROPNET_NAME_MAPPING
-
-from pymatgen import MPRester
-
-import numpy as np
-from scipy.stats import describe
-
-from flask_caching import Cache
+from propnet.web.distributions import load_distributions
 
 app = dash.Dash()
 server = app.server
@@ -34,14 +27,10 @@ app.scripts.config.serve_locally = True
 app.title = "The Hitchhikers Guide to Materials Science"
 route = dcc.Location(id='url', refresh=False)
 
-cache = Cache(app.server, config={
-    'CACHE_TYPE': 'filesystem', 'CACHE_DIR': '.tmp'
-})
+# histograms of property values, precomputed by propnet.web.distributions
+distributions = load_distributions()
 
-mpr = MPRester()
-
-g = Propnet().graph
-graph_data = graph_conversion(g)
+graph_data = graph_conversion(Propnet().topology)
 graph_component = html.Div(id='graph', children=[
     ForceGraphComponent(
         id='propnet-graph',
@@ -165,7 +154,6 @@ app.scripts.append_script({
 
 
 
-#from enum import Enum
 #@app.callback(
 #    Output('material-content', 'children'),
 #    [Input('submit-formula', 'n_clicks')],
@@ -177,31 +165,15 @@ app.scripts.append_script({
 #    material = materials_from_mp_ids([mpid])[0]
 #
 #    p = Propnet()
-#    g = p.graph
 #
 #    available_properties = material.available_properties()
 #
-#    derivable_properties = []
-#    models_to_evaluate = []
-#
-#    # TODO: remove demo code
-#    # this shouldn't be here
-#    # it is also dumb dumb code
-#    # and worse! it's wrong too, doesn't take into account routes
-#    for node in p.graph:
-#        if not isinstance(node, Enum):
-#            in_edges = [e1 for e1, e2 in p.graph.in_edges(node)]
-#            in_edge_names = [in_edge.name for in_edge in in_edges]
-#            if all([prop_name in available_properties for prop_name in in_edge_names]):
-#                for e1, e2 in p.graph.out_edges(node):
-#                    if isinstance(e2, Enum):
-#                        if e2.name not in available_properties:
-#                            models_to_evaluate.append(node.__name__)
-#                            models_to_evaluate.append(e2.name)
-#                            derivable_properties.append(e2.name)
+#    derivable = p.derivable(available_properties)
+#    derivable_properties = sorted(derivable.symbol_types)
+#    models_to_evaluate = sorted(derivable.models | derivable.symbol_types)
 #
 #
-#    material_graph_data = graph_conversion(g, highlight=True,
+#    material_graph_data = graph_conversion(p.topology, highlight=True,
 #                                           highlight_green=available_properties,
 #                                           highlight_yellow=models_to_evaluate)
 #    material_graph_component = ForceGraphComponent(id='propnet-graph',
@@ -263,9 +235,9 @@ def display_page(pathname):
         elif path_info['mode'] == 'property':
             if path_info['value']:
                 property_name = path_info['value']
-                return property_layout(property_name)
+                return property_pages[property_name]
             else:
-                return properties_index()
+                return property_pages[None]
         elif path_info['mode'] == 'load_material':
             return material_layout
         else:
@@ -274,5 +246,26 @@ def display_page(pathname):
         return index
 
 
+
+# layouts of property pages and of the properties index, with their distributions
+property_pages = {}
+
+
+def warm_layouts():
+    """Builds the layouts of every model and property page, so that no
+    request has to build one. Model layouts are cached by model_layout,
+    property layouts in property_pages. As they only depend on models,
+    SymbolTypes and distributions loaded at startup, they never expire.
+    """
+    for model_name in DEFAULT_MODEL_NAMES:
+        model_layout(model_name)
+    for property_name in DEFAULT_SYMBOL_TYPE_NAMES:
+        property_pages[property_name] = property_layout(property_name, distributions.get(property_name))
+    property_pages[None] = properties_index(distributions)
+
+
+warm_layouts()
+
+
 if __name__ == '__main__':
     app.run_server(debug=False)
@@ -0,0 +1,238 @@
+"""
+Module containing an offline job aggregating the distributions of property values over a dataset, for display on
+the property pages of the web app.
+
+The dataset is streamed through twice, in chunks, so memory use does not depend on its size: a first pass
+computes the count, range and moments of each SymbolType's values, a second pass bins them into histograms over
+that range. Run it with
+
+    python -m propnet.web.distributions dataset.jsonl --output distributions.json
+
+and point the web app at the output with the PROPNET_DISTRIBUTIONS environment variable.
+"""
+
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+
+from propnet import ureg
+from propnet.core.units import to_magnitude
+
+# file loaded by the web app, unless set by the PROPNET_DISTRIBUTIONS environment variable
+DEFAULT_DISTRIBUTIONS_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'distributions.json')
+
+
+class _Moments:
+    """
+    Running count, minimum, maximum and central moments of a stream of values, updated a chunk at a time with
+    the pairwise formulas of Pebay (2008).
+    """
+
+    __slots__ = ['n', 'min', 'max', 'mean', 'm2', 'm3', 'm4']
+
+    def __init__(self):
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.mean = self.m2 = self.m3 = self.m4 = 0.0
+
+    def update(self, values):
+        """
+        Args:
+            values (np.ndarray): chunk of values.
+        """
+        nb = len(values)
+        if not nb:
+            return
+        mean_b = float(values.mean())
+        deviations = values - mean_b
+        m2_b = float(np.sum(deviations ** 2))
+        m3_b = float(np.sum(deviations ** 3))
+        m4_b = float(np.sum(deviations ** 4))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        na = self.n
+        n = na + nb
+        delta = mean_b - self.mean
+        self.mean += delta * nb / n
+        m2, m3 = self.m2, self.m3
+        self.m4 += (m4_b + delta ** 4 * na * nb * (na * na - na * nb + nb * nb) / n ** 3
+                    + 6 * delta ** 2 * (na * na * m2_b + nb * nb * m2) / n ** 2
+                    + 4 * delta * (na * m3_b - nb * m3) / n)
+        self.m3 += m3_b + delta ** 3 * na * nb * (na - nb) / n ** 2 + 3 * delta * (na * m2_b - nb * m2) / n
+        self.m2 += m2_b + delta ** 2 * na * nb / n
+        self.n = n
+
+    def describe(self):
+        """
+        Returns:
+            (dict<str,float>): same statistics as scipy.stats.describe, with its default (biased) skewness and
+                               (Fisher) kurtosis.
+        """
+        n = self.n
+        variance = self.m2 / (n - 1) if n > 1 else math.nan
+        skewness = math.sqrt(n) * self.m3 / self.m2 ** 1.5 if self.m2 else math.nan
+        kurtosis = n * self.m4 / self.m2 ** 2 - 3 if self.m2 else math.nan
+        return {'nobs': n, 'min': self.min, 'max': self.max, 'mean': self.mean, 'variance': variance,
+                'skewness': skewness, 'kurtosis': kurtosis}
+
+
+def record_values(record, symbol_types):
+    """
+    Extracts the scalar values of a record, in the units of their SymbolTypes.
+
+    Records are either lines written by propnet.pipeline.JsonLinesSink, with a 'properties' list, or
+    dictionaries of properties as accepted by propnet.pipeline.material_from_dict, e.g. Materials Project
+    documents.
+
+    Args:
+        record (dict<str,id>): one material.
+        symbol_types (dict<str,SymbolType>): SymbolTypes whose values are extracted.
+    Yields:
+        (str, float): SymbolType name and value.
+    """
+    if isinstance(record.get('properties'), list):
+        items = []
+        for prop in record['properties']:
+            value = prop.get('value')
+            if prop.get('units') is not None and value is not None:
+                value = ureg.Quantity(value, prop['units'])
+            items.append((prop.get('name'), value))
+    else:
+        from propnet.pipeline import material_from_dict
+        material = material_from_dict(record, symbol_types)
+        items = [(node.node_value.type.name, node.node_value.value)
+                 for node in material.available_property_nodes()]
+
+    for name, value in items:
+        symbol_type = symbol_types.get(name)
+        if symbol_type is None or symbol_type.category == 'object' or value is None:
+            continue
+        try:
+            value = to_magnitude(value, symbol_type.units)
+            if np.ndim(value) != 0:
+                continue
+            value = float(value)
+        except (TypeError, ValueError, AttributeError):
+            continue
+        if math.isfinite(value):
+            yield name, value
+
+
+def _chunks(source, symbol_types, chunk_size):
+    """
+    Streams through records, yielding at most chunk_size buffered values per SymbolType at a time.
+    """
+    buffers = {}
+    for record in source():
+        for name, value in record_values(record, symbol_types):
+            buffer = buffers.setdefault(name, [])
+            buffer.append(value)
+            if len(buffer) >= chunk_size:
+                yield name, np.array(buffer)
+                buffer.clear()
+    for name, buffer in buffers.items():
+        if buffer:
+            yield name, np.array(buffer)
+
+
+def compute_distributions(source, symbol_types=None, bins=50, chunk_size=10000):
+    """
+    Computes the histogram and summary statistics of the values of each SymbolType in a dataset.
+
+    Args:
+        source (function): function returning an iterable of records, see record_values. It is called twice,
+                           each iterable should stream through the whole dataset, e.g. lines of a file.
+        symbol_types (dict<str,SymbolType>): SymbolTypes to aggregate (default: DEFAULT_SYMBOL_TYPES).
+        bins (int): number of bins of each histogram, spanning the range of its values.
+        chunk_size (int): number of values of a SymbolType held in memory at a time.
+    Returns:
+        (dict<str,dict>): SymbolType name -> 'edges' and 'counts' of its histogram, and 'describe', see
+                          _Moments.describe.
+    """
+    if symbol_types is None:
+        from propnet.symbols import DEFAULT_SYMBOL_TYPES
+        symbol_types = DEFAULT_SYMBOL_TYPES
+
+    moments = {}
+    for name, values in _chunks(source, symbol_types, chunk_size):
+        moments.setdefault(name, _Moments()).update(values)
+
+    edges = {}
+    counts = {}
+    for name, m in moments.items():
+        low, high = (m.min, m.max) if m.max > m.min else (m.min - 0.5, m.min + 0.5)
+        edges[name] = np.linspace(low, high, bins + 1)
+        counts[name] = np.zeros(bins, dtype=np.int64)
+    for name, values in _chunks(source, symbol_types, chunk_size):
+        counts[name] += np.histogram(values, bins=edges[name])[0]
+
+    return {name: {'edges': edges[name].tolist(), 'counts': counts[name].tolist(),
+                   'describe': moments[name].describe()}
+            for name in sorted(moments)}
+
+
+def json_lines(*paths):
+    """
+    Returns:
+        (function): source for compute_distributions, streaming through records in JSON lines files.
+    """
+    def source():
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+    return source
+
+
+def save_distributions(distributions, path):
+    """
+    Writes distributions computed by compute_distributions to a JSON file.
+    """
+    with open(path, 'w') as f:
+        # NaN statistics, e.g. the variance of a single value, are written as null
+        json.dump({name: dict(d, describe={k: (None if isinstance(v, float) and math.isnan(v) else v)
+                                           for k, v in d['describe'].items()})
+                   for name, d in distributions.items()}, f, separators=(',', ':'))
+
+
+def load_distributions(path=None):
+    """
+    Loads distributions for the property pages of the web app.
+
+    Args:
+        path (str): file written by save_distributions (default: the PROPNET_DISTRIBUTIONS environment variable,
+                    or DEFAULT_DISTRIBUTIONS_PATH).
+    Returns:
+        (dict<str,list>): SymbolType name -> [histogram, statistics], the mp_values argument of property_layout:
+                          the histogram is a list of bin centers and a list of counts. Empty if there is no file.
+    """
+    path = path or os.environ.get('PROPNET_DISTRIBUTIONS', DEFAULT_DISTRIBUTIONS_PATH)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        distributions = json.load(f)
+    values = {}
+    for name, d in distributions.items():
+        edges = d['edges']
+        centers = [(low + high) / 2 for low, high in zip(edges[:-1], edges[1:])]
+        values[name] = [[centers, d['counts']], d['describe']]
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Aggregates distributions of property values over datasets.')
+    parser.add_argument('paths', nargs='+', help='JSON lines files, one material per line')
+    parser.add_argument('--output', default=DEFAULT_DISTRIBUTIONS_PATH, help='file to write')
+    parser.add_argument('--bins', type=int, default=50, help='number of bins of each histogram')
+    args = parser.parse_args(argv)
+    save_distributions(compute_distributions(json_lines(*args.paths), bins=args.bins), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 import dash_html_components as html
 import dash_core_components as dcc
 
+from functools import lru_cache
+
 import propnet.models as models
 
 from propnet.symbols import DEFAULT_SYMBOL_TYPES
@@ -24,11 +26,13 @@ def model_image_component(model):
     return html.Img(src=url, style={'width': 150, 'border-radius': '50%'})
 
 
+@lru_cache(maxsize=None)
 def model_layout(model_name):
-    """Create a Dash layout for a provided model.
+    """Create a Dash layout for a provided model. Layouts only depend on
+    the model's metadata, so each is built once and cached.
 
     Args:
-      model: an instance of an AbstractModel subclass
+      model_name: name of an AbstractModel subclass
 
     Returns:
       Dash layout
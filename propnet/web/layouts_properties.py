@@ -12,6 +12,8 @@ def property_layout(property_name, mp_values=None):
 
     Args:
       property_name:
+      mp_values: optional histogram and statistics of values, see
+        propnet.web.distributions.load_distributions
 
     Returns:
 
@@ -0,0 +1,27 @@
+import importlib.util
+import json
+import unittest
+
+from propnet.core.graph import Propnet
+
+
+@unittest.skipIf(importlib.util.find_spec('dash') is None, 'dash is not installed')
+class AppTest(unittest.TestCase):
+
+    def test_warm_layouts(self):
+        """
+        The app imports and builds its layouts at startup without Flask-Caching, and the graph of the
+        topology converts for display.
+        """
+        from propnet.web.app import warm_layouts, property_pages
+        from propnet.web.utils import graph_conversion
+
+        warm_layouts()
+        self.assertIn(None, property_pages)
+        topology = Propnet().topology
+        graph = json.loads(graph_conversion(topology))
+        self.assertEqual(len(graph['nodes']), len(topology.symbol_types) + len(topology.models))
+
+
+if __name__ == '__main__':
+    unittest.main()
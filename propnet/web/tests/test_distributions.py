@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from scipy.stats import describe
+
+from propnet.web.distributions import compute_distributions, save_distributions, load_distributions, \
+    json_lines
+
+
+class DistributionsTest(unittest.TestCase):
+
+    def test_distributions(self):
+        """
+        Statistics computed in chunks match scipy.stats.describe, histograms count every value.
+        """
+        rng = np.random.RandomState(0)
+        band_gaps = rng.gamma(2, size=1000)
+        densities = rng.normal(5, 1, size=1000)
+
+        records = []
+        for band_gap, density in zip(band_gaps, densities):
+            # properties written by JsonLinesSink, in units other than those of the SymbolType
+            records.append({'material': '', 'properties': [
+                {'name': 'band_gap_pbe', 'value': band_gap, 'units': 'electron_volt'},
+                {'name': 'density', 'value': density * 1000, 'units': 'kilogram / meter ** 3'},
+                {'name': 'structure', 'value': {}, 'units': None}]})
+        # dictionaries of properties
+        records.append({'band_gap_pbe': 1.0, 'not_a_symbol': 2.0})
+        band_gaps = np.append(band_gaps, 1.0)
+
+        with tempfile.TemporaryDirectory() as path:
+            dataset = os.path.join(path, 'dataset.jsonl')
+            with open(dataset, 'w') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+
+            distributions = compute_distributions(json_lines(dataset), bins=10, chunk_size=64)
+            self.assertEqual(set(distributions), {'band_gap_pbe', 'density'})
+            for name, values in (('band_gap_pbe', band_gaps), ('density', densities)):
+                expected = describe(values)
+                stats = distributions[name]['describe']
+                self.assertEqual(stats['nobs'], expected.nobs)
+                self.assertAlmostEqual(stats['min'], expected.minmax[0])
+                self.assertAlmostEqual(stats['max'], expected.minmax[1])
+                for key in ('mean', 'variance', 'skewness', 'kurtosis'):
+                    self.assertAlmostEqual(stats[key], getattr(expected, key))
+                self.assertEqual(distributions[name]['counts'],
+                                 np.histogram(values, bins=10)[0].tolist())
+
+            output = os.path.join(path, 'distributions.json')
+            save_distributions(distributions, output)
+            loaded = load_distributions(output)
+            centers, counts = loaded['density'][0]
+            self.assertEqual(len(centers), 10)
+            self.assertEqual(sum(counts), 1000)
+            self.assertEqual(load_distributions(os.path.join(path, 'missing.json')), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
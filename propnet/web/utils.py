@@ -16,16 +16,19 @@ from monty.serialization import loadfn
 
 AESTHETICS = loadfn(path.join(path.dirname(__file__), 'aesthetics.yaml'))
 
-def graph_conversion(graph, highlight=False,
+def graph_conversion(topology, highlight=False,
                      highlight_green=(),
                      highlight_yellow=(),
                      highlight_red=()):
-    """Utility function to
+    """Utility function to convert the Models and SymbolTypes of a
+    Propnet into JSON for the force graph component.
 
     Args:
-      graph: from Propnet.graph
-      selected_node:  (Default value = None)
-      highlighted_nodes:  (Default value = None)
+      topology: from Propnet.topology
+      highlight:  (Default value = False)
+      highlight_green:  (Default value = ())
+      highlight_yellow:  (Default value = ())
+      highlight_red:  (Default value = ())
 
     Returns:
 
@@ -36,38 +39,22 @@ def graph_conversion(graph, highlight=False,
 
     # TODO: this utility function is a prototype, to be replaced!
 
-    colors = {
-        'property': 'orange',
-        'model': 'blue',
-        'condition': '#00ff00',
-        'object': 'purple'
-    }
-
-    for n in graph.nodes():
-
-        # should do better parsing of nodes here
-        # TODO: this is also horrific code for demo, change
-        if n.node_type.name == 'SymbolType':
-            # property
-            id = n.node_value.name
-            label = n.node_value.display_names[0]
-            fill = AESTHETICS['color'][n.node_value.category]
-            shape = 'circle'
-            radius = 5.0
-        elif n.node_type.name == 'Model':
-            # model
-            id = n.node_value.__class__.__name__
-            label = n.node_value.title
-            fill = AESTHETICS['color']['model']
-            shape = 'square'
-            radius = 6.0
+    for symbol_type in topology.symbol_types.values():
+        nodes.append({
+            'id': symbol_type.name,
+            'label': symbol_type.display_names[0],
+            'fill': AESTHETICS['color'][symbol_type.category],
+            'shape': 'circle',
+            'radius': 5.0
+        })
 
+    for model in topology.models.values():
         nodes.append({
-            'id': id,
-            'label': label,
-            'fill': fill,
-            'shape': shape,
-            'radius': radius
+            'id': model.name,
+            'label': model.title,
+            'fill': AESTHETICS['color']['model'],
+            'shape': 'square',
+            'radius': 6.0
         })
 
     if highlight:
@@ -81,23 +68,20 @@ def graph_conversion(graph, highlight=False,
             else:
                 node['fill'] = '#BDBDBD'
 
-    for n1, n2 in graph.edges():
-
-        if n1.node_type.name == 'SymbolType':
-            id_n1 = n1.node_value.name
-        elif n1.node_type.name == 'Model':
-            id_n1 = n1.node_value.__class__.__name__
-
-        if n2.node_type.name == 'SymbolType':
-            id_n2 = n2.node_value.name
-        elif n2.node_type.name == 'Model':
-            id_n2 = n2.node_value.__class__.__name__
-
-        links.append({
-            'source': id_n1,
-            'target': id_n2,
-            'value': 1.0
-        })
+    for model_name, connections in topology.connections.items():
+        for connection in connections:
+            for symbol_type in connection.input_types:
+                links.append({
+                    'source': symbol_type.name,
+                    'target': model_name,
+                    'value': 1.0
+                })
+            for symbol_type in connection.output_types:
+                links.append({
+                    'source': model_name,
+                    'target': symbol_type.name,
+                    'value': 1.0
+                })
 
     graph_data = {
         'nodes': nodes,